@@ -0,0 +1,159 @@
+# app/cache.py
+import os, time, sqlite3, threading, unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))  # in-process LRU entries
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "")            # optional SQLite file shared across restarts/workers
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))  # 0 disables the answer cache
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))  # min cosine between questions
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+
+def normalize_question(q: str) -> str:
+    # "What is Karma?" and "what is karma" share a key. Only punctuation is dropped
+    # (by Unicode category), so Devanagari vowel signs survive.
+    q = unicodedata.normalize("NFKC", q).casefold()
+    q = "".join(" " if unicodedata.category(c).startswith("P") else c for c in q)
+    return " ".join(q.split())
+
+class EmbeddingCache:
+    """Normalized question -> embedding: bounded LRU in front of an optional SQLite table.
+
+    `key` maps the text to its cache key; ingest passes chunk-text hashes through unchanged.
+    """
+
+    def __init__(self, model: str, size: int = EMBED_CACHE_SIZE, path: str = EMBED_CACHE_PATH,
+                 key: Callable[[str], str] = normalize_question):
+        self.model = model
+        self.size = size
+        self.key = key
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (model TEXT, key TEXT, vec BLOB, PRIMARY KEY (model, key))")
+            self._db.commit()
+
+    def _remember(self, key: str, vec: List[float]):
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self.key(text)
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return vec
+            if self._db is not None:
+                row = self._db.execute("SELECT vec FROM embeddings WHERE model=? AND key=?", (self.model, key)).fetchone()
+                if row:
+                    vec = array("f", row[0]).tolist()
+                    self._remember(key, vec)
+                    self.disk_hits += 1
+                    return vec
+            self.misses += 1
+            return None
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        return [self.get(t) for t in texts]
+
+    def put(self, text: str, vec: List[float]):
+        self.put_many([text], [vec])
+
+    def put_many(self, texts: List[str], vecs: List[List[float]]):
+        # one transaction for the whole batch
+        keys = [self.key(t) for t in texts]
+        with self._lock:
+            for key, vec in zip(keys, vecs):
+                self._remember(key, vec)
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                                     [(self.model, k, array("f", v).tobytes()) for k, v in zip(keys, vecs)])
+                self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0, "entries": len(self._lru)}
+
+class AnswerCache:
+    """Semantic answer cache.
+
+    A hit needs a cached question whose embedding is within ANSWER_CACHE_THRESHOLD
+    cosine of the new one *and* the same retrieved source set. Embeddings live in a
+    preallocated (size, d) matrix, so a lookup is one small matmul. Entries expire
+    after `ttl` seconds, the least recently used one is evicted when full, and
+    everything is dropped when the store version changes.
+    """
+
+    def __init__(self, size: int = ANSWER_CACHE_SIZE, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: float = ANSWER_CACHE_TTL):
+        self.size, self.threshold, self.ttl = size, threshold, ttl
+        self._vecs = None                # (size, d) float32, allocated on first put
+        self._entries = [None] * size    # [source_key, answer, expires_at, last_used]
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def source_key(snippets) -> tuple:
+        return tuple(sorted(f'{s.get("source")}#{s.get("chunk")}' for s in snippets))
+
+    def _unit(self, vec):
+        import numpy as np
+        v = np.asarray(vec, dtype="float32")
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    def _sync(self, version):
+        if version != self._version:
+            self._entries = [None] * self.size
+            self._version = version
+
+    def get(self, vec, source_key: tuple, version=None) -> Optional[str]:
+        if not self.size:
+            return None
+        import numpy as np
+        with self._lock:
+            self._sync(version)
+            if self._vecs is not None:
+                now = time.time()
+                sims = self._vecs @ self._unit(vec)
+                cand = np.flatnonzero(sims >= self.threshold)
+                for i in cand[np.argsort(-sims[cand])]:
+                    e = self._entries[i]
+                    if e is None or e[2] < now:
+                        continue
+                    if e[0] == source_key:
+                        e[3] = now
+                        self.hits += 1
+                        return e[1]
+            self.misses += 1
+            return None
+
+    def put(self, vec, source_key: tuple, answer: str, version=None):
+        if not self.size:
+            return
+        import numpy as np
+        v = self._unit(vec)
+        with self._lock:
+            self._sync(version)
+            if self._vecs is None:
+                self._vecs = np.zeros((self.size, len(v)), dtype="float32")
+            now = time.time()
+            # free or expired slot first, else the least recently used one
+            slot = min(range(self.size), key=lambda i: -1 if self._entries[i] is None or self._entries[i][2] < now else self._entries[i][3])
+            self._vecs[slot] = v
+            self._entries[slot] = [source_key, answer, now + self.ttl, now]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "entries": sum(e is not None for e in self._entries)}
@@ -1,24 +1,112 @@
 # app/chunking.py
-from typing import List, Dict
-import tiktoken
+import re
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
 
-def token_chunks(text: str, max_tokens: int = 400, overlap: int = 40, model: str = "gpt-4o-mini") -> List[str]:
-    enc = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
-    ids = enc.encode(text)
-    chunks = []
+SEGMENT_CHARS = 1 << 16  # long texts are encoded in pieces of about this many chars, cut at line/space breaks
+
+# named boundary patterns for boundary-aware splitting (any regex also works)
+BOUNDARIES = {
+    "paragraph": r"\n\s*\n",
+    "verse": r"(?:॥|\|\|)\s*[0-9०-९]+(?:[.:][0-9०-९]+)*\s*(?:॥|\|\|)",
+}
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = "gpt-4o-mini"):
+    import tiktoken  # deferred: the API imports this module, but only needs an encoder per request
+    return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=None)
+def _token_lengths(model: str) -> np.ndarray:
+    # UTF-8 byte length of every token id, so offsets come from a cumsum instead of decode()
+    enc = get_encoder(model)
+    lens = np.zeros(enc.n_vocab, dtype=np.int64)
+    for t in range(enc.n_vocab):
+        try:
+            lens[t] = len(enc.decode_single_token_bytes(t))
+        except KeyError:
+            pass
+    return lens
+
+def _segments(text: str, size: int = SEGMENT_CHARS) -> Iterator[Tuple[int, str]]:
+    # cut after a newline, else before a space, so tokens rarely differ from encoding the whole text
+    start, n = 0, len(text)
+    while start < n:
+        end = min(start + size, n)
+        if end < n:
+            cut = text.rfind("\n", start, end) + 1
+            if cut <= start:
+                cut = text.rfind(" ", start, end)
+            if cut > start:
+                end = cut
+        yield start, text[start:end]
+        start = end
+
+def _segment_offsets(enc, lens: np.ndarray, seg: str, base: int) -> Tuple[np.ndarray, np.ndarray]:
+    # char start/end of every token in seg. A token can end inside a multi-byte character
+    # (common in Devanagari): ends snap forward and starts back, so no character is split.
+    ids = np.asarray(enc.encode_ordinary(seg), dtype=np.int64)
+    raw = np.frombuffer(seg.encode("utf-8"), dtype=np.uint8)
+    lead = (raw & 0xC0) != 0x80
+    chars_before = np.concatenate(([0], np.cumsum(lead)))  # byte offset -> chars begun before it
+    ends_b = np.cumsum(lens[ids])
+    starts_b = ends_b - lens[ids]
+    starts = chars_before[starts_b] - ~lead[starts_b]
+    return starts + base, chars_before[ends_b] + base
+
+def token_spans(text: str, max_tokens: int = 400, overlap: int = 40, model: str = "gpt-4o-mini",
+                boundary: Optional[str] = None) -> Iterator[Tuple[int, int]]:
+    """(start, end) char offsets of overlapping windows of max_tokens tokens.
+
+    The text is encoded segment by segment, so memory stays bounded for long documents.
+    With `boundary` (a BOUNDARIES name or a regex) a window is cut back to the last
+    boundary in its second half, so chunks end on a verse or paragraph where possible.
+    """
+    enc = get_encoder(model)
+    lens = _token_lengths(model)
+    pat = re.compile(BOUNDARIES.get(boundary, boundary)) if boundary else None
+    starts = ends = marks = np.zeros(0, dtype=np.int64)
     i = 0
-    while i < len(ids):
-        chunk_ids = ids[i:i+max_tokens]
-        chunks.append(enc.decode(chunk_ids))
-        i += max_tokens - overlap
-    return chunks
 
-def build_payloads(doc: Dict, max_tokens=400, model="gpt-4o-mini"):
+    def cut(i: int) -> int:
+        # exclusive end token of the window starting at i
+        j = min(i + max_tokens, len(starts))
+        if pat is None or not marks.size or j - i < max_tokens:
+            return j
+        lo, hi = ends[i + max_tokens // 2], ends[j - 1]
+        k = np.searchsorted(marks, hi, side="right") - 1
+        if k < 0 or marks[k] <= lo:
+            return j
+        return int(np.searchsorted(ends, marks[k], side="left")) + 1
+
+    def windows(final: bool):
+        nonlocal i
+        while i < len(starts) and (final or len(starts) - i > max_tokens):
+            j = cut(i)
+            yield int(starts[i]), int(ends[j - 1])
+            if j == len(starts):
+                i = j; break
+            i = j - overlap
+
+    for base, seg in _segments(text):
+        s, e = _segment_offsets(enc, lens, seg, base)
+        starts, ends, i = np.concatenate((starts[i:], s)), np.concatenate((ends[i:], e)), 0
+        if pat is not None:
+            found = np.fromiter((base + m.end() for m in pat.finditer(seg)), dtype=np.int64)
+            marks = np.concatenate((marks[marks > (starts[0] if len(starts) else base)], found))
+        yield from windows(final=False)
+    yield from windows(final=True)
+
+def token_chunks(text: str, max_tokens: int = 400, overlap: int = 40, model: str = "gpt-4o-mini",
+                 boundary: Optional[str] = None) -> List[str]:
+    return [text[s:e] for s, e in token_spans(text, max_tokens, overlap, model, boundary)]
+
+def build_payloads(doc: Dict, max_tokens=400, model="gpt-4o-mini", boundary=None):
     content = doc["content"]; meta = doc["meta"]
-    chunks = token_chunks(content, max_tokens=max_tokens, overlap=40, model=model)
-    for idx, ch in enumerate(chunks):
+    for idx, (start, end) in enumerate(token_spans(content, max_tokens=max_tokens, overlap=40, model=model, boundary=boundary)):
         yield {
             "id": f'{meta["identifier"]}:{idx}',
-            "text": ch,
-            "metadata": {**meta, "chunk": idx}
+            "text": content[start:end],
+            "metadata": {**meta, "chunk": idx, "start": start, "end": end}
         }
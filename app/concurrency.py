@@ -0,0 +1,33 @@
+# app/concurrency.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one in-flight task.
+
+    Callers await a shielded future, so one caller cancelling (client disconnect)
+    does not cancel the work the others are waiting on.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.started = self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._done(key, f))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(fut)
+
+    def _done(self, key, fut):
+        self._inflight.pop(key, None)
+        if not fut.cancelled():
+            fut.exception()  # mark retrieved even if every waiter has gone away
+
+    def stats(self) -> dict:
+        return {"started": self.started, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
@@ -0,0 +1,106 @@
+# app/context.py
+import os
+from typing import List, Tuple
+from app.chunking import get_encoder
+
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "2000"))         # token budget for the context excerpts
+CONTEXT_MIN_TOKENS = int(os.getenv("CONTEXT_MIN_TOKENS", "64"))   # cut an excerpt to fit only if this much room is left
+CONTEXT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
+MAX_OVERLAP_CHARS = 4000  # chunks overlap by 40 tokens; search well past that
+
+def _encoder():
+    try:
+        return get_encoder(CONTEXT_MODEL)
+    except KeyError:  # model unknown to tiktoken
+        return get_encoder("")
+
+def _overlap(a: str, b: str) -> int:
+    # longest suffix of a that is a prefix of b (the chunker's token overlap), 0 if none
+    tail, probe = a[-MAX_OVERLAP_CHARS:], b[:16]
+    i = tail.find(probe)
+    while i != -1:
+        if b.startswith(tail[i:]):
+            return len(tail) - i
+        i = tail.find(probe, i + 1)
+    return 0
+
+def _position(e: dict) -> tuple:
+    return (e["start"] is None, e["start"] or 0, e["chunks"][0] if isinstance(e["chunks"][0], int) else -1)
+
+def _offsets_ok(e: dict) -> bool:
+    return e["start"] is not None and e["end"] is not None and e["end"] - e["start"] == len(e["text"])
+
+def _join(cur: dict, nxt: dict) -> bool:
+    # append nxt to cur if they overlap or touch in the source document
+    if _offsets_ok(cur) and _offsets_ok(nxt):
+        if nxt["start"] > cur["end"]:
+            return False
+        cur["text"] += nxt["text"][cur["end"] - nxt["start"]:]
+        cur["end"] = max(cur["end"], nxt["end"])
+    else:  # no usable offsets (older stores): consecutive chunk numbers, overlap found in the text
+        last, first = cur["chunks"][-1], nxt["chunks"][0]
+        if not (isinstance(last, int) and isinstance(first, int) and first == last + 1):
+            return False
+        k = _overlap(cur["text"], nxt["text"])
+        cur["text"] += nxt["text"][k:] if k else "\n" + nxt["text"]
+        cur["start"] = cur["end"] = None
+    cur["chunks"] += nxt["chunks"]
+    cur["rank"] = min(cur["rank"], nxt["rank"])
+    return True
+
+def merge(hits: List[dict]) -> List[dict]:
+    """Hits (best first) -> excerpts, best first: repeated chunks dropped, overlapping or
+    adjacent chunks of one source joined into a single excerpt ranked by its best chunk."""
+    seen, by_source = set(), {}
+    for rank, h in enumerate(hits):
+        key = h.get("id") or (h.get("source"), h.get("chunk"), h["text"])
+        if key in seen:
+            continue
+        seen.add(key)
+        m = h.get("meta") or {}
+        by_source.setdefault(h.get("source"), []).append(
+            {"source": h.get("source"), "chunks": [h.get("chunk")], "start": m.get("start"), "end": m.get("end"),
+             "text": h["text"], "rank": rank})
+    out = []
+    for items in by_source.values():
+        items.sort(key=_position)
+        cur = items[0]
+        for nxt in items[1:]:
+            if not _join(cur, nxt):
+                out.append(cur)
+                cur = nxt
+        out.append(cur)
+    return sorted(out, key=lambda e: e["rank"])
+
+def _line(e: dict) -> str:
+    c = e["chunks"]
+    tag = f'{e["source"] or "?"}#{"?" if c[0] is None else c[0]}' + (f"-{c[-1]}" if len(c) > 1 else "")
+    return f"- ({tag}) {e['text']}"
+
+def pack(hits: List[dict], budget: int = CONTEXT_TOKENS) -> Tuple[str, dict]:
+    """Context excerpts for the prompt within `budget` tokens -> (text, stats).
+
+    Excerpts are taken best first, the last one cut at a token boundary if it does not fit.
+    They are then written in source order, so questions retrieving the same passages share
+    a prompt prefix the provider can cache. stats["saved"] is the prompt tokens saved
+    against sending every hit whole.
+    """
+    enc = _encoder()
+    chosen, used = [], 0
+    for e in merge(hits):
+        line = _line(e)
+        toks = enc.encode_ordinary(line)
+        sep = 1 if chosen else 0  # newline
+        room = budget - used - sep
+        if len(toks) > room:
+            if room < CONTEXT_MIN_TOKENS:
+                continue  # a shorter excerpt further down may still fit
+            toks = toks[:room]
+            line = enc.decode(toks)
+        chosen.append((e, line))
+        used += sep + len(toks)
+    chosen.sort(key=lambda c: (str(c[0]["source"]), _position(c[0])))
+    full = sum(len(enc.encode_ordinary(_line({"source": h.get("source"), "chunks": [h.get("chunk")], "text": h["text"]})))
+               for h in hits) + max(0, len(hits) - 1)
+    stats = {"hits": len(hits), "excerpts": len(chosen), "tokens": used, "saved": max(0, full - used)}
+    return "\n".join(line for _, line in chosen), stats
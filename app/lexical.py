@@ -0,0 +1,253 @@
+# app/lexical.py
+import os, re, sys, json, math, shutil, pathlib, unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+LEXICAL_INDEX = os.getenv("LEXICAL_INDEX", "1") == "1"  # build/serve the BM25 index next to the vector store
+LEXICAL_K1 = float(os.getenv("LEXICAL_K1", "1.2"))
+LEXICAL_B = float(os.getenv("LEXICAL_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))                    # reciprocal rank fusion constant
+
+# verse references ("2.47", "2:47") stay one token; Devanagari words keep their vowel signs
+_TOKEN = re.compile(r"\d+(?:[.:]\d+)*|[\wऀ-ॣ०-ॿ]+")
+
+@lru_cache(maxsize=None)
+def _fold_table() -> dict:
+    # Latin diacritics dropped (Gītā == Gita, like normalize_corpus's text_ascii); Devanagari
+    # keeps its virama/nukta, and its digits become ASCII
+    table = {cp: None for cp in range(sys.maxunicode + 1)
+             if unicodedata.combining(chr(cp)) and not 0x0900 <= cp <= 0x097F}
+    table.update({0x0966 + i: str(i) for i in range(10)})
+    return table
+
+def tokenize(text: str) -> List[str]:
+    t = unicodedata.normalize("NFKD", text).translate(_fold_table()).casefold()
+    return [tok.replace(":", ".") for tok in _TOKEN.findall(t)]
+
+def rrf(rankings: List[List[dict]], top_k: int, k: int = RRF_K) -> List[dict]:
+    # reciprocal rank fusion of hit lists keyed on hit["id"]; score becomes the fused score
+    fused: Dict[str, Tuple[float, dict]] = {}
+    for hits in rankings:
+        for rank, h in enumerate(hits):
+            score, first = fused.get(h["id"], (0.0, h))
+            fused[h["id"]] = (score + 1.0 / (k + rank + 1), first)
+    best = sorted(fused.values(), key=lambda e: -e[0])[:top_k]
+    return [{**h, "score": s} for s, h in best]
+
+class _Segment:
+    # immutable postings for rows [start, end): terms.json (sorted), offsets/rows/tfs .npy (mmap'd)
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        meta = json.loads((path / "segment.json").read_text())
+        self.start, self.end = meta["start"], meta["end"]
+        self.terms = {t: i for i, t in enumerate(json.loads((path / "terms.json").read_text(encoding="utf-8")))}
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.rows = np.load(path / "rows.npy", mmap_mode="r")
+        self.tfs = np.load(path / "tfs.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def postings(self, term: str):
+        i = self.terms.get(term)
+        if i is None:
+            return None
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return self.rows[a:b], self.tfs[a:b]
+
+    @staticmethod
+    def write(path: pathlib.Path, start: int, end: int, postings: Dict[str, Tuple[list, list]]):
+        path.mkdir(parents=True)
+        terms = sorted(postings)
+        sizes = [len(postings[t][0]) for t in terms]
+        np.save(path / "offsets.npy", np.concatenate(([0], np.cumsum(sizes, dtype="int64"))))
+        np.save(path / "rows.npy", np.concatenate([np.asarray(postings[t][0], dtype="uint32") for t in terms] or [np.zeros(0, "uint32")]))
+        np.save(path / "tfs.npy", np.concatenate([np.minimum(postings[t][1], 65535).astype("uint16") for t in terms] or [np.zeros(0, "uint16")]))
+        (path / "terms.json").write_text(json.dumps(terms, ensure_ascii=False), encoding="utf-8")
+        (path / "segment.json").write_text(json.dumps({"start": start, "end": end}))
+
+class LexicalIndex:
+    """BM25 inverted index over chunk texts.
+
+    Rows are numbered in insertion order; re-adding an id tombstones its old row, like
+    FaissStore, so both number rows identically. Each commit writes the new rows as an
+    immutable segment; adjacent segments are merged (dropping deleted rows) once the newer
+    one is at least half the size of the older, which keeps O(log n) segments.
+    state.json is the commit point; appended files past it are cut off on open, or just
+    ignored with read_only (a published FaissStore generation).
+    """
+
+    def __init__(self, path, k1: float = LEXICAL_K1, b: float = LEXICAL_B, read_only: bool = False):
+        self.path = pathlib.Path(path)
+        self.k1, self.b, self.read_only = k1, b, read_only
+        if not read_only:
+            self.path.mkdir(parents=True, exist_ok=True)
+        self.state_file = self.path / "state.json"
+        state = json.loads(self.state_file.read_text()) if self.state_file.exists() else {"rows": 0, "deleted": 0, "segments": [], "next": 0}
+        self._state = state
+        self.ids = self._open_ids(state["rows"])
+        self.lens = self._open_array("lens.u32", "<u4", state["rows"])
+        self.deleted = set(self._open_array("deleted.u64", "<u8", state["deleted"]).tolist())
+        self.segments = [_Segment(self.path / name) for name in state["segments"]]
+        for orphan in [] if read_only else self.path.glob("seg-*"):  # written by a commit that never reached state.json
+            if orphan.name not in state["segments"]:
+                shutil.rmtree(orphan, ignore_errors=True)
+        self._dead = np.zeros(len(self.ids), dtype=bool)
+        self._dead[list(self.deleted)] = True
+        self._live_len = int(self.lens[~self._dead].sum())
+        self._id_rows = None
+        self._pending: Dict[str, Tuple[list, list]] = {}
+        self._pending_ids, self._pending_lens, self._deleted_pending = [], [], []
+
+    def _open_ids(self, n: int) -> List[str]:
+        f = self.path / "ids.jsonl"
+        if not f.exists():
+            return []
+        data = f.read_bytes()
+        lines = data.splitlines()
+        if len(lines) > n and not self.read_only:
+            # cut in place (not rewritten): a published generation may share this file
+            os.truncate(f, sum(len(line) + 1 for line in lines[:n]))
+        return [json.loads(line) for line in lines[:n]]
+
+    def _open_array(self, name: str, dtype: str, n: int) -> np.ndarray:
+        f = self.path / name
+        if not f.exists():
+            return np.zeros(0, dtype=dtype)
+        size = np.dtype(dtype).itemsize
+        if f.stat().st_size > n * size and not self.read_only:
+            os.truncate(f, n * size)
+        return np.fromfile(f, dtype=dtype, count=n)
+
+    @property
+    def rows(self) -> int:
+        return len(self.ids) + len(self._pending_ids)
+
+    def live(self) -> int:
+        # committed rows that are not deleted
+        return len(self.ids) - int(self._dead.sum())
+
+    def _rows(self) -> Dict[str, int]:
+        if self._id_rows is None:
+            self._id_rows = {i: r for r, i in enumerate(self.ids) if r not in self.deleted}
+        return self._id_rows
+
+    def _tombstone(self, row: int):
+        self.deleted.add(row)
+        self._deleted_pending.append(row)
+
+    def add(self, ids: List[str], texts: List[str]):
+        rows = self._rows()
+        for id_, text in zip(ids, texts):
+            old = rows.get(id_)
+            if old is not None:
+                self._tombstone(old)
+            row = self.rows
+            rows[id_] = row
+            tf = Counter(tokenize(text))
+            for term, n in tf.items():
+                p = self._pending.setdefault(term, ([], []))
+                p[0].append(row); p[1].append(n)
+            self._pending_ids.append(id_)
+            self._pending_lens.append(sum(tf.values()))
+
+    def delete(self, ids: Iterable[str]):
+        rows = self._rows()
+        for id_ in ids:
+            row = rows.pop(id_, None)
+            if row is not None:
+                self._tombstone(row)
+
+    def delete_rows(self, rows: Iterable[int]):
+        for row in rows:
+            if row not in self.deleted:
+                self._tombstone(row)
+        self._id_rows = None
+
+    def commit(self):
+        if not self._pending_ids and not self._deleted_pending:
+            return
+        state = dict(self._state)
+        start = len(self.ids)
+        with (self.path / "ids.jsonl").open("a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(i, ensure_ascii=False) + "\n" for i in self._pending_ids))
+            f.flush(); os.fsync(f.fileno())
+        for name, values, dtype in (("lens.u32", self._pending_lens, "<u4"), ("deleted.u64", self._deleted_pending, "<u8")):
+            with (self.path / name).open("ab") as f:
+                f.write(np.asarray(values, dtype=dtype).tobytes())
+                f.flush(); os.fsync(f.fileno())
+        self.ids.extend(self._pending_ids)
+        self.lens = np.concatenate((self.lens, np.asarray(self._pending_lens, dtype="<u4")))
+        dead = np.zeros(len(self.ids), dtype=bool); dead[:len(self._dead)] = self._dead
+        dead[self._deleted_pending] = True
+        self._dead = dead
+        self._live_len = int(self.lens[~self._dead].sum())
+        segments, retired = list(state["segments"]), []
+        if self._pending_ids:
+            name = f"seg-{state['next']:06d}"; state["next"] += 1
+            _Segment.write(self.path / name, start, len(self.ids), self._pending)
+            self.segments.append(_Segment(self.path / name)); segments.append(name)
+            while len(self.segments) > 1 and 2 * len(self.segments[-1]) >= len(self.segments[-2]):
+                name = f"seg-{state['next']:06d}"; state["next"] += 1
+                merged = self._merge(self.segments[-2], self.segments[-1], self.path / name)
+                retired += self.segments[-2:]
+                self.segments[-2:] = [merged]; segments[-2:] = [name]
+        self._pending, self._pending_ids, self._pending_lens, self._deleted_pending = {}, [], [], []
+        state.update(rows=len(self.ids), deleted=len(self.deleted), segments=segments)
+        tmp = self.state_file.with_name("state.json.tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.state_file)
+        self._state = state
+        for seg in retired:
+            shutil.rmtree(seg.path, ignore_errors=True)
+
+    def _merge(self, a: _Segment, b: _Segment, path: pathlib.Path) -> _Segment:
+        postings = {}
+        for term in a.terms.keys() | b.terms.keys():
+            parts = [p for p in (a.postings(term), b.postings(term)) if p is not None]
+            rows = np.concatenate([p[0] for p in parts]); tfs = np.concatenate([p[1] for p in parts])
+            keep = ~self._dead[rows]
+            if keep.any():
+                postings[term] = (rows[keep], tfs[keep])
+        _Segment.write(path, a.start, b.end, postings)
+        return _Segment(path)
+
+    def reset(self):
+        for seg in self.segments:
+            shutil.rmtree(seg.path, ignore_errors=True)
+        for name in ("ids.jsonl", "lens.u32", "deleted.u64", "state.json"):
+            (self.path / name).unlink(missing_ok=True)
+        self.__init__(self.path, self.k1, self.b)
+
+    def search(self, query: str, top_k: int = 6, allowed=None) -> List[Tuple[int, float]]:
+        """(row, BM25 score) of the best committed rows for query, optionally only among sorted `allowed` rows."""
+        n = self.live()
+        terms = set(tokenize(query))
+        if not n or not terms:
+            return []
+        avgdl = self._live_len / n or 1.0
+        all_rows, all_scores = [], []
+        for term in terms:
+            parts = [p for p in (seg.postings(term) for seg in self.segments) if p is not None]
+            if not parts:
+                continue
+            rows = np.concatenate([p[0] for p in parts]).astype("int64")
+            tf = np.concatenate([p[1] for p in parts]).astype("float32")
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lens[rows] / avgdl)
+            all_rows.append(rows); all_scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not all_rows:
+            return []
+        rows, inv = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(all_scores))
+        keep = ~self._dead[rows]
+        if allowed is not None:
+            keep &= np.isin(rows, np.asarray(allowed, dtype="int64"), assume_unique=True)
+        rows, scores = rows[keep], scores[keep]
+        if not len(rows):
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k] if len(rows) > top_k else np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
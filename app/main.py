@@ -1,15 +1,40 @@
 # app/main.py
-import os, json, asyncio
-from fastapi import FastAPI, Body
+import os, json, time, asyncio, pathlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse
+from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse, PlainTextResponse
 from dotenv import load_dotenv
-from app.rag import retrieve, generate_answer
-from openai import OpenAI
+from app.vector_store import normalize_filter
+from app import metrics
+from app.rag import aretrieve, aretrieve_many, agenerate_answer, stream_answer, resolve_mode, awarm_up, aclose, flights, embed_cache, answer_cache
 
 load_dotenv()
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "256"))
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", "50"))  # largest top_k /query/batch accepts
+WARMUP = os.getenv("WARMUP", "1") == "1"  # 0: build the store and clients on first use instead of at startup
 
-app = FastAPI(title="GuruMitra API", version="1.0.0")
+warmup = {"ready": not WARMUP, "seconds": None, "steps": {}, "error": None}
+
+async def _warm_up():
+    t0 = time.perf_counter()
+    try:
+        warmup["steps"] = await awarm_up()
+        warmup["ready"] = True
+    except Exception as e:  # requests still retry the failed step lazily
+        warmup["error"] = repr(e)
+    warmup["seconds"] = round(time.perf_counter() - t0, 3)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm-up runs in the background: the port opens (and /health answers) right away
+    task = asyncio.create_task(_warm_up()) if WARMUP else None
+    yield
+    if task is not None:
+        task.cancel()
+    await aclose()  # release the pooled upstream connections
+
+app = FastAPI(title="GuruMitra API", version="1.0.0", lifespan=lifespan)
 origins = [o.strip() for o in os.getenv("ALLOWED_ORIGINS","*").split(",") if o.strip()]
 app.add_middleware(
     CORSMiddleware,
@@ -17,43 +42,145 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+@app.middleware("http")
+async def timing(request: Request, call_next):
+    timings = metrics.start_request()
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - t0
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.observe(elapsed, route.path if route else "unmatched", response.status_code)
+    if metrics.TIMING_HEADERS:
+        # streamed responses report the stages done before the first byte
+        response.headers["Server-Timing"] = metrics.server_timing({**timings, "total": elapsed})
+    return response
+
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {"ok": True, "embed_cache": embed_cache.stats(), "answer_cache": answer_cache.stats(), "single_flight": flights.stats()}
+
+# 200 once warm-up is done (or WARMUP=0), 503 while it runs or if it failed; /health only says the process is up
+@app.get("/ready")
+def ready():
+    return JSONResponse(warmup, status_code=200 if warmup["ready"] else 503)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# wall-clock sampling profile of every thread, folded stacks (flamegraph.pl / speedscope); PROFILER=1 only
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10.0):
+    if not metrics.PROFILER:
+        return JSONResponse({"error": "profiler disabled (set PROFILER=1)"}, status_code=404)
+    try:
+        folded = await asyncio.to_thread(metrics.profile, min(max(seconds, 0.1), 120.0))
+    except RuntimeError as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+    return PlainTextResponse(folded)
+
+def _question(payload):
+    # "question": a string, stripped ("" is left to the caller); ValueError otherwise
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    q = payload.get("question", "")
+    if not isinstance(q, str):
+        raise ValueError("question must be a string")
+    return q.strip()
+
+def _questions(payload):
+    # "questions": 1..BATCH_MAX_QUESTIONS non-empty strings, stripped; ValueError otherwise
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    qs = payload.get("questions")
+    if not isinstance(qs, list) or not qs or not all(isinstance(q, str) and q.strip() for q in qs):
+        raise ValueError("questions must be a non-empty list of non-empty strings")
+    if len(qs) > BATCH_MAX_QUESTIONS:
+        raise ValueError(f"at most {BATCH_MAX_QUESTIONS} questions per batch")
+    return [q.strip() for q in qs]
+
+def _mode(payload, q=""):
+    # "mode": vector | lexical | hybrid | auto (default RETRIEVAL_MODE); ValueError if unknown
+    return resolve_mode(q, payload.get("mode"))
+
+def _top_k(payload):
+    # "top_k": 1..MAX_TOP_K (default 6); ValueError otherwise
+    try:
+        k = int(payload.get("top_k", 6))
+    except (TypeError, ValueError):
+        raise ValueError("top_k must be an integer") from None
+    if not 1 <= k <= MAX_TOP_K:
+        raise ValueError(f"top_k must be between 1 and {MAX_TOP_K}")
+    return k
+
+def _filter(payload):
+    # "filter": {"language": "hi", "identifier": [...]}; ValueError if malformed
+    return normalize_filter(payload.get("filter")) or None
 
 @app.post("/query")
-def query(payload=Body(...)):
-    q = payload.get("question", "").strip()
-    if not q:
-        return JSONResponse({"error":"question required"}, status_code=400)
-    passages = retrieve(q, top_k=6)
-    answer = generate_answer(q, passages)
+async def query(payload=Body(...)):
+    try:
+        q = _question(payload)
+        if not q:
+            return JSONResponse({"error":"question required"}, status_code=400)
+        mode, f = _mode(payload, q), _filter(payload)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    passages = await aretrieve(q, top_k=6, mode=mode, filter=f)
+    answer = await agenerate_answer(q, passages, use_cache=(mode != "lexical"))
     return {"answer": answer, "sources": passages}
 
-# Optional: SSE streaming using chunked generation (emulates stream)
-# For full streaming, adapt to OpenAI Responses API and yield deltas.
+# Batch retrieval (+ optional generation) for internal tools: one embeddings call,
+# one matrix search, answers generated concurrently under the LLM concurrency limit.
+@app.post("/query/batch")
+async def query_batch(payload=Body(...)):
+    try:
+        qs = _questions(payload)
+        top_k, modes, f = _top_k(payload), [_mode(payload, q) for q in qs], _filter(payload)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    hits = await aretrieve_many(qs, top_k=top_k, mode=payload.get("mode"), filter=f)
+    if payload.get("generate", True):
+        answers = await asyncio.gather(*(agenerate_answer(q, h, use_cache=(m != "lexical")) for q, h, m in zip(qs, hits, modes)))
+    else:
+        answers = [None] * len(qs)
+    return {"results": [{"question": q, "answer": a, "sources": h} for q, a, h in zip(qs, answers, hits)]}
+
+# SSE: context first, then one delta per streamed token chunk, then done (with token usage)
 @app.post("/stream")
-async def stream(payload=Body(...)):
-    q = payload.get("question","").strip()
-    if not q: return StreamingResponse(iter([b"data: {\"error\":\"question required\"}\n\n"]), media_type="text/event-stream")
-    passages = retrieve(q, top_k=6)
+async def stream(request: Request, payload=Body(...)):
+    try:
+        q = _question(payload)
+        if not q: return StreamingResponse(iter([b"data: {\"error\":\"question required\"}\n\n"]), media_type="text/event-stream")
+        mode, f = _mode(payload, q), _filter(payload)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    passages = await aretrieve(q, top_k=6, mode=mode, filter=f)
 
     async def event_gen():
         # send context first
         yield f"data: {json.dumps({'event':'context','sources':passages})}\n\n"
-        # simple non-token streaming: chunk the final answer by sentences
-        full = generate_answer(q, passages)
-        for line in full.split(". "):
-            yield f"data: {json.dumps({'event':'delta','text': line + '. '})}\n\n"
-            await asyncio.sleep(0.02)
-        yield "data: {\"event\":\"done\"}\n\n"
+        usage = None
+        deltas = stream_answer(q, passages, use_cache=(mode != "lexical"))
+        try:
+            async for kind, data in deltas:
+                if kind == "usage":
+                    usage = data
+                    continue
+                if await request.is_disconnected():
+                    return
+                yield f"data: {json.dumps({'event':'delta','text': data})}\n\n"
+        finally:
+            await deltas.aclose()  # stops the upstream completion if the client left
+        yield f"data: {json.dumps({'event':'done','usage': usage})}\n\n"
 
     return StreamingResponse(event_gen(), media_type="text/event-stream")
 
 @app.get("/")
 def landing():
     # tiny demo page (optional)
-    html = (Path(__file__).parent / "static" / "chat.html").read_text()
+    html = (pathlib.Path(__file__).parent / "static" / "chat.html").read_text()
     return HTMLResponse(html)
@@ -0,0 +1,160 @@
+# app/metrics.py
+import os, sys, time, bisect, threading, contextvars
+from collections import Counter as _Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") == "1"          # Server-Timing header with per-stage durations
+PROFILER = os.getenv("PROFILER", "0") == "1"                       # enables GET /debug/profile
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))   # seconds between stack samples
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (0, 50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+_registry: List["_Metric"] = []
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"] + self.samples()
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in self._values.items()]
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}  # labels -> [count per bucket (+Inf last), sum]
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for k, (counts, total) in self._series.items():
+                n = 0
+                for bound, c in zip(self.buckets + ("+Inf",), counts):
+                    n += c
+                    le = 'le="%s"' % bound
+                    out.append(f"{self.name}_bucket{_labels(self.label_names, k, le)} {n}")
+                out.append(f"{self.name}_sum{_labels(self.label_names, k)} {total}")
+                out.append(f"{self.name}_count{_labels(self.label_names, k)} {n}")
+        return out
+
+class Callback(_Metric):
+    """Gauge or counter read at scrape time: fn() -> value, or {label values: value}."""
+
+    def __init__(self, name, help, fn: Callable, labels=(), type="gauge"):
+        super().__init__(name, help, labels)
+        self.fn, self.type = fn, type
+
+    def samples(self):
+        try:
+            v = self.fn()
+        except Exception:
+            return []  # a failing source (e.g. store unreachable) must not break the scrape
+        items = v.items() if isinstance(v, dict) else [((), v)]
+        return [f"{self.name}{_labels(self.label_names, k)} {float(x)}" for k, x in items]
+
+def render() -> str:
+    return "\n".join(line for m in _registry for line in m.render()) + "\n"
+
+# ------- stages, requests, tokens -------
+STAGE_SECONDS = Histogram("gurumitra_stage_seconds", "Time per pipeline stage", ("stage",))
+REQUEST_SECONDS = Histogram("gurumitra_request_seconds", "HTTP request latency (to response headers)", ("route", "status"))
+TOKENS = Counter("gurumitra_tokens_total", "OpenAI tokens used", ("kind",))
+CONTEXT_SAVED = Histogram("gurumitra_context_tokens_saved", "Prompt tokens saved per request by context packing", buckets=TOKEN_BUCKETS)
+
+_timings: contextvars.ContextVar = contextvars.ContextVar("stage_timings", default=None)
+
+def start_request() -> Dict[str, float]:
+    # stage durations observed in this request's context (and tasks/threads started from it)
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+def observe_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{k};dur={v * 1000:.1f}" for k, v in timings.items())
+
+def record_usage(usage):
+    # chat usage (object or dict): prompt, completion and cached prompt tokens
+    if usage is None:
+        return
+    u = usage if isinstance(usage, dict) else usage.model_dump()
+    TOKENS.inc(u.get("prompt_tokens") or 0, "prompt")
+    TOKENS.inc(u.get("completion_tokens") or 0, "completion")
+    TOKENS.inc((u.get("prompt_tokens_details") or {}).get("cached_tokens") or 0, "cached_prompt")
+
+# ------- sampling profiler -------
+_profiling = threading.Lock()
+
+def profile(seconds: float, interval: float = PROFILE_INTERVAL) -> str:
+    """Wall-clock sample every thread's stack for `seconds`; folded stacks ("a;b;c count") for
+    flamegraph.pl / speedscope. Raises RuntimeError if a profile is already running."""
+    if not _profiling.acquire(blocking=False):
+        raise RuntimeError("a profile is already running")
+    try:
+        stacks, me = _Counter(), threading.get_ident()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks[";".join(reversed(names))] += 1
+            time.sleep(interval)
+        return "".join(f"{s} {n}\n" for s, n in stacks.most_common())
+    finally:
+        _profiling.release()
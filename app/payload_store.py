@@ -0,0 +1,160 @@
+# app/payload_store.py
+import os, json, mmap, pathlib
+import numpy as np
+
+class PayloadStore:
+    """Append-only payload log for FaissStore.
+
+    payload.bin holds UTF-8 JSON records back to back and payload.off holds the
+    uint64 end offset of each record. Both are memory-mapped, so resident memory
+    does not grow with the corpus and only the records a search returns are decoded.
+    With `count` the store is a read-only view of the first count records (a published
+    generation whose files a writer may still be appending to).
+    """
+
+    def __init__(self, path: pathlib.Path, count: int = None):
+        self.blob_file = path / "payload.bin"
+        self.off_file = path / "payload.off"
+        self.count = count
+        if count is None:
+            self.blob_file.touch(); self.off_file.touch()
+        self._pending = []  # encoded records not yet on disk
+        self._mm = None
+        self._offs = np.zeros(0, dtype="<u8")
+        self._map()
+
+    def _map(self):
+        self._close()
+        n = self.off_file.stat().st_size // 8 if self.off_file.exists() else 0
+        if self.count is not None:
+            n = min(n, self.count)
+        if n:
+            self._offs = np.memmap(self.off_file, dtype="<u8", mode="r", shape=(n,))
+        size = self.blob_file.stat().st_size if self.blob_file.exists() else 0
+        if size:
+            with self.blob_file.open("rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close(self):
+        # drop the maps before touching the files (Windows refuses to resize mapped files)
+        if self._mm is not None:
+            self._mm.close(); self._mm = None
+        self._offs = np.zeros(0, dtype="<u8")
+
+    def _stored(self) -> int:
+        return len(self._offs)
+
+    def __len__(self):
+        return self._stored() + len(self._pending)
+
+    def __getitem__(self, i: int) -> dict:
+        n = self._stored()
+        if i < 0: i += len(self)
+        if i >= n:
+            return json.loads(self._pending[i - n])
+        start = int(self._offs[i - 1]) if i else 0
+        return json.loads(self._mm[start:int(self._offs[i])])
+
+    def append(self, rec: dict):
+        self._pending.append(json.dumps(rec, ensure_ascii=False).encode("utf-8"))
+
+    def flush(self):
+        if not self._pending:
+            return
+        end = int(self._offs[-1]) if self._stored() else 0
+        offs = []
+        for b in self._pending:
+            end += len(b); offs.append(end)
+        self._close()
+        # blob before offsets: an offset is only written once its record is durable
+        with self.blob_file.open("ab") as f:
+            f.writelines(self._pending)
+            f.flush(); os.fsync(f.fileno())
+        with self.off_file.open("ab") as f:
+            f.write(np.array(offs, dtype="<u8").tobytes())
+            f.flush(); os.fsync(f.fileno())
+        self._pending = []
+        self._map()
+
+    def truncate(self, n: int):
+        # roll back to the first n stored records (drops anything past a checkpoint)
+        self._pending = []
+        self._map()
+        n = min(n, self._stored())
+        end = int(self._offs[n - 1]) if n else 0
+        self._close()
+        os.truncate(self.off_file, n * 8)
+        os.truncate(self.blob_file, end)
+        self._map()
+
+    def import_jsonl(self, jsonl_file: pathlib.Path, n: int):
+        # one-off migration from the old payload.jsonl layout
+        with jsonl_file.open("rb") as f:
+            for line in f:
+                if len(self) == n: break
+                if line.strip():
+                    self.append(json.loads(line))
+                if len(self._pending) >= 10000:
+                    self.flush()
+        self.flush()
+
+class MetaColumn:
+    """One meta field of every payload record, for filtering without decoding records.
+
+    <name>.u32 holds each row's value as a code into <name>.json, the values in first-seen
+    order. Codes are only appended and the value list only grows (replaced by rename), so
+    like PayloadStore a `count` view stays valid while a writer appends. Values that are
+    not strings are stored as None (filters only match strings).
+    """
+
+    def __init__(self, path: pathlib.Path, name: str, count: int = None):
+        self.codes_file = path / f"{name}.u32"
+        self.values_file = path / f"{name}.json"
+        self.values = json.loads(self.values_file.read_text(encoding="utf-8")) if self.values_file.exists() else []
+        self._code = {v: i for i, v in enumerate(self.values)}
+        self._values_stored = len(self.values)
+        n = self.codes_file.stat().st_size // 4 if self.codes_file.exists() else 0
+        if count is not None:
+            n = min(n, count)
+        self._codes = np.fromfile(self.codes_file, dtype="<u4", count=n) if n else np.zeros(0, dtype="<u4")
+        self._pending = []
+
+    def __len__(self):
+        return len(self._codes) + len(self._pending)
+
+    def append(self, value):
+        value = value if isinstance(value, str) else None
+        code = self._code.get(value)
+        if code is None:
+            code = self._code[value] = len(self.values)
+            self.values.append(value)
+        self._pending.append(code)
+
+    def flush(self):
+        if not self._pending:
+            return
+        # values before codes: a stored code always has its value
+        if len(self.values) > self._values_stored:
+            tmp = self.values_file.with_name(self.values_file.name + ".tmp")
+            tmp.write_text(json.dumps(self.values, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.values_file)
+            self._values_stored = len(self.values)
+        codes = np.array(self._pending, dtype="<u4")
+        with self.codes_file.open("ab") as f:
+            f.write(codes.tobytes())
+            f.flush(); os.fsync(f.fileno())
+        self._codes = np.concatenate((self._codes, codes))
+        self._pending = []
+
+    def truncate(self, n: int):
+        self._pending = []
+        self._codes = self._codes[:n]
+        os.truncate(self.codes_file, len(self._codes) * 4)
+
+    def rows(self, values) -> np.ndarray:
+        # sorted rows (int64) whose value is any of `values`
+        codes = [self._code[v] for v in values if v in self._code]
+        if not codes:
+            return np.zeros(0, dtype="int64")
+        allc = np.concatenate((self._codes, np.asarray(self._pending, dtype="<u4"))) if self._pending else self._codes
+        return np.flatnonzero(np.isin(allc, codes)).astype("int64")
@@ -6,9 +6,11 @@ Avoid definitive theological claims where the texts disagree; cite the source an
 Be concise and compassionate. Provide Hindi and English when helpful.
 """
 
-USER_TEMPLATE = """Question: {question}
-
-Context excerpts:
+# context before the question: requests retrieving the same passages share a longer
+# prefix (system prompt + context) for the provider's prompt cache
+USER_TEMPLATE = """Context excerpts:
 {context}
 
+Question: {question}
+
 Answer in a clear, friendly tone. Start with a brief summary (2-3 lines), then details with bullet points and short quotes with source identifiers."""
@@ -1,22 +1,51 @@
 # app/qdrant_utils.py
-import os
+import os, uuid
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client.http import models as qm
 from dotenv import load_dotenv
 
 load_dotenv()
-QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_URL = os.getenv("QDRANT_URL")                                  # ":memory:" runs the in-process client (tests)
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_GRPC = os.getenv("QDRANT_GRPC", "1") == "1"                    # gRPC transport for search/upload
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_ON_DISK = os.getenv("QDRANT_ON_DISK", "0") == "1"              # original vectors and payloads on disk (mmap)
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()  # none | scalar (int8) | binary, kept in RAM
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))   # quantized search: candidates rescored with originals
+QDRANT_UPLOAD_BATCH = int(os.getenv("QDRANT_UPLOAD_BATCH", "256"))
+QDRANT_UPLOAD_PARALLEL = int(os.getenv("QDRANT_UPLOAD_PARALLEL", "4"))
 COLLECTION = os.getenv("QDRANT_COLLECTION", "gurumitra_docs")
-EMBED_DIMS = 1536  # 3072 if you use text-embedding-3-large
+EMBED_DIMS = int(os.getenv("EMBED_DIMS", "1536"))  # 3072 if you use text-embedding-3-large
+PAYLOAD_INDEXES = ("language", "identifier")        # keyword indexes for filtered search
 
 def get_client():
-    return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY) if QDRANT_URL else QdrantClient(host="localhost", port=6333)
+    if QDRANT_URL == ":memory:":
+        return QdrantClient(":memory:")
+    if QDRANT_URL:
+        return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_GRPC, grpc_port=QDRANT_GRPC_PORT)
+    return QdrantClient(host="localhost", port=6333, grpc_port=QDRANT_GRPC_PORT, prefer_grpc=QDRANT_GRPC)
 
-def ensure_collection(client: QdrantClient):
-    if COLLECTION not in [c.name for c in client.get_collections().collections]:
+def point_id(chunk_id: str) -> str:
+    # Qdrant only accepts unsigned ints and UUIDs; "identifier:idx" maps to a stable UUID
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, chunk_id))
+
+def quantization_config(kind: str = QDRANT_QUANTIZATION):
+    if kind == "none":
+        return None
+    if kind == "scalar":
+        return qm.ScalarQuantization(scalar=qm.ScalarQuantizationConfig(type=qm.ScalarType.INT8, always_ram=True))
+    if kind == "binary":
+        return qm.BinaryQuantization(binary=qm.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"unknown QDRANT_QUANTIZATION {kind!r} (expected none, scalar or binary)")
+
+def ensure_collection(client: QdrantClient, collection: str = COLLECTION, dims: int = EMBED_DIMS):
+    if not client.collection_exists(collection):
         client.create_collection(
-            collection_name=COLLECTION,
-            vectors_config=VectorParams(size=EMBED_DIMS, distance=Distance.COSINE),
+            collection_name=collection,
+            vectors_config=qm.VectorParams(size=dims, distance=qm.Distance.COSINE, on_disk=QDRANT_ON_DISK),
+            quantization_config=quantization_config(),
+            on_disk_payload=QDRANT_ON_DISK,
         )
-    return COLLECTION
+    for field in PAYLOAD_INDEXES:  # idempotent
+        client.create_payload_index(collection, field_name=field, field_schema=qm.PayloadSchemaType.KEYWORD)
+    return collection
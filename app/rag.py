@@ -1,36 +1,353 @@
 # app/rag.py
-import os
-from typing import List
-from openai import OpenAI
+import os, re, time, asyncio, threading
+from typing import List, AsyncIterator, Tuple
 from dotenv import load_dotenv
 from app.prompts import SYSTEM, USER_TEMPLATE
-from app.vector_store import get_store
+from app.context import pack
+from app.vector_store import get_store, normalize_filter, has_lexical_index
+from app.cache import EmbeddingCache, AnswerCache, normalize_question
+from app.concurrency import SingleFlight
+from app import metrics
+from app.metrics import stage
 
 load_dotenv()
 OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))  # pooled upstream connections per worker
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "16"))          # concurrent embedding calls per worker
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))              # concurrent chat completions per worker
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()         # vector | lexical | hybrid | auto
+MODES = ("vector", "lexical", "hybrid", "auto")
+_VERSE_REF = re.compile(r"\d+\s*[.:]\s*\d+")                            # "2.47", "2:47" — exact references
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))         # upstream connections opened by awarm_up()
 
-client = OpenAI()
-store = get_store()
+embed_limit = asyncio.Semaphore(EMBED_CONCURRENCY)
+llm_limit = asyncio.Semaphore(LLM_CONCURRENCY)
+flights = SingleFlight()  # concurrent identical questions share one retrieval / generation
+embed_cache = EmbeddingCache(EMBED_MODEL)
+answer_cache = AnswerCache()
 
-def retrieve(q: str, top_k=6) -> List[dict]:
-    emb = client.embeddings.create(model=EMBED_MODEL, input=q).data[0].embedding
-    hits = store.search(emb, top_k=top_k)
-    return hits
+metrics.Callback("gurumitra_cache_lookups_total", "Cache lookups by result", lambda: {
+    ("embedding", "hit"): embed_cache.hits, ("embedding", "disk_hit"): embed_cache.disk_hits,
+    ("embedding", "miss"): embed_cache.misses, ("answer", "hit"): answer_cache.hits, ("answer", "miss"): answer_cache.misses,
+}, labels=("cache", "result"), type="counter")
+metrics.Callback("gurumitra_cache_hit_ratio", "Cache hit rate since start",
+                 lambda: {("embedding",): embed_cache.stats()["hit_rate"], ("answer",): answer_cache.stats()["hit_rate"]}, labels=("cache",))
+metrics.Callback("gurumitra_single_flight_total", "Retrievals/generations started vs coalesced onto one in flight",
+                 lambda: {("started",): flights.started, ("coalesced",): flights.coalesced}, labels=("result",), type="counter")
+metrics.Callback("gurumitra_store_chunks", "Live chunks in the vector store", lambda: _lazy["store"].size())  # once loaded
+
+# ------- lazily built store and clients -------
+# openai and the store backend are slow to import and open, so nothing is built at import:
+# awarm_up() does it in the background at startup, or the first request that needs it does.
+_lazy = {}
+_locks = {name: threading.Lock() for name in ("store", "client", "aclient")}
+
+def _get(name, make):
+    obj = _lazy.get(name)
+    if obj is None:
+        with _locks[name]:  # concurrent first users wait for one build
+            obj = _lazy.get(name)
+            if obj is None:
+                obj = _lazy[name] = make()
+    return obj
+
+def _store():
+    return _get("store", lambda: get_store(read_only=True))
+
+def _make_client():
+    from openai import OpenAI
+    return OpenAI()
+
+def _make_aclient():
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    # one pooled HTTP client for every async upstream call in this worker
+    return AsyncOpenAI(http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)))
+
+def _client():
+    return _get("client", _make_client)
+
+def _aclient():
+    return _get("aclient", _make_aclient)
+
+def warm_up() -> dict:
+    """Open the store, load the tokenizer and build the clients now -> seconds per step."""
+    steps = {}
+    for name, fn in (("store", lambda: _store().size()),
+                     ("tokenizer", lambda: pack([{"text": "warm-up", "source": None, "chunk": None}])),
+                     ("clients", lambda: (_client(), _aclient()))):
+        t0 = time.perf_counter()
+        fn()
+        steps[name] = round(time.perf_counter() - t0, 3)
+    return steps
+
+async def awarm_up() -> dict:
+    # warm_up() off the event loop, then open pooled upstream connections (GET /models: no
+    # tokens spent); an unreachable API is reported, not raised, since retries happen per request
+    steps = await asyncio.to_thread(warm_up)
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(*(_aclient().models.list() for _ in range(WARMUP_CONNECTIONS)))
+    except Exception as e:
+        steps["connections_error"] = repr(e)
+    steps["connections"] = round(time.perf_counter() - t0, 3)
+    return steps
+
+async def aclose():
+    # release the pooled upstream connections, if they were ever opened
+    if "aclient" in _lazy:
+        await _lazy["aclient"].close()
+
+def _embed_usage(resp):
+    metrics.TOKENS.inc(resp.usage.prompt_tokens if resp.usage else 0, "embedding")
+
+def embed_query(q: str) -> List[float]:
+    emb = embed_cache.get(q)
+    if emb is None:
+        with stage("embed"):
+            resp = _client().embeddings.create(model=EMBED_MODEL, input=q)
+        _embed_usage(resp)
+        emb = resp.data[0].embedding
+        embed_cache.put(q, emb)
+    return emb
+
+def _has_lexical() -> bool:
+    # the backend keeps a lexical index and the open store has one (a FAISS generation
+    # ingested with LEXICAL_INDEX=0 has none); a store not opened yet is checked by _search
+    store = _lazy.get("store")
+    return has_lexical_index() and (store is None or store.lexical is not None)
+
+def resolve_mode(q: str, mode: str = None) -> str:
+    # auto: verse references go lexical-only (no embedding call), everything else hybrid.
+    # Without a lexical index (Qdrant, LEXICAL_INDEX=0) every mode falls back to vector.
+    mode = mode or RETRIEVAL_MODE
+    if not isinstance(mode, str) or mode.lower() not in MODES:
+        raise ValueError(f"unknown retrieval mode {mode!r} (expected {', '.join(MODES)})")
+    mode = mode.lower()
+    if mode == "auto":
+        mode = "lexical" if _VERSE_REF.search(q) else "hybrid"
+    return mode if mode == "vector" or _has_lexical() else "vector"
+
+def _search(mode: str, embs, questions, top_k, filter=None):
+    store = _store()
+    if mode != "vector" and store.lexical is None:
+        # the mode was resolved before the store was opened; it turned out to have no lexical index
+        if embs is None:
+            embs = embed_query(questions) if isinstance(questions, str) else [embed_query(q) for q in questions]
+        mode = "vector"
+    if mode == "lexical":
+        return store.lexical_search(questions, top_k, filter=filter)
+    if mode == "hybrid":
+        return store.hybrid_search(embs, questions, top_k, filter=filter)
+    return store.search(embs, top_k=top_k, filter=filter)
+
+def retrieve(q: str, top_k=6, mode: str = None, filter: dict = None) -> List[dict]:
+    mode = resolve_mode(q, mode)
+    emb = embed_query(q) if mode != "lexical" else None
+    return _search(mode, emb, q, top_k, filter)
+
+def _cached_embeddings(questions: List[str]):
+    # cached vectors (None for misses) plus the misses grouped by normalized text, so a batch
+    # asking the same thing twice embeds it once
+    embs = [embed_cache.get(q) for q in questions]
+    todo = {}
+    for i, e in enumerate(embs):
+        if e is None:
+            todo.setdefault(normalize_question(questions[i]), []).append(i)
+    return embs, todo
+
+def _fill_embeddings(questions: List[str], embs: list, todo: dict, data) -> list:
+    for positions, d in zip(todo.values(), sorted(data, key=lambda d: d.index)):
+        for i in positions:
+            embs[i] = d.embedding
+        embed_cache.put(questions[positions[0]], d.embedding)
+    return embs
+
+def _by_mode(questions: List[str], mode: str):
+    groups = {}
+    for i, q in enumerate(questions):
+        groups.setdefault(resolve_mode(q, mode), []).append(i)
+    return groups
+
+def _search_groups(questions: List[str], groups: dict, embs: list, top_k: int, filter=None) -> List[List[dict]]:
+    results = [None] * len(questions)
+    for m, idx in groups.items():
+        hits = _search(m, [embs[i] for i in idx] if m != "lexical" else None, [questions[i] for i in idx], top_k, filter)
+        for i, h in zip(idx, hits):
+            results[i] = h
+    return results
+
+def retrieve_many(questions: List[str], top_k=6, mode: str = None, filter: dict = None) -> List[List[dict]]:
+    # one embeddings call for every uncached question, one matrix search per retrieval mode;
+    # lexical-only questions are never embedded
+    groups = _by_mode(questions, mode)
+    need = [i for m, idx in groups.items() if m != "lexical" for i in idx]
+    embs = [None] * len(questions)
+    if need:
+        sub = [questions[i] for i in need]
+        sub_embs, todo = _cached_embeddings(sub)
+        if todo:
+            with stage("embed"):
+                resp = _client().embeddings.create(model=EMBED_MODEL, input=[sub[p[0]] for p in todo.values()])
+            _embed_usage(resp)
+            _fill_embeddings(sub, sub_embs, todo, resp.data)
+        for i, e in zip(need, sub_embs):
+            embs[i] = e
+    return _search_groups(questions, groups, embs, top_k, filter)
+
+async def aembed_query(q: str) -> List[float]:
+    emb = embed_cache.get(q)
+    if emb is None:
+        async with embed_limit:
+            with stage("embed"):
+                resp = await _aclient().embeddings.create(model=EMBED_MODEL, input=q)
+        _embed_usage(resp)
+        emb = resp.data[0].embedding
+        embed_cache.put(q, emb)
+    return emb
+
+async def aretrieve(q: str, top_k=6, mode: str = None, filter: dict = None) -> List[dict]:
+    mode = resolve_mode(q, mode)
+    f = normalize_filter(filter)
+    async def run():
+        emb = await aembed_query(q) if mode != "lexical" else None
+        # index search is CPU-bound (faiss releases the GIL); keep it off the event loop
+        return await asyncio.to_thread(_search, mode, emb, q, top_k, f)
+    return await flights.do(("retrieve", normalize_question(q), top_k, mode, tuple(f.items())), run)
+
+async def aretrieve_many(questions: List[str], top_k=6, mode: str = None, filter: dict = None) -> List[List[dict]]:
+    groups = _by_mode(questions, mode)
+    need = [i for m, idx in groups.items() if m != "lexical" for i in idx]
+    embs = [None] * len(questions)
+    if need:
+        sub = [questions[i] for i in need]
+        sub_embs, todo = _cached_embeddings(sub)
+        if todo:
+            async with embed_limit:
+                with stage("embed"):
+                    resp = await _aclient().embeddings.create(model=EMBED_MODEL, input=[sub[p[0]] for p in todo.values()])
+            _embed_usage(resp)
+            _fill_embeddings(sub, sub_embs, todo, resp.data)
+        for i, e in zip(need, sub_embs):
+            embs[i] = e
+    return await asyncio.to_thread(_search_groups, questions, groups, embs, top_k, filter)
+
+async def _aversion():
+    # Chroma/Qdrant may look the version up (disk, RPC) once its TTL runs out: off the event loop
+    return await asyncio.to_thread(_store().version)
 
 def build_context(snippets: List[dict]) -> str:
-    lines = []
-    for s in snippets:
-        tag = f'{s.get("source","?")}#{s.get("chunk","?")}'
-        lines.append(f"- ({tag}) {s['text'][:800]}")
-    return "\n".join(lines)
-
-def generate_answer(question: str, snippets: List[dict]) -> str:
-    context = build_context(snippets)
-    user = USER_TEMPLATE.format(question=question, context=context)
-    resp = client.chat.completions.create(
-        model=OPENAI_CHAT_MODEL,
-        temperature=0.2,
-        messages=[{"role":"system","content":SYSTEM},{"role":"user","content":user}]
-    )
-    return resp.choices[0].message.content
+    context, stats = pack(snippets)
+    metrics.CONTEXT_SAVED.observe(stats["saved"])
+    return context
+
+def build_messages(question: str, snippets: List[dict]) -> List[dict]:
+    with stage("prompt"):
+        context = build_context(snippets)
+        user = USER_TEMPLATE.format(question=question, context=context)
+    return [{"role":"system","content":SYSTEM},{"role":"user","content":user}]
+
+def generate_answer(question: str, snippets: List[dict], use_cache: bool = True) -> str:
+    # the answer cache is keyed on the question embedding; use_cache=False (lexical mode) skips it
+    emb = embed_query(question) if use_cache else None  # already cached by retrieve()
+    sources = AnswerCache.source_key(snippets)
+    with stage("answer_cache"):
+        cached = answer_cache.get(emb, sources, _store().version()) if use_cache else None
+    if cached is not None:
+        return cached
+    messages = build_messages(question, snippets)
+    with stage("llm"):
+        resp = _client().chat.completions.create(
+            model=OPENAI_CHAT_MODEL,
+            temperature=0.2,
+            messages=messages
+        )
+    metrics.record_usage(resp.usage)
+    answer = resp.choices[0].message.content
+    if use_cache:
+        answer_cache.put(emb, sources, answer, _store().version())
+    return answer
+
+async def agenerate_answer(question: str, snippets: List[dict], use_cache: bool = True) -> str:
+    emb = await aembed_query(question) if use_cache else None
+    sources = AnswerCache.source_key(snippets)
+    with stage("answer_cache"):
+        cached = answer_cache.get(emb, sources, await _aversion()) if use_cache else None
+    if cached is not None:
+        return cached
+
+    async def run():
+        messages = build_messages(question, snippets)
+        async with llm_limit:
+            with stage("llm"):
+                resp = await _aclient().chat.completions.create(
+                    model=OPENAI_CHAT_MODEL,
+                    temperature=0.2,
+                    messages=messages
+                )
+        metrics.record_usage(resp.usage)
+        answer = resp.choices[0].message.content
+        if use_cache:
+            answer_cache.put(emb, sources, answer, await _aversion())
+        return answer
+    return await flights.do(("answer", normalize_question(question), sources), run)
+
+async def stream_answer(question: str, snippets: List[dict], use_cache: bool = True) -> AsyncIterator[Tuple[str, object]]:
+    """Yield ("delta", text) as tokens arrive, then ("usage", dict | None).
+
+    The upstream stream is read into a queue by a task that holds the LLM limit only until
+    the completion ends, so a client slow to read does not keep a slot from /query.
+    Closing the generator (e.g. the client went away) closes the upstream stream.
+    """
+    emb = await aembed_query(question) if use_cache else None
+    sources = AnswerCache.source_key(snippets)
+    with stage("answer_cache"):
+        cached = answer_cache.get(emb, sources, await _aversion()) if use_cache else None
+    if cached is not None:
+        yield "delta", cached
+        yield "usage", None
+        return
+    parts, usage = [], None
+    messages = build_messages(question, snippets)
+    queue = asyncio.Queue()  # text deltas, then None once the upstream stream ended
+
+    async def read():
+        nonlocal usage
+        try:
+            async with llm_limit:
+                t0 = time.perf_counter()
+                stream = await _aclient().chat.completions.create(
+                    model=OPENAI_CHAT_MODEL,
+                    temperature=0.2,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                first = True
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            usage = chunk.usage.model_dump()
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if first:
+                                metrics.observe_stage("llm_first_token", time.perf_counter() - t0)
+                                first = False
+                            queue.put_nowait(chunk.choices[0].delta.content)
+                metrics.observe_stage("llm", time.perf_counter() - t0)
+        finally:
+            queue.put_nowait(None)
+
+    reader = asyncio.create_task(read())
+    try:
+        while (text := await queue.get()) is not None:
+            parts.append(text)
+            yield "delta", text
+        await reader  # raises what the upstream call raised
+    finally:
+        reader.cancel()
+    metrics.record_usage(usage)
+    if use_cache:
+        answer_cache.put(emb, sources, "".join(parts), await _aversion())
+    yield "usage", usage
@@ -1,105 +1,924 @@
 # app/vector_store.py
-import os, json, pathlib
-from typing import List, Dict, Any
+import os, json, time, shutil, logging, pathlib, threading, contextlib
+from typing import List, Dict, Any, Optional
+from app.lexical import LexicalIndex, LEXICAL_INDEX, rrf
+from app.metrics import stage
 
-VECTOR_DB = os.getenv("VECTOR_DB", "chroma").lower()
-EMBED_DIMS = int(os.getenv("EMBED_DIMS", "1536"))
+log = logging.getLogger(__name__)
+
+VECTOR_DB = os.getenv("VECTOR_DB", "chroma").lower()             # chroma | faiss | qdrant
+EMBED_DIMS = int(os.getenv("EMBED_DIMS", "1536"))                # FAISS dims; longer (Matryoshka) embeddings are truncated to this
+FAISS_PATH = os.getenv("FAISS_PATH", "faiss_index")               # store dir, or root of gen-* generations named by CURRENT
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"                  # serving: map index.bin read-only, pages shared by all workers
+FAISS_RELOAD_INTERVAL = float(os.getenv("FAISS_RELOAD_INTERVAL", "5"))  # seconds between checks for a newly published generation
+FAISS_FLUSH_EVERY = int(os.getenv("FAISS_FLUSH_EVERY", "8192"))  # vectors buffered between index writes
+FAISS_INDEX = os.getenv("FAISS_INDEX", "flat").lower()            # flat | ivf | ivfpq | hnsw
+FAISS_CODEC = os.getenv("FAISS_CODEC", "flat").lower()            # in-memory vector codes: flat (float32) | fp16 | sq8 | pq
+FAISS_RERANK = int(os.getenv("FAISS_RERANK", "4"))                # lossy codes: re-rank top_k * this exactly from vectors.f32; 0 = off
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))                  # IVF lists; 0 = ~4*sqrt(n) at training time
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))                   # PQ sub-quantizers (bytes per vector)
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_TRAIN_SIZE = int(os.getenv("FAISS_TRAIN_SIZE", "50000"))    # IVF variants are trained once this many vectors exist
+HYBRID_FETCH = int(os.getenv("HYBRID_FETCH", "4"))                # hybrid search fuses top_k * this from each ranking
+FAISS_FILTER_EXACT = int(os.getenv("FAISS_FILTER_EXACT", "50000"))  # filters matching at most this many rows are searched exactly
+FILTER_FIELDS = ("language", "identifier")                         # meta fields search(filter=...) can match on
+STORE_VERSION_TTL = float(os.getenv("STORE_VERSION_TTL", "2"))     # Chroma/Qdrant: seconds a looked-up version() is reused
+
+def normalize_filter(filter) -> Dict[str, tuple]:
+    """{"language": "hi", "identifier": ["a", "b"]} -> {field: values}; values are OR'ed, fields AND'ed."""
+    if not filter:
+        return {}
+    if not isinstance(filter, dict):
+        raise ValueError("filter must be an object")
+    out = {}
+    for field, values in filter.items():
+        field = field[len("meta."):] if field.startswith("meta.") else field
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"unknown filter field {field!r} (expected {', '.join(FILTER_FIELDS)})")
+        values = [values] if isinstance(values, str) else values
+        if not isinstance(values, (list, tuple)) or not values or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"filter {field!r} must be a string or a non-empty list of strings")
+        out[field] = tuple(sorted(set(values)))
+    return out
 
 # ------- Common interface -------
 class VectorStore:
+    lexical = None  # LexicalIndex over the chunk texts, maintained by upsert/delete/commit
+    _version, _version_checked = None, float("-inf")
+
     def upsert(self, ids: List[str], texts: List[str], metadatas: List[Dict], vectors: List[List[float]]): ...
-    def search(self, query_vector: List[float], top_k: int = 6) -> List[Dict[str, Any]]: ...
+    # query_vector may also be a 2-D (n, d) array/list; the result is then one hit list per row.
+    # filter restricts hits by meta fields (see normalize_filter), applied inside the store
+    def search(self, query_vector: List[float], top_k: int = 6, filter: Dict = None) -> List[Dict[str, Any]]: ...
+    def commit(self): ...  # persist buffered writes; no-op for stores that write through
+    def publish(self): ...  # make committed writes visible to serving workers (FAISS generations); no-op elsewhere
+    def delete(self, ids: List[str]): ...
+    def size(self) -> int: ...  # live chunks
+    def _read_version(self): ...  # (live chunks, time of the last write) looked up in the backend
+
+    def version(self):
+        """Changes whenever the stored contents change (answer-cache invalidation). Backends that
+        answer over the network or from disk are asked at most every STORE_VERSION_TTL seconds."""
+        if time.monotonic() - self._version_checked >= STORE_VERSION_TTL:
+            self._version, self._version_checked = self._read_version(), time.monotonic()
+        return self._version
+    def _lexical_hits(self, rows_scores) -> List[Dict[str, Any]]: ...  # LexicalIndex (row, score) -> hits
+    def _lexical_rows(self, filter: Dict[str, tuple]): ...  # LexicalIndex rows matching a normalized filter
+
+    # BM25 over the chunk texts, no embedding needed; query_text may be a list (one hit list per query)
+    def lexical_search(self, query_text, top_k: int = 6, filter: Dict = None) -> List[Dict[str, Any]]:
+        if self.lexical is None:
+            raise RuntimeError(f"{type(self).__name__} has no lexical index (LEXICAL_INDEX=0, or not supported by the store)")
+        f = normalize_filter(filter)
+        allowed = self._lexical_rows(f) if f else None
+        batch = not isinstance(query_text, str)
+        with stage("lexical_search"):
+            results = [self._lexical_hits(self.lexical.search(q, top_k, allowed)) for q in (query_text if batch else [query_text])]
+        return results if batch else results[0]
+
+    # vector and lexical rankings fused by reciprocal rank; a 2-D query_vector pairs with a list of texts
+    def hybrid_search(self, query_vector, query_text, top_k: int = 6, filter: Dict = None) -> List[Dict[str, Any]]:
+        batch = _is_batch(query_vector)
+        vec = self.search(query_vector, top_k * HYBRID_FETCH, filter=filter)
+        lex = self.lexical_search(query_text, top_k * HYBRID_FETCH, filter=filter)
+        if not batch:
+            vec, lex = [vec], [lex]
+        fused = [rrf([v, l], top_k) for v, l in zip(vec, lex)]
+        return fused if batch else fused[0]
+
+def _replace_atomic(path: pathlib.Path, write):
+    # write to a sibling temp file, fsync, then rename over the target so readers never see a torn file
+    tmp = path.with_name(path.name + ".tmp")
+    write(str(tmp))
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+@contextlib.contextmanager
+def _file_lock(path: pathlib.Path):
+    # exclusive across processes (uvicorn workers); closing the file releases it
+    try:
+        import fcntl
+    except ImportError:  # Windows: no flock
+        fcntl = None
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+def _truncate(vectors, d):
+    # (n, >= d) -> unit-length (n, d) float32; longer embeddings are cut to d dims (Matryoshka truncation)
+    import numpy as np
+    arr = np.asarray(vectors, dtype="float32")[:, :d]
+    n = (arr**2).sum(axis=1, keepdims=True)**0.5
+    n[n==0] = 1.0
+    return arr / n
+
+def _is_batch(query_vector) -> bool:
+    ndim = getattr(query_vector, "ndim", None)
+    if ndim is not None:
+        return ndim == 2
+    return len(query_vector) > 0 and hasattr(query_vector[0], "__len__")
 
 # ------- Chroma implementation -------
+def _where(f: Dict[str, tuple]) -> Dict:
+    clauses = [{k: v[0]} if len(v) == 1 else {k: {"$in": list(v)}} for k, v in f.items()]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
 class ChromaStore(VectorStore):
-    def __init__(self, path="chromadb"):
+    # read_only: a serving view, which opens the lexical index without writing to it
+    def __init__(self, path="chromadb", read_only=False):
         import chromadb
         path = pathlib.Path(path); path.mkdir(exist_ok=True)
         self.client = chromadb.PersistentClient(path=str(path))
         self.coll = self.client.get_or_create_collection(name="gurumitra")
+        self.read_only = read_only
+        self.lexical = self._open_lexical(path / "lexical") if LEXICAL_INDEX else None
+        self._dirty = False  # written since the last commit
+
+    def _open_lexical(self, path):
+        # A writer rebuilds an index missing or out of step with the collection (a crash, a
+        # store from before the index) from the stored documents; a serving view only builds
+        # a missing one, since it is out of step whenever an ingest is mid-write. The lock
+        # makes one process (uvicorn worker) rebuild while the others wait, then reopen.
+        with _file_lock(path.parent / "lexical.lock"):
+            lex = LexicalIndex(path, read_only=self.read_only)
+            if lex.live() != self.coll.count() and not (self.read_only and lex.state_file.exists()):
+                lex = LexicalIndex(path)
+                lex.reset()
+                for offset in range(0, self.coll.count(), 5000):
+                    got = self.coll.get(limit=5000, offset=offset, include=["documents"])
+                    lex.add(got["ids"], got["documents"])
+                    lex.commit()
+                if self.read_only:
+                    lex = LexicalIndex(path, read_only=True)
+        return lex
 
     def upsert(self, ids, texts, metadatas, vectors):
         self.coll.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=vectors)
+        self._dirty = True
+        if self.lexical is not None:
+            self.lexical.add(ids, texts)
+
+    def delete(self, ids):
+        if ids:
+            self.coll.delete(ids=list(ids))
+            self._dirty = True
+            if self.lexical is not None:
+                self.lexical.delete(ids)
+
+    def commit(self):
+        # the collection writes through; only the lexical index buffers. Writes stamp the
+        # collection metadata, so in-place replacements change version() in every process.
+        if self.lexical is not None:
+            self.lexical.commit()
+        if self._dirty:
+            self.coll.modify(metadata={"updated_at": time.time_ns()})
+            self._dirty, self._version_checked = False, float("-inf")
+
+    def _read_version(self):
+        coll = self.client.get_collection(self.coll.name)
+        return coll.count(), (coll.metadata or {}).get("updated_at")
+
+    def size(self):
+        return self.version()[0]
+
+    @staticmethod
+    def _hit(id_, doc, meta, score):
+        return {"id": id_, "text": doc, "score": score, "source": meta.get("identifier"), "chunk": meta.get("chunk"), "meta": meta}
 
-    def search(self, query_vector, top_k=6):
-        q = self.coll.query(query_embeddings=[query_vector], n_results=top_k, include=["documents","metadatas","distances"])
-        out = []
-        docs = q["documents"][0] if q["documents"] else []
-        metas = q["metadatas"][0] if q["metadatas"] else []
-        dists = q["distances"][0] if q["distances"] else []
-        for i in range(len(docs)):
-            out.append({
-                "text": docs[i],
-                "score": float(dists[i]),          # smaller is closer in Chroma (L2 by default)
-                "source": metas[i].get("identifier"),
-                "chunk": metas[i].get("chunk"),
-                "meta": metas[i],
-            })
-        return out
+    def search(self, query_vector, top_k=6, filter=None):
+        batch = _is_batch(query_vector)
+        queries = [list(map(float, v)) for v in query_vector] if batch else [query_vector]
+        f = normalize_filter(filter)
+        with stage("vector_search"):
+            q = self.coll.query(query_embeddings=queries, n_results=top_k, where=_where(f) if f else None,
+                                include=["documents","metadatas","distances"])
+        results = []
+        for j in range(len(queries)):
+            out = []
+            docs = q["documents"][j] if q["documents"] else []
+            metas = q["metadatas"][j] if q["metadatas"] else []
+            dists = q["distances"][j] if q["distances"] else []
+            for i in range(len(docs)):
+                # smaller is closer in Chroma (L2 by default)
+                out.append(self._hit(q["ids"][j][i], docs[i], metas[i], float(dists[i])))
+            results.append(out)
+        return results if batch else results[0]
+
+    def _lexical_hits(self, rows_scores):
+        if not rows_scores:
+            return []
+        ids = [self.lexical.ids[row] for row, _ in rows_scores]
+        got = self.coll.get(ids=ids, include=["documents", "metadatas"])
+        found = {i: (d, m) for i, d, m in zip(got["ids"], got["documents"], got["metadatas"])}
+        return [self._hit(i, *found[i], score) for i, (_, score) in zip(ids, rows_scores) if i in found]
+
+    def _lexical_rows(self, f):
+        rows = self.lexical._rows()
+        got = self.coll.get(where=_where(f), include=[])
+        return sorted(rows[i] for i in got["ids"] if i in rows)
 
 # ------- FAISS implementation -------
+def build_faiss_index(kind: str, d: int, n: int = 0, nlist: int = FAISS_NLIST, pq_m: int = FAISS_PQ_M, hnsw_m: int = FAISS_HNSW_M,
+                      codec: str = FAISS_CODEC):
+    # Untrained index for `kind` storing `codec` codes, sized for n vectors. All variants use
+    # inner product (cosine on normalized vectors).
+    import faiss
+    codes = {"flat": "Flat", "fp16": "SQfp16", "sq8": "SQ8", "pq": f"PQ{pq_m}"}.get(codec)
+    if codes is None:
+        raise ValueError(f"unknown FAISS_CODEC {codec!r} (expected flat, fp16, sq8 or pq)")
+    if kind == "flat":
+        return faiss.IndexFlatIP(d) if codec == "flat" else faiss.index_factory(d, codes, faiss.METRIC_INNER_PRODUCT)
+    if kind == "hnsw":
+        return faiss.index_factory(d, f"HNSW{hnsw_m},{codes}", faiss.METRIC_INNER_PRODUCT)
+    nlist = nlist or max(1, min(int(4 * n ** 0.5), n // 39))
+    if kind == "ivf":
+        return faiss.index_factory(d, f"IVF{nlist},{codes}", faiss.METRIC_INNER_PRODUCT)
+    if kind == "ivfpq":
+        return faiss.index_factory(d, f"IVF{nlist},PQ{pq_m}", faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"unknown FAISS_INDEX {kind!r} (expected flat, ivf, ivfpq or hnsw)")
+
+def code_size(index) -> int:
+    # bytes stored per vector, excluding IVF list ids and HNSW links
+    storage = getattr(index, "storage", None)  # HNSW keeps its codes in a storage index
+    return (index if storage is None else storage).sa_code_size()
+
+def _read_index(faiss, path: pathlib.Path, mmap: bool):
+    # mmap'd read-only: the codes stay in the page cache, shared by every process mapping
+    # the file. IVF inverted lists map with IO_FLAG_MMAP, flat codes (flat/SQ/PQ/HNSW
+    # storage) with IO_FLAG_MMAP_IFC (faiss >= 1.10; older versions copy them).
+    if not mmap:
+        return faiss.read_index(str(path))
+    with open(path, "rb") as f:
+        ivf = f.read(2) == b"Iw"
+    flag = faiss.IO_FLAG_MMAP if ivf else getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(str(path), flag | faiss.IO_FLAG_READ_ONLY)
+
 class FaissStore(VectorStore):
-    def __init__(self, path="faiss_index"):
+    # read_only: a serving view (see SharedFaissStore) that never writes to the directory;
+    # files past the checkpoint are ignored rather than cut off, and index.bin is mmap'd
+    def __init__(self, path=FAISS_PATH, flush_every=FAISS_FLUSH_EVERY, index_type=FAISS_INDEX,
+                 nlist=FAISS_NLIST, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH, train_size=FAISS_TRAIN_SIZE,
+                 codec=FAISS_CODEC, rerank=FAISS_RERANK, read_only=False):
         import faiss, numpy as np
         self.faiss = faiss
         self.np = np
-        self.path = pathlib.Path(path); self.path.mkdir(exist_ok=True)
+        self.read_only = read_only
+        self.path = pathlib.Path(path)
+        if not read_only:
+            self.path.mkdir(exist_ok=True)
         self.index_file = self.path / "index.bin"
-        self.payload_file = self.path / "payload.jsonl"
+        self.vectors_file = self.path / "vectors.f32"      # normalized float32 rows, source for training/rebuilds
+        self.checkpoint_file = self.path / "checkpoint.json"
+        self.deleted_file = self.path / "deleted.u64"      # tombstoned row numbers (delete / replaced ids)
         self.d = EMBED_DIMS
+        self.flush_every = flush_every
+        self.index_type, self.nlist, self.nprobe, self.ef_search = index_type, nlist, nprobe, ef_search
+        self.train_size = train_size
+        self.codec, self.rerank = codec, rerank
+        self._pending = []     # normalized vector batches added since the last commit
+        self._pending_n = 0
+        self._exact = None     # flat stand-in while an IVF index is still untrained
+        self._id_rows = None   # id -> live row, built on the first write that needs it
+        self._deleted_pending = []
+        self._sel = None
+        self._filters, self._filters_version = {}, None  # normalized filter -> (rows, selector)
+        self.filter_exact = FAISS_FILTER_EXACT
 
-        if self.index_file.exists() and self.payload_file.exists():
-            self.index = faiss.read_index(str(self.index_file))
-            self.payloads = [json.loads(l) for l in self.payload_file.read_text(encoding="utf-8").splitlines() if l.strip()]
+        if self.index_file.exists():
+            self.index = _read_index(faiss, self.index_file, read_only and FAISS_MMAP)
+            self.d = self.index.d
+        else:
+            self.index = build_faiss_index(index_type, self.d, nlist=nlist, codec=codec)
+        if self.checkpoint_file.exists():
+            checkpoint = json.loads(self.checkpoint_file.read_text())
         else:
-            # Cosine via inner product on normalized vectors
-            self.index = faiss.IndexFlatIP(self.d)
-            self.payloads = []
+            checkpoint = {"count": self.index.ntotal}  # pre-checkpoint layout
+        count = checkpoint["count"]
+        self.payloads = self._open_payloads(count)
+        self.meta_columns = self._open_meta(count)
+        self._open_vectors(count)
+        self._open_deleted(checkpoint.get("deleted", 0))
+        self.lexical = self._open_lexical(count) if LEXICAL_INDEX else None
+        self._catch_up(count)
+        self._tune()
+        if not read_only and not self.checkpoint_file.exists():
+            self._write_checkpoint()
+
+    def _open_payloads(self, n):
+        from app.payload_store import PayloadStore
+        if self.read_only:
+            payloads = PayloadStore(self.path, count=n)
+            if len(payloads) != n:
+                raise RuntimeError(f"{self.path} has {len(payloads)} payload records, checkpoint has {n}")
+            return payloads
+        payloads = PayloadStore(self.path)
+        legacy = self.path / "payload.jsonl"
+        if legacy.exists() and len(payloads) == 0 and n:
+            payloads.import_jsonl(legacy, n)
+            legacy.unlink()
+        # checkpoint.json is the commit point: records past its count come from an
+        # interrupted commit and are cut off here.
+        if len(payloads) > n:
+            payloads.truncate(n)
+        if len(payloads) != n:
+            raise RuntimeError(f"{self.path} has {len(payloads)} payload records, checkpoint has {n}")
+        return payloads
+
+    def _open_meta(self, n):
+        # field -> MetaColumn (meta-<field>.u32/.json), written with each commit. A store from
+        # before the columns gets them on its next writable open; a read-only view of one
+        # decodes the payloads on its first filter on that field (_meta_rows).
+        from app.payload_store import MetaColumn
+        cols = {}
+        for field in FILTER_FIELDS:
+            col = MetaColumn(self.path, f"meta-{field}", count=n if self.read_only else None)
+            if self.read_only:
+                if len(col) == n:
+                    cols[field] = col
+                continue
+            col.codes_file.touch()
+            if len(col) > n:
+                col.truncate(n)
+            elif len(col) < n:
+                for row in range(len(col), n):
+                    col.append(self.payloads[row]["meta"].get(field))
+                col.flush()
+            cols[field] = col
+        return cols
+
+    def _open_vectors(self, n):
+        row = self.d * 4
+        if self.read_only:
+            rows = self.vectors_file.stat().st_size // row if self.vectors_file.exists() else 0
+            if rows < n:
+                raise RuntimeError(f"{self.vectors_file} has {rows} vectors, checkpoint has {n}")
+            return
+        self.vectors_file.touch()
+        rows = self.vectors_file.stat().st_size // row
+        if rows == 0 and n and self.index.ntotal == n:
+            # older directories only kept index.bin; recover the raw vectors from it
+            with self.vectors_file.open("wb") as f:
+                for i in range(0, n, 65536):
+                    f.write(self.index.reconstruct_n(i, min(65536, n - i)).astype("float32").tobytes())
+            rows = n
+        if rows > n or self.vectors_file.stat().st_size != rows * row:
+            os.truncate(self.vectors_file, min(rows, n) * row)
+            rows = min(rows, n)
+        if rows != n:
+            raise RuntimeError(f"{self.vectors_file} has {rows} vectors, checkpoint has {n}")
+
+    def _open_deleted(self, n):
+        if self.read_only:
+            found = self.deleted_file.exists() and n
+            self.deleted = set(self.np.fromfile(self.deleted_file, dtype="<u8", count=n).tolist()) if found else set()
+            return
+        self.deleted_file.touch()
+        if self.deleted_file.stat().st_size > n * 8:
+            os.truncate(self.deleted_file, n * 8)
+        self.deleted = set(self.np.fromfile(self.deleted_file, dtype="<u8").tolist())
+
+    def _open_lexical(self, n):
+        # lexical rows are payload rows; a missing index, or one out of step after a crash,
+        # is rebuilt from the payloads. A serving view cannot rebuild: it goes without one
+        # (vector search only), e.g. for a generation ingested with LEXICAL_INDEX=0
+        lex = LexicalIndex(self.path / "lexical", read_only=self.read_only)
+        if self.read_only and (lex.rows != n or lex.deleted != self.deleted):
+            return None
+        if lex.rows != n or lex.deleted != self.deleted:
+            lex.reset()
+            for start in range(0, n, 65536):
+                recs = [self.payloads[row] for row in range(start, min(start + 65536, n))]
+                lex.add([p["id"] for p in recs], [p["text"] for p in recs])
+                lex.commit()
+            lex.delete_rows(self.deleted)
+            lex.commit()
+        return lex
+
+    def _ids(self):
+        # one pass over the payloads; only writers (upsert/delete) need it
+        if self._id_rows is None:
+            self._id_rows = {}
+            for row in range(len(self.payloads)):
+                if row not in self.deleted:
+                    self._id_rows[self.payloads[row]["id"]] = row
+        return self._id_rows
+
+    def _tombstone(self, row):
+        self.deleted.add(row)
+        self._deleted_pending.append(row)
+        self._sel = None
+
+    def _vectors(self):
+        # committed vectors as a read-only (n, d) memmap (a published generation's file may
+        # have rows appended past its checkpoint)
+        size = self.vectors_file.stat().st_size if self.vectors_file.exists() else 0
+        rows = min(size // (self.d * 4), len(self.payloads) - self._pending_n)
+        if not rows:
+            return self.np.zeros((0, self.d), dtype="float32")
+        return self.np.memmap(self.vectors_file, dtype="float32", mode="r", shape=(rows, self.d))
+
+    def _catch_up(self, n):
+        # the index is written after the checkpoint, so it can lag behind it (or be
+        # untrained); bring it up to date from vectors.f32
+        if self.read_only and self.index.ntotal != n:
+            # lagging (or mmap'd, hence immutable) index: private copy, caught up in memory only
+            self.index = self.faiss.read_index(str(self.index_file)) if self.index_file.exists() else self.index
+        if self.index.ntotal > n:
+            self.index.reset()
+        if not self.index.is_trained:
+            if n >= self.train_size and not self.read_only:
+                self.rebuild()
+            return  # read-only: untrained IVF is searched exactly (_searcher)
+        x = self._vectors()
+        for i in range(self.index.ntotal, n, 65536):
+            self.index.add(self.np.ascontiguousarray(x[i:min(i + 65536, n)]))
+
+    def _tune(self):
+        ivf = self.faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            ivf.nprobe = self.nprobe
+        hnsw = getattr(self.index, "hnsw", None)
+        if hnsw is not None:
+            hnsw.efSearch = self.ef_search
+        self._lossy = code_size(self.index) < 4 * self.d  # fp16/sq8/pq codes: results get re-ranked
+
+    def _writable(self):
+        if self.read_only:
+            raise RuntimeError(f"{self.path} is opened read-only")
+
+    def rebuild(self, index_type=None, codec=None):
+        """Rebuild the index from the committed vectors, training it first if the type needs it."""
+        self._writable()
+        np = self.np
+        self.index_type = index_type or self.index_type
+        self.codec = codec or self.codec
+        x = self._vectors()
+        index = build_faiss_index(self.index_type, self.d, len(x), nlist=self.nlist, codec=self.codec)
+        if not index.is_trained:
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(len(x), min(len(x), 100_000), replace=False))
+            index.train(np.ascontiguousarray(x[sample]))
+        for i in range(0, len(x), 65536):
+            index.add(np.ascontiguousarray(x[i:i + 65536]))
+        self.index, self._exact = index, None
+        self._tune()
+        _replace_atomic(self.index_file, lambda tmp: self.faiss.write_index(self.index, tmp))
 
     def _normalize(self, arr):
-        # arr: (n, d)
-        n = (arr**2).sum(axis=1, keepdims=True)**0.5
-        n[n==0] = 1.0
-        return arr / n
+        return _truncate(arr, self.d)
 
     def upsert(self, ids, texts, metadatas, vectors):
         import numpy as np
+        self._writable()
         vec = np.array(vectors, dtype="float32")
         vec = self._normalize(vec)
-        # append
-        self.index.add(vec)
+        # append; disk writes are deferred to commit()
+        if self.index.is_trained:
+            self.index.add(vec)
+        rows = self._ids()
         for i in range(len(texts)):
+            # an existing id is replaced: its old row is tombstoned
+            old = rows.get(ids[i])
+            if old is not None:
+                self._tombstone(old)
+            rows[ids[i]] = len(self.payloads)
+            for field, col in self.meta_columns.items():
+                col.append(metadatas[i].get(field))
             self.payloads.append({"id": ids[i], "text": texts[i], "meta": metadatas[i]})
-        # persist
-        self.faiss.write_index(self.index, str(self.index_file))
-        with self.payload_file.open("w", encoding="utf-8") as f:
-            for p in self.payloads:
-                f.write(json.dumps(p, ensure_ascii=False) + "\n")
+        if self.lexical is not None:
+            self.lexical.add(ids, texts)
+        self._pending.append(vec)
+        self._pending_n += len(vec)
+        if self._pending_n >= self.flush_every:
+            self.commit()
+
+    def delete(self, ids):
+        self._writable()
+        rows = self._ids()
+        for i in ids:
+            row = rows.pop(i, None)
+            if row is not None:
+                self._tombstone(row)
+        if self.lexical is not None:
+            self.lexical.delete(ids)
+
+    def commit(self):
+        if not self._pending and not self._deleted_pending:
+            return
+        # payloads, vectors and tombstones first (append-only), then the checkpoint, then
+        # the index, each via atomic rename: a crash leaves either extra records that
+        # the _open_* methods trim, or an index that _catch_up extends.
+        self.payloads.flush()
+        for col in self.meta_columns.values():
+            col.flush()
+        with self.vectors_file.open("ab") as f:
+            for v in self._pending:
+                f.write(v.tobytes())
+            f.flush(); os.fsync(f.fileno())
+        with self.deleted_file.open("ab") as f:
+            f.write(self.np.array(self._deleted_pending, dtype="<u8").tobytes())
+            f.flush(); os.fsync(f.fileno())
+        if self.lexical is not None:
+            self.lexical.commit()
+        added = bool(self._pending)
+        self._pending, self._pending_n, self._deleted_pending = [], 0, []
+        self._write_checkpoint()
+        if not self.index.is_trained and len(self.payloads) >= self.train_size:
+            self.rebuild()
+        elif added:  # deletions alone never touch the index
+            _replace_atomic(self.index_file, lambda tmp: self.faiss.write_index(self.index, tmp))
+
+    flush = commit
+
+    def _write_checkpoint(self):
+        checkpoint = {"count": len(self.payloads), "deleted": len(self.deleted)}
+        _replace_atomic(self.checkpoint_file, lambda tmp: pathlib.Path(tmp).write_text(json.dumps(checkpoint)))
+
+    def publish(self):
+        """Commit, then make this directory the generation serving workers use, if it is one
+        (opened on a stage_generation() path)."""
+        self.commit()
+        if self.path.name.startswith("gen-"):
+            publish_generation(self.path)
+
+    def version(self):
+        return len(self.payloads), len(self.deleted)
+
+    def size(self):
+        return len(self.payloads) - len(self.deleted)
 
-    def search(self, query_vector, top_k=6):
+    def _searcher(self):
+        if self.index.is_trained:
+            return self.index
+        # IVF variants below train_size: exact search over the raw vectors until rebuild()
+        if self._exact is None or self._exact.ntotal != len(self.payloads):
+            self._exact = self.faiss.IndexFlatIP(self.d)
+            self._exact.add(self.np.ascontiguousarray(self._vectors()))
+            for v in self._pending:
+                self._exact.add(v)
+        return self._exact
+
+    def _meta_rows(self, field, values):
+        col = self.meta_columns.get(field)
+        if col is None:  # read-only view of a store written before the columns
+            from app.payload_store import MetaColumn
+            col = self.meta_columns[field] = MetaColumn(self.path, f"meta-{field}", count=0)
+            for row in range(len(self.payloads)):
+                col.append(self.payloads[row]["meta"].get(field))
+        return col.rows(values)
+
+    def _filter(self, f):
+        # live rows matching a normalized filter (sorted int64) and an ID selector over them,
+        # cached until the next write
+        if self._filters_version != self.version() or len(self._filters) > 64:
+            self._filters, self._filters_version = {}, self.version()
+        key = tuple(f.items())
+        if key not in self._filters:
+            np = self.np
+            rows = None
+            for field, values in f.items():
+                r = self._meta_rows(field, values)
+                rows = r if rows is None else np.intersect1d(rows, r, assume_unique=True)
+            if self.deleted:
+                rows = rows[~np.isin(rows, np.fromiter(self.deleted, dtype="int64"))]
+            self._filters[key] = (rows, None)
+        return self._filters[key][0]
+
+    def _filter_selector(self, f):
+        rows, key = self._filter(f), tuple(f.items())
+        sel = self._filters[key][1]
+        if sel is None:
+            sel = self.faiss.IDSelectorBatch(rows)
+            self._filters[key] = (rows, sel)
+        return sel
+
+    def _lexical_rows(self, f):
+        return self._filter(f)
+
+    def _row_vectors(self, rows):
+        # normalized vectors for sorted rows, committed (memmap) or still pending
+        np = self.np
+        x = self._vectors()
+        if not len(rows) or rows[-1] < len(x):
+            return x[rows]
+        pending = np.concatenate(self._pending)
+        return np.concatenate((x[rows[rows < len(x)]], pending[rows[rows >= len(x)] - len(x)]))
+
+    def _exact_search(self, q, rows, top_k):
+        # brute force over the filtered rows only: cheaper than a selector scan for
+        # selective filters, and never short of hits the way a probed IVF list can be
+        np = self.np
+        sims = np.full((len(q), top_k), -np.inf, dtype="float32")
+        idxs = np.full((len(q), top_k), -1, dtype="int64")
+        k = min(top_k, len(rows))
+        if k:
+            s = q @ self._row_vectors(rows).T
+            top = np.argpartition(-s, k - 1, axis=1)[:, :k]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(s, top, 1), axis=1), 1)
+            sims[:, :k] = np.take_along_axis(s, top, 1)
+            idxs[:, :k] = rows[top]
+        return sims, idxs
+
+    def _rerank(self, q, sims, idxs, top_k):
+        # exact float32 scores for the candidates, read from vectors.f32 (page cache, not the heap)
+        np = self.np
+        rows = np.unique(idxs[idxs >= 0])
+        if not len(rows):
+            return sims[:, :top_k], idxs[:, :top_k]
+        v = self._row_vectors(rows)[np.searchsorted(rows, np.maximum(idxs, 0))]
+        s = np.einsum("qd,qkd->qk", q, v)
+        s[idxs < 0] = -np.inf
+        order = np.argsort(-s, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(s, order, 1), np.take_along_axis(idxs, order, 1)
+
+    def _search_params(self, index, f=None):
+        # tombstoned rows (or, with a filter, everything but the matching live rows) are
+        # excluded inside faiss via an ID selector
+        faiss = self.faiss
+        if f:
+            sel = self._filter_selector(f)
+        elif not self.deleted:
+            return None
+        else:
+            if self._sel is None:
+                self._sel_batch = faiss.IDSelectorBatch(self.np.fromiter(self.deleted, dtype="int64"))
+                self._sel = faiss.IDSelectorNot(self._sel_batch)  # keeps a raw pointer to _sel_batch
+            sel = self._sel
+        if faiss.try_extract_index_ivf(index) is not None:
+            return faiss.SearchParametersIVF(sel=sel, nprobe=self.nprobe)
+        if hasattr(index, "hnsw"):
+            return faiss.SearchParametersHNSW(sel=sel, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=sel)
+
+    def _post_filter_search(self, index, q, k, rows):
+        # for indexes without ID selector support (IndexPQ): over-fetch, drop tombstoned rows
+        # (or rows outside the filter's live `rows`), widening until each query has k hits
+        np = self.np
+        dead = np.fromiter(self.deleted, dtype="int64") if self.deleted else None
+        fetch = k + len(self.deleted) if rows is None else k * max(1, index.ntotal // max(1, len(rows)))
+        while True:
+            fetch = min(fetch, index.ntotal)
+            sims, idxs = index.search(q, fetch)
+            ok = idxs >= 0
+            if rows is not None:
+                ok &= np.isin(idxs, rows)
+            elif dead is not None:
+                ok &= ~np.isin(idxs, dead)
+            if fetch >= index.ntotal or ok.sum(axis=1).min() >= k:
+                break
+            fetch *= 2
+        order = np.argsort(~ok, axis=1, kind="stable")[:, :k]
+        sims, idxs = np.where(ok, sims, -np.inf), np.where(ok, idxs, -1)
+        return np.take_along_axis(sims, order, 1), np.take_along_axis(idxs, order, 1)
+
+    def search(self, query_vector, top_k=6, filter=None):
         import numpy as np
-        if self.index.ntotal == 0:
-            return []
-        q = np.array([query_vector], dtype="float32")
+        batch = _is_batch(query_vector)
+        q = np.array(query_vector if batch else [query_vector], dtype="float32")
+        f = normalize_filter(filter)
+        index = self._searcher()
+        if index.ntotal == 0:
+            return [[] for _ in q] if batch else []
         q = self._normalize(q)
-        sims, idxs = self.index.search(q, top_k)  # inner product ~ cosine
-        out = []
-        for rank, (score, idx) in enumerate(zip(sims[0], idxs[0])):
-            if idx == -1: continue
-            p = self.payloads[idx]
-            m = p["meta"]
-            out.append({
-                "text": p["text"],
-                "score": float(score),             # higher is closer for IP/cosine
-                "source": m.get("identifier"),
-                "chunk": m.get("chunk"),
-                "meta": m
-            })
-        return out
+        rows = self._filter(f) if f else None
+        if rows is not None and len(rows) <= self.filter_exact:
+            with stage("vector_search"):
+                sims, idxs = self._exact_search(q, rows, top_k)
+        else:
+            fetch = top_k * self.rerank if self.rerank > 1 and self._lossy and index is self.index else top_k
+            with stage("vector_search"):
+                if isinstance(index, self.faiss.IndexPQ) and (f or self.deleted):
+                    sims, idxs = self._post_filter_search(index, q, fetch, rows)
+                else:  # inner product ~ cosine, one matrix search for all rows
+                    sims, idxs = index.search(q, fetch, params=self._search_params(index, f))
+            if fetch > top_k:
+                with stage("rerank"):
+                    sims, idxs = self._rerank(q, sims, idxs, top_k)
+        # higher is closer for IP/cosine
+        results = [[self._hit(idx, score) for score, idx in zip(row_sims, row_idxs) if idx != -1]
+                   for row_sims, row_idxs in zip(sims, idxs)]
+        return results if batch else results[0]
+
+    def _hit(self, row, score):
+        p = self.payloads[row]
+        m = p["meta"]
+        return {"id": p["id"], "text": p["text"], "score": float(score), "source": m.get("identifier"), "chunk": m.get("chunk"), "meta": m}
+
+    def _lexical_hits(self, rows_scores):
+        return [self._hit(row, score) for row, score in rows_scores]
+
+# ------- FAISS generations -------
+# FAISS_PATH/CURRENT names the published generation, a complete FaissStore directory
+# gen-NNNNNN. An ingest writes into a staged copy (resumed by the next ingest if it stops
+# before publishing) and publishes it by replacing CURRENT; serving workers (SharedFaissStore)
+# notice and swap to it. The copy is made of hard links: store files are only appended to
+# (readers stop at their own checkpoint) or replaced by rename, so generations share their
+# bytes on disk and in the page cache.
+def current_generation(root=FAISS_PATH) -> Optional[pathlib.Path]:
+    f = pathlib.Path(root) / "CURRENT"
+    return f.parent / f.read_text().strip() if f.exists() else None
+
+def _link_tree(src: pathlib.Path, dst: pathlib.Path):
+    dst.mkdir()
+    for p in src.iterdir():
+        if p.name == "CURRENT" or p.name.startswith("gen-") or p.name.endswith((".tmp", ".lock")):
+            continue
+        if p.is_dir():
+            _link_tree(p, dst / p.name)
+        else:
+            try:
+                os.link(p, dst / p.name)
+            except OSError:  # no hard links here (filesystem, permissions)
+                shutil.copy2(p, dst / p.name)
+
+def _generations(root: pathlib.Path) -> List[pathlib.Path]:
+    return sorted(g for g in root.glob("gen-*") if not g.name.endswith(".tmp"))
+
+def stage_generation(root=FAISS_PATH) -> pathlib.Path:
+    """Generation directory for an ingest to write into.
+
+    A staged generation newer than the published one is left by an ingest that stopped
+    before publish(); it is resumed, since the ingest manifest already counts what it
+    committed there. Otherwise a new one is made: a copy of the published generation, or
+    of a store kept directly in root (the layout before generations), or empty.
+    """
+    root = pathlib.Path(root); root.mkdir(parents=True, exist_ok=True)
+    gens, current = _generations(root), current_generation(root)
+    if gens and (current is None or gens[-1].name > current.name):
+        return gens[-1]
+    new = root / f"gen-{int(gens[-1].name[4:]) + 1 if gens else 1:06d}"
+    tmp = new.with_name(new.name + ".tmp")  # renamed into place once complete
+    shutil.rmtree(tmp, ignore_errors=True)
+    src = current or (root if (root / "checkpoint.json").exists() or (root / "index.bin").exists() else None)
+    if src is None:
+        tmp.mkdir()
+    else:
+        _link_tree(src, tmp)
+    os.rename(tmp, new)
+    return new
+
+def publish_generation(path):
+    """Point CURRENT at a committed generation. The previous one is kept for workers that have
+    not swapped yet; older (or abandoned staged) generations are removed, which does not
+    disturb a process that still has their files mapped."""
+    path = pathlib.Path(path)
+    root, previous = path.parent, current_generation(path.parent)
+    _replace_atomic(root / "CURRENT", lambda tmp: pathlib.Path(tmp).write_text(path.name))
+    for g in _generations(root):
+        if g.name < path.name and g != previous:
+            shutil.rmtree(g, ignore_errors=True)
+
+class SharedFaissStore:
+    """Read-only FaissStore over the published generation under root, for serving.
+
+    Every worker maps the same files, so index, vectors and payloads are held once in the
+    page cache rather than once per process. At most every FAISS_RELOAD_INTERVAL seconds an
+    access checks CURRENT; a newly published generation is opened in a background thread
+    and swapped in whole, while requests already running finish on the old one.
+    """
+
+    def __init__(self, root=FAISS_PATH, interval=FAISS_RELOAD_INTERVAL):
+        self.root, self.interval = pathlib.Path(root), interval
+        self._lock = threading.Lock()
+        self.generation = current_generation(self.root) or self._migrate()
+        self.store = FaissStore(self.generation or self.root, read_only=True)
+        self._checked = time.monotonic()
+
+    def _migrate(self) -> Optional[pathlib.Path]:
+        # a store kept directly in root (before generations: maybe payload.jsonl, no
+        # checkpoint or lexical index) cannot be opened read-only; publish it once as a
+        # generation, opened writable, which brings it up to date
+        if not ((self.root / "checkpoint.json").exists() or (self.root / "index.bin").exists()):
+            return None
+        try:
+            with _file_lock(self.root / "migrate.lock"):  # one worker migrates, the others wait for it
+                if current_generation(self.root) is None:
+                    FaissStore(stage_generation(self.root)).publish()
+                return current_generation(self.root)
+        except OSError:  # read-only filesystem: serve root as it is
+            log.exception("FAISS store migration failed; serving %s as it is", self.root)
+            return None
+
+    def current(self) -> FaissStore:
+        if time.monotonic() - self._checked >= self.interval and self._lock.acquire(blocking=False):
+            self._checked = time.monotonic()
+            threading.Thread(target=self._reload, daemon=True).start()
+        return self.store
+
+    def _reload(self):
+        try:
+            gen = current_generation(self.root)
+            if gen is not None and gen != self.generation:
+                store = FaissStore(gen, read_only=True)
+                self.store, self.generation = store, gen  # one assignment: callers see old or new
+        except Exception:  # keep serving the old generation
+            log.exception("FAISS generation reload failed; still serving %s", self.generation)
+        finally:
+            self._lock.release()
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+# ------- Qdrant implementation -------
+class QdrantStore(VectorStore):
+    # points carry a UUID derived from the chunk id; the payload is {"text", "chunk_id", **meta}.
+    # Upserts are buffered and sent by commit() through upload_points (batched, parallel).
+    # Vectors are cut to EMBED_DIMS, the collection's size, like FaissStore's.
+    def __init__(self, client=None, collection=None, flush_every=FAISS_FLUSH_EVERY, dims=EMBED_DIMS):
+        from app import qdrant_utils as qu
+        from qdrant_client.http import models as qm
+        self.qu, self.qm = qu, qm
+        self.qd = client or qu.get_client()
+        self.d = dims
+        self.collection = qu.ensure_collection(self.qd, collection or qu.COLLECTION, dims=dims)
+        self.flush_every = flush_every
+        self._pending = {}  # point id -> PointStruct; a later upsert of the same id wins
+        self._dirty = False  # deleted since the last commit
+        self._search_params = None
+        if qu.QDRANT_QUANTIZATION != "none":
+            self._search_params = qm.SearchParams(quantization=qm.QuantizationSearchParams(
+                rescore=True, oversampling=qu.QDRANT_OVERSAMPLING))
+
+    def upsert(self, ids, texts, metadatas, vectors):
+        vecs = _truncate(vectors, self.d)
+        for i in range(len(texts)):
+            pid = self.qu.point_id(ids[i])
+            self._pending[pid] = self.qm.PointStruct(id=pid, vector=vecs[i].tolist(),
+                                                     payload={**metadatas[i], "text": texts[i], "chunk_id": ids[i]})
+        if len(self._pending) >= self.flush_every:
+            self.commit()
+
+    def delete(self, ids):
+        pids = [self.qu.point_id(i) for i in ids]
+        for pid in pids:
+            self._pending.pop(pid, None)
+        if pids:
+            self.qd.delete(collection_name=self.collection, points_selector=self.qm.PointIdsList(points=pids), wait=True)
+            self._dirty = True
+
+    def commit(self):
+        # writes stamp the collection metadata (Qdrant and qdrant-client >= 1.16): points_count
+        # alone misses in-place replacements
+        if not self._pending and not self._dirty:
+            return
+        points, self._pending = list(self._pending.values()), {}
+        if points:
+            self.qd.upload_points(self.collection, points, batch_size=self.qu.QDRANT_UPLOAD_BATCH,
+                                  parallel=self.qu.QDRANT_UPLOAD_PARALLEL, wait=True)
+        self.qd.update_collection(self.collection, metadata={"updated_at": time.time_ns()})
+        self._dirty, self._version_checked = False, float("-inf")
+
+    flush = commit
+
+    def _read_version(self):
+        info = self.qd.get_collection(self.collection)
+        return info.points_count, (info.config.metadata or {}).get("updated_at")
+
+    def size(self):
+        return self.version()[0]
+
+    def _filter(self, filter):
+        f = normalize_filter(filter)
+        if not f:
+            return None
+        qm = self.qm
+        return qm.Filter(must=[qm.FieldCondition(key=k, match=qm.MatchAny(any=list(v))) for k, v in f.items()])
+
+    @staticmethod
+    def _hit(point):
+        meta = dict(point.payload)
+        text, chunk_id = meta.pop("text", ""), meta.pop("chunk_id", str(point.id))
+        return {"id": chunk_id, "text": text, "score": point.score, "source": meta.get("identifier"), "chunk": meta.get("chunk"), "meta": meta}
+
+    def search(self, query_vector, top_k=6, filter=None):
+        batch = _is_batch(query_vector)
+        queries = _truncate(query_vector if batch else [query_vector], self.d).tolist()
+        flt = self._filter(filter)
+        with stage("vector_search"):
+            if len(queries) == 1:
+                responses = [self.qd.query_points(self.collection, query=queries[0], query_filter=flt, limit=top_k,
+                                                  search_params=self._search_params, with_payload=True)]
+            else:  # one round trip for the whole batch
+                responses = self.qd.query_batch_points(self.collection, requests=[
+                    self.qm.QueryRequest(query=q, filter=flt, limit=top_k, params=self._search_params, with_payload=True)
+                    for q in queries])
+        results = [[self._hit(p) for p in r.points] for r in responses]  # higher is closer (cosine)
+        return results if batch else results[0]
 
 # ------- Factory -------
-def get_store() -> VectorStore:
+def get_store(read_only: bool = False) -> VectorStore:
+    # read_only: serving; FAISS then follows published generations instead of writing a new one
     if VECTOR_DB == "faiss":
-        return FaissStore()
+        return SharedFaissStore() if read_only else FaissStore(stage_generation())
+    if VECTOR_DB == "qdrant":
+        return QdrantStore()
     else:
-        return ChromaStore()  # default
+        return ChromaStore(read_only=read_only)  # default
+
+def has_lexical_index() -> bool:
+    # whether get_store()'s backend keeps the BM25 index (lexical/hybrid search); Qdrant does not
+    return LEXICAL_INDEX and VECTOR_DB != "qdrant"
@@ -0,0 +1,122 @@
+# bench/ann_recall.py
+# Recall@k, single-query latency and memory of the FAISS index modes, codecs and truncated
+# dimensions against the exact full-dimension float32 (flat) baseline.
+#   python -m bench.ann_recall --index-dir faiss_index
+#   python -m bench.ann_recall --synthetic 200000 --configs ivf:nprobe=8,ivf:nprobe=32,hnsw:ef=64
+#   python -m bench.ann_recall --configs flat:codec=sq8,flat:codec=sq8;rerank=4,flat:dims=512,flat:codec=pq;m=96;rerank=8
+import time, json, argparse, pathlib
+import numpy as np
+import faiss
+from app.vector_store import build_faiss_index, code_size, FAISS_PQ_M
+
+DEFAULT_CONFIGS = ("ivf:nprobe=8,ivf:nprobe=32,ivfpq:nprobe=16,ivfpq:nprobe=64,hnsw:ef=32,hnsw:ef=128,"
+                   "flat:codec=fp16,flat:codec=sq8,flat:codec=sq8;rerank=4,flat:codec=pq;rerank=8,"
+                   "flat:dims=768,flat:dims=512,flat:dims=256;rerank=0,hnsw:ef=64;codec=sq8;rerank=4")
+
+def load_vectors(index_dir: pathlib.Path, dims: int) -> np.ndarray:
+    f = index_dir / "vectors.f32"
+    return np.memmap(f, dtype="float32", mode="r").reshape(-1, dims)
+
+def synthetic_vectors(n: int, dims: int, seed: int = 0) -> np.ndarray:
+    # clustered gaussians: closer to real embedding distributions than uniform noise. Variance
+    # decays along the dimensions, as in Matryoshka-trained embeddings, so truncation is not
+    # penalized as it would be on isotropic noise; use --index-dir for real numbers.
+    rng = np.random.default_rng(seed)
+    scale = (1.0 + np.arange(dims, dtype="float32") / 64) ** -0.5
+    centers = rng.standard_normal((max(1, n // 500), dims)).astype("float32")
+    x = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dims)).astype("float32")
+    x *= scale
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def truncate(x: np.ndarray, dims: int) -> np.ndarray:
+    x = np.ascontiguousarray(x[:, :dims], dtype="float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def make_queries(x: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    # perturbed corpus rows stand in for questions that land near a chunk
+    rng = np.random.default_rng(seed)
+    q = np.array(x[rng.choice(len(x), n, replace=False)]) + 0.05 * rng.standard_normal((n, x.shape[1])).astype("float32")
+    return (q / np.linalg.norm(q, axis=1, keepdims=True)).astype("float32")
+
+def parse_config(spec: str):
+    kind, _, rest = spec.partition(":")
+    params = dict(kv.split("=") for kv in rest.split(";") if kv) if rest else {}
+    return kind, {k: v if k == "codec" else int(v) for k, v in params.items()}
+
+def build(kind: str, x: np.ndarray, params: dict):
+    t0 = time.perf_counter()
+    index = build_faiss_index(kind, x.shape[1], len(x), nlist=params.get("nlist", 0), pq_m=params.get("m", FAISS_PQ_M),
+                              codec=params.get("codec", "flat"))
+    if not index.is_trained:
+        sample = np.random.default_rng(0).choice(len(x), min(len(x), 100_000), replace=False)
+        index.train(np.ascontiguousarray(x[np.sort(sample)]))
+    for i in range(0, len(x), 65536):
+        index.add(np.ascontiguousarray(x[i:i + 65536]))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and "nprobe" in params:
+        ivf.nprobe = params["nprobe"]
+    if hasattr(index, "hnsw") and "ef" in params:
+        index.hnsw.efSearch = params["ef"]
+    return index, time.perf_counter() - t0
+
+def run(index, queries: np.ndarray, k: int, x: np.ndarray = None, rerank: int = 0):
+    # rerank > 1: fetch k * rerank candidates and re-score them exactly from the float32 rows
+    # in x, as FaissStore does with vectors.f32
+    lat, ids = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, I = index.search(q[None, :], k * rerank if rerank > 1 else k)
+        if rerank > 1:
+            cand = I[0][I[0] >= 0]
+            I = cand[np.argsort(-(x[cand] @ q), kind="stable")[:k]][None, :]
+        lat.append((time.perf_counter() - t0) * 1000)
+        ids.append(I[0])
+    return np.array(ids), np.array(lat)
+
+def memory(index) -> dict:
+    # resident size of the index; vectors.f32 for re-ranking stays on disk (page cache)
+    size = len(faiss.serialize_index(index))
+    return {"bytes_per_vector": code_size(index), "mb_per_million": size / max(1, index.ntotal) * 1e6 / 2**20}
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall@k / latency of FAISS index modes vs flat.")
+    ap.add_argument("--index-dir", type=str, default=None, help="FaissStore directory (uses its vectors.f32)")
+    ap.add_argument("--synthetic", type=int, default=100_000, help="Synthetic corpus size when no --index-dir")
+    ap.add_argument("--dims", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=6)
+    ap.add_argument("--configs", type=str, default=DEFAULT_CONFIGS,
+                    help="Comma list of kind[:param=v;param=v], params: nlist, nprobe, m (PQ bytes), ef")
+    ap.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = ap.parse_args()
+
+    x = load_vectors(pathlib.Path(args.index_dir), args.dims) if args.index_dir else synthetic_vectors(args.synthetic, args.dims)
+    queries = make_queries(x, min(args.queries, len(x)))
+    print(f"corpus={len(x)} dims={x.shape[1]} queries={len(queries)} k={args.k}")
+
+    flat, build_s = build("flat", x, {})
+    truth, lat = run(flat, queries, args.k)
+    results = [{"config": "flat", "recall": 1.0, "p50_ms": float(np.percentile(lat, 50)),
+                "p99_ms": float(np.percentile(lat, 99)), "build_s": build_s, **memory(flat)}]
+    del flat
+
+    for spec in args.configs.split(","):
+        kind, params = parse_config(spec)
+        dims = params.get("dims", x.shape[1])
+        xs, qs = (truncate(x, dims), truncate(queries, dims)) if dims < x.shape[1] else (x, queries)
+        index, build_s = build(kind, xs, params)
+        rerank = params.get("rerank", 0)
+        ids, lat = run(index, qs, args.k, xs, rerank)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ids, truth)])
+        results.append({"config": spec, "recall": float(recall), "p50_ms": float(np.percentile(lat, 50)),
+                        "p99_ms": float(np.percentile(lat, 99)), "build_s": build_s, **memory(index)})
+
+    print(f"{'config':<36} {'recall@'+str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'B/vec':>6} {'MB/1M':>8}")
+    for r in results:
+        print(f"{r['config']:<36} {r['recall']:>9.3f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['build_s']:>8.1f} "
+              f"{r['bytes_per_vector']:>6} {r['mb_per_million']:>8.0f}")
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
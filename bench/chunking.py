@@ -0,0 +1,84 @@
+# bench/chunking.py
+# Throughput of the chunker: the old encode/decode-per-window loop vs offset spans,
+# with and without verse boundaries, and the ingest pipeline's per-document step (chunk +
+# hash, ingest.pipeline.chunk_doc) fanned out over a process pool.
+#   python -m bench.chunking --data processed_clean
+#   python -m bench.chunking --synthetic 40 --mb 2 --processes 4
+import time, json, random, argparse, pathlib, itertools
+from concurrent.futures import ProcessPoolExecutor
+import tiktoken
+from app.chunking import build_payloads, get_encoder, _token_lengths
+from ingest.pipeline import chunk_doc
+
+def load_docs(data_dir: pathlib.Path):
+    return [json.loads(p.read_text(encoding="utf-8")) for p in sorted(data_dir.glob("*.json"))]
+
+def synthetic_docs(n: int, mb: float, seed: int = 0):
+    # verse-numbered Devanagari and transliterated English lines, like the scripture corpus
+    rng = random.Random(seed)
+    words = ["धर्म", "कर्म", "योग", "आत्मा", "ब्रह्म", "ज्ञान", "भक्ति", "शान्ति",
+             "the", "self", "action", "knowledge", "Arjuna", "said", "O", "mighty-armed"]
+    docs = []
+    for d in range(n):
+        lines, size, v = [], 0, 1
+        while size < mb * 1_000_000:
+            line = " ".join(rng.choice(words) for _ in range(rng.randint(8, 24))) + f" ॥ {v} ॥\n"
+            if v % 20 == 0:
+                line += "\n"
+            lines.append(line); size += len(line.encode("utf-8")); v += 1
+        docs.append({"content": "".join(lines), "meta": {"identifier": f"synthetic-{d}", "language": "sa"}})
+    return docs
+
+def baseline_payloads(doc, max_tokens=400, overlap=40, model="gpt-4o-mini"):
+    # the previous implementation: encoder lookup per call, decode per window
+    enc = tiktoken.encoding_for_model(model)
+    ids = enc.encode(doc["content"])
+    out, i, idx = [], 0, 0
+    while i < len(ids):
+        out.append({"id": f'{doc["meta"]["identifier"]}:{idx}', "text": enc.decode(ids[i:i + max_tokens])})
+        i += max_tokens - overlap; idx += 1
+    return out
+
+def pipeline_chunks(docs, max_tokens, processes):
+    # what ingest.pipeline runs per document with INGEST_CHUNK_PROCESSES set; the pool's
+    # start-up is part of the timing, as it is part of an ingest run
+    raws = [json.dumps(d, ensure_ascii=False).encode("utf-8") for d in docs]
+    with ProcessPoolExecutor(processes) as pool:
+        return sum(map(len, pool.map(chunk_doc, raws, itertools.repeat(max_tokens))))
+
+def timed(name, fn, mb):
+    t0 = time.perf_counter()
+    chunks = fn()
+    s = time.perf_counter() - t0
+    return {"mode": name, "seconds": s, "chunks": chunks, "mb_per_s": mb / s if s else 0.0, "chunks_per_s": chunks / s if s else 0.0}
+
+def main():
+    ap = argparse.ArgumentParser(description="Chunker throughput.")
+    ap.add_argument("--data", type=str, default=None, help="Directory of *.json documents (content/meta)")
+    ap.add_argument("--synthetic", type=int, default=20, help="Synthetic documents when no --data")
+    ap.add_argument("--mb", type=float, default=1.0, help="Size of each synthetic document in MB")
+    ap.add_argument("--max-tokens", type=int, default=450)
+    ap.add_argument("--processes", type=int, default=4)
+    ap.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = ap.parse_args()
+
+    docs = load_docs(pathlib.Path(args.data)) if args.data else synthetic_docs(args.synthetic, args.mb)
+    mb = sum(len(d["content"].encode("utf-8")) for d in docs) / 1e6
+    print(f"docs={len(docs)} size={mb:.1f}MB max_tokens={args.max_tokens}")
+    get_encoder("gpt-4o-mini"); _token_lengths("gpt-4o-mini")  # one-off setup, not part of the timings
+
+    n = args.max_tokens
+    results = [
+        timed("baseline", lambda: sum(len(baseline_payloads(d, n)) for d in docs), mb),
+        timed("spans", lambda: sum(len(list(build_payloads(d, n))) for d in docs), mb),
+        timed("spans+verse", lambda: sum(len(list(build_payloads(d, n, boundary="verse"))) for d in docs), mb),
+        timed(f"pipeline x{args.processes}", lambda: pipeline_chunks(docs, n, args.processes), mb),
+    ]
+    print(f"{'mode':<14} {'seconds':>8} {'chunks':>8} {'MB/s':>8} {'chunks/s':>10}")
+    for r in results:
+        print(f"{r['mode']:<14} {r['seconds']:>8.2f} {r['chunks']:>8} {r['mb_per_s']:>8.2f} {r['chunks_per_s']:>10.0f}")
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
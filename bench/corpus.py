@@ -0,0 +1,77 @@
+# bench/corpus.py
+# Synthetic scripture-like corpus: verse-numbered Devanagari, transliterated Sanskrit and
+# English commentary, spread over documents with identifier/language metadata.
+#   python -m bench.corpus --chunks 10000 --out bench_corpus/processed   (parsed-PDF style input)
+import json, random, argparse, pathlib
+from typing import Dict, Iterator, List, Tuple
+
+SCRIPTURES = ["bhagavad-gita", "rig-veda", "upanishads", "ramayana", "mahabharata", "yoga-sutras", "puranas", "brahma-sutras"]
+DEVANAGARI = ["धर्म", "कर्म", "योग", "आत्मा", "ब्रह्म", "ज्ञान", "भक्ति", "शान्ति", "मोक्ष", "सत्य", "प्रकृति", "पुरुष"]
+TRANSLIT = ["dharma", "karma", "yoga", "ātman", "brahman", "jñāna", "bhakti", "śānti", "mokṣa", "satya", "prakṛti", "puruṣa", "kṛṣṇa", "arjuna"]
+ENGLISH = ["the", "self", "action", "knowledge", "devotion", "peace", "liberation", "truth", "nature", "Arjuna", "said",
+           "O", "mighty-armed", "one", "who", "is", "steady", "in", "mind", "without", "attachment", "to", "fruits", "of"]
+LANGUAGES = {"hi": DEVANAGARI, "sa-Latn": TRANSLIT, "en": ENGLISH}
+WORDS_PER_CHUNK = 280  # about 400 tokens of mixed text
+
+def verse(rng: random.Random, lang: str, chapter: int, n: int) -> str:
+    words = LANGUAGES[lang]
+    line = " ".join(rng.choice(words) for _ in range(rng.randint(8, 24)))
+    return f"{line} ॥ {chapter}.{n} ॥" if lang == "hi" else f"{line} ({chapter}.{n})"
+
+def synthetic_documents(chunks: int, chunks_per_doc: int = 50, seed: int = 0) -> List[Dict]:
+    """Normalized documents ({"meta", "content"}) totalling about `chunks` chunks."""
+    rng = random.Random(seed)
+    docs = []
+    for d in range(max(1, -(-chunks // chunks_per_doc))):
+        lang = rng.choice(list(LANGUAGES))
+        meta = {"identifier": f"{rng.choice(SCRIPTURES)}-{d}", "title": f"Synthetic text {d}", "language": lang}
+        lines, words, chapter, n = [], 0, 1, 1
+        target = WORDS_PER_CHUNK * min(chunks_per_doc, chunks - d * chunks_per_doc)
+        while words < target:
+            lines.append(verse(rng, lang, chapter, n))
+            words += len(lines[-1].split()); n += 1
+            if n > 40:
+                chapter, n = chapter + 1, 1
+                lines.append("")
+        docs.append({"meta": meta, "content": "\n".join(lines)})
+    return docs
+
+def raw_documents(docs: List[Dict], seed: int = 0) -> List[Dict]:
+    # parsed-PDF style: page furniture, control characters, ligatures and bullets for the normalizer
+    rng = random.Random(seed)
+    junk = ["\x0c", "•", "ﬁ", "  ", "\t", "\n\n\n", "§ 12"]
+    out = []
+    for doc in docs:
+        parts = doc["content"].split("\n")
+        content = "\n".join(p + (rng.choice(junk) if rng.random() < 0.1 else "") for p in parts)
+        out.append({"meta": {k: v for k, v in doc["meta"].items() if k != "language"}, "content": content})
+    return out
+
+def synthetic_chunks(n: int, seed: int = 0) -> Iterator[Tuple[str, str, Dict]]:
+    """(id, text, metadata) chunks for writing straight into a store."""
+    rng = random.Random(seed)
+    for i in range(n):
+        lang = rng.choice(list(LANGUAGES))
+        ident = f"{SCRIPTURES[i % len(SCRIPTURES)]}-{i // 500}"
+        text = " ".join(verse(rng, lang, 1 + i % 18, 1 + j) for j in range(3))
+        yield f"{ident}:{i}", text, {"identifier": ident, "language": lang, "chunk": i}
+
+def write_documents(docs: List[Dict], out_dir: pathlib.Path):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for doc in docs:
+        (out_dir / f"{doc['meta']['identifier']}.json").write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+
+def main():
+    ap = argparse.ArgumentParser(description="Write a synthetic scripture-like corpus.")
+    ap.add_argument("--chunks", type=int, default=10_000, help="Approximate corpus size in ~400-token chunks")
+    ap.add_argument("--chunks-per-doc", type=int, default=50)
+    ap.add_argument("--out", type=str, default="bench_corpus/processed")
+    ap.add_argument("--clean", action="store_true", help="Write normalized documents (processed_clean style) instead of raw")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    docs = synthetic_documents(args.chunks, args.chunks_per_doc, args.seed)
+    write_documents(docs if args.clean else raw_documents(docs, args.seed), pathlib.Path(args.out))
+    print(f"wrote {len(docs)} documents to {args.out}")
+
+if __name__ == "__main__":
+    main()
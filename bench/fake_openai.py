@@ -0,0 +1,160 @@
+# bench/fake_openai.py
+# Stand-in for the OpenAI API, so ingest and query can be benchmarked without a key or spend.
+# Embeddings are deterministic bags of hashed word vectors (texts sharing words land close
+# together, so retrieval still means something); chat completions are canned answers, plain
+# or SSE-streamed, with usage. Latency is configurable per request, per input and per token.
+#   python -m bench.fake_openai --port 8765 --dims 1536 --latency-ms 80 --token-ms 5
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake uvicorn app.main:app
+import re, json, time, base64, random, hashlib, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+class FakeOpenAI:
+    def __init__(self, dims: int = 1536, latency_ms: float = 0.0, item_ms: float = 0.0, token_ms: float = 0.0,
+                 completion_tokens: int = 64, jitter: float = 0.0, error_rate: float = 0.0):
+        self.dims, self.latency_ms, self.item_ms, self.token_ms = dims, latency_ms, item_ms, token_ms
+        self.completion_tokens, self.jitter, self.error_rate = completion_tokens, jitter, error_rate
+        self._words = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def _word(self, w: str) -> np.ndarray:
+        v = self._words.get(w)
+        if v is None:
+            seed = int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest(), "little")
+            v = np.random.default_rng(seed).standard_normal(self.dims).astype("float32")
+            with self._lock:
+                if len(self._words) > 200_000:
+                    self._words.clear()
+                self._words[w] = v
+        return v
+
+    def embed(self, text: str) -> np.ndarray:
+        words = _WORD.findall(text.casefold())
+        v = np.sum([self._word(w) for w in words], axis=0) if words else self._word("")
+        return (v / (np.linalg.norm(v) or 1.0)).astype("float32")
+
+    def tokens(self, text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def answer(self, question: str) -> list:
+        words = ["According", "to", "the", "passages,", *question.split()[:8]]
+        return [(words[i % len(words)] + " ") for i in range(self.completion_tokens)]
+
+    def wait(self, ms: float):
+        if ms > 0:
+            time.sleep(ms / 1000 * (1 + self.jitter * (2 * random.random() - 1)))
+
+def make_handler(fake: FakeOpenAI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status: int, obj, headers=()):
+            body = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            for k, v in headers:
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            self._json(200, {"object": "list", "data": []})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+            fake.requests += 1
+            if fake.error_rate and random.random() < fake.error_rate:
+                return self._json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                  [("retry-after-ms", "50")])
+            if self.path.endswith("/embeddings"):
+                return self._embeddings(body)
+            if self.path.endswith("/chat/completions"):
+                return self._stream(body) if body.get("stream") else self._completion(body)
+            self._json(404, {"error": {"message": f"no route {self.path}"}})
+
+        def _embeddings(self, body):
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            fake.wait(fake.latency_ms + fake.item_ms * len(inputs))
+            data = []
+            for i, text in enumerate(inputs):
+                v = fake.embed(text)
+                emb = base64.b64encode(v.tobytes()).decode() if body.get("encoding_format") == "base64" else v.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": emb})
+            n = sum(fake.tokens(t) for t in inputs)
+            self._json(200, {"object": "list", "data": data, "model": body.get("model", "fake"),
+                             "usage": {"prompt_tokens": n, "total_tokens": n}},
+                       [("x-ratelimit-remaining-requests", "10000"), ("x-ratelimit-remaining-tokens", "10000000")])
+
+        def _usage(self, body, completion: int) -> dict:
+            prompt = sum(fake.tokens(m.get("content") or "") for m in body.get("messages", []))
+            return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+        def _question(self, body) -> str:
+            return (body.get("messages") or [{}])[-1].get("content", "")[-200:]
+
+        def _completion(self, body):
+            toks = fake.answer(self._question(body))
+            fake.wait(fake.latency_ms + fake.token_ms * len(toks))
+            self._json(200, {"id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                             "model": body.get("model", "fake"),
+                             "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(toks)}, "finish_reason": "stop"}],
+                             "usage": self._usage(body, len(toks))})
+
+        def _stream(self, body):
+            toks = fake.answer(self._question(body))
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "fake")}
+            fake.wait(fake.latency_ms)
+            for i, tok in enumerate(toks):
+                if i:
+                    fake.wait(fake.token_ms)
+                delta = {"content": tok, **({"role": "assistant"} if i == 0 else {})}
+                self._chunk(b"data: " + json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}).encode() + b"\n\n")
+            self._chunk(b"data: " + json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}).encode() + b"\n\n")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._chunk(b"data: " + json.dumps({**base, "choices": [], "usage": self._usage(body, len(toks))}).encode() + b"\n\n")
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+    return Handler
+
+def serve(port: int = 0, **kwargs):
+    """Start a fake server in a daemon thread -> (server, base_url, fake)."""
+    fake = FakeOpenAI(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1", fake
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake OpenAI API (embeddings + chat) for offline benchmarks.")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--dims", type=int, default=1536)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Per request (time to first token for chat)")
+    ap.add_argument("--item-ms", type=float, default=0.0, help="Extra per embedded input")
+    ap.add_argument("--token-ms", type=float, default=0.0, help="Per completion token")
+    ap.add_argument("--completion-tokens", type=int, default=64)
+    ap.add_argument("--jitter", type=float, default=0.0, help="Latency varies by +/- this fraction")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    args = ap.parse_args()
+    fake = FakeOpenAI(args.dims, args.latency_ms, args.item_ms, args.token_ms, args.completion_tokens, args.jitter, args.error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(fake))
+    server.daemon_threads = True
+    print(f"fake OpenAI on http://127.0.0.1:{args.port}/v1", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# bench/normalize.py
+# Golden check and speed of ingest/normalize_corpus.py against the original per-character
+# implementation (kept below verbatim). Every output file, in-memory and streamed, must be
+# byte-identical to the reference; the script exits non-zero otherwise.
+#   python -m bench.normalize --data processed
+#   python -m bench.normalize --synthetic 8 --mb 4
+import re, sys, json, time, random, argparse, pathlib, tempfile, unicodedata
+from ingest import normalize_corpus as nc
+
+# --- reference implementation ---
+def in_ranges(ch, ranges):
+    cp = ord(ch)
+    return any(a <= cp <= b for a, b in ranges)
+
+def ref_clean_text(s):
+    s = re.sub(r"[\x00-\x1F\x7F]", " ", s)
+    s = "".join("" if in_ranges(c, nc.JUNK_RANGES) else c for c in s)
+    s = re.sub(r"[•·◊◦■□▪▫◆◇◻◼◾◽∑§¥]+", " ", s)
+    for k, v in nc.LIGATURES.items():
+        s = s.replace(k, v)
+    s = re.sub(r"[ \t\r\f\v]+", " ", s)
+    s = re.sub(r"\n{3,}", "\n\n", s)
+    s = re.sub(r"[ ]?\n[ ]?", "\n", s)
+    return s.strip()
+
+def ref_strip_accents(s):
+    return "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
+
+def ref_guess_lang(text):
+    if any(nc.DEVANAGARI_RANGE[0] <= ord(c) <= nc.DEVANAGARI_RANGE[1] for c in text):
+        return "hi"
+    low = text.lower()
+    if any(ch in low for ch in nc.DIACRITIC_HINTS):
+        return "sa-Latn"
+    return "en"
+
+def ref_process_file(path_in, path_out, keep_diacritics):
+    doc = json.loads(path_in.read_text(encoding="utf-8"))
+    clean = ref_clean_text(doc.get("content", ""))
+    meta = dict(doc.get("meta", {}))
+    meta["language"] = ref_guess_lang(clean)
+    ascii_ = ref_strip_accents(clean)
+    out = {"meta": meta, "content": clean if keep_diacritics else ascii_, "text_raw": clean, "text_ascii": ascii_}
+    path_out.write_text(json.dumps(out, ensure_ascii=False), encoding="utf-8")
+
+# --- inputs ---
+PIECES = ["धर्मक्षेत्रे कुरुक्षेत्रे", "yogaḥ karmasu kauśalam", "ﬁre ﬂow ﬃx", "“quoted” it’s",
+          "\x0c\x01", "", "\U000F0001\U0010FFFD", "•··◊ ■", "§ 12", " ", " ",
+          "é", "ṛṝḷ", "😀", "Σίσυφος", "\t\r\n", "\n\n\n\n", "   ", "plain english text", "\\ \" /"]
+
+def synthetic_docs(out_dir: pathlib.Path, n: int, mb: float, seed: int = 0):
+    rng = random.Random(seed)
+    for d in range(n):
+        parts, size = [rng.choice(["  \n", " ", "•", ""])], 0
+        while size < mb * 1_000_000:
+            p = rng.choice(PIECES) + rng.choice([" ", "", "\n", "  "])
+            parts.append(p); size += len(p.encode("utf-8"))
+        parts.append(rng.choice(["  \n", "  ", "■", ""]))
+        doc = {"meta": {"identifier": f"synthetic-{d}", "n": d}, "content": "".join(parts)}
+        # odd documents escape everything, so surrogate pairs and \\u escapes cross read boundaries
+        (out_dir / f"synthetic-{d}.json").write_text(json.dumps(doc, ensure_ascii=bool(d % 2)), encoding="utf-8")
+
+def main():
+    ap = argparse.ArgumentParser(description="Golden check + speed of the corpus normalizer.")
+    ap.add_argument("--data", type=str, default=None, help="Directory of parsed *.json documents")
+    ap.add_argument("--synthetic", type=int, default=6, help="Synthetic documents when no --data")
+    ap.add_argument("--mb", type=float, default=2.0, help="Size of each synthetic document in MB")
+    ap.add_argument("--keep-diacritics", action="store_true")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        data = pathlib.Path(args.data) if args.data else tmp / "in"
+        if not args.data:
+            data.mkdir(); synthetic_docs(data, args.synthetic, args.mb)
+        files = sorted(data.glob("*.json"))
+        mb = sum(p.stat().st_size for p in files) / 1e6
+        for d in ("ref", "new", "stream"):
+            (tmp / d).mkdir()
+        nc._combining()  # one-off table build, not part of the timings
+        print(f"files={len(files)} size={mb:.1f}MB")
+
+        timings = {}
+        t0 = time.perf_counter()
+        for p in files:
+            ref_process_file(p, tmp / "ref" / p.name, args.keep_diacritics)
+        timings["reference"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for p in files:
+            nc.process_file(p, tmp / "new" / p.name, args.keep_diacritics)
+        timings["single-pass"] = time.perf_counter() - t0
+        nc.STREAM_CHARS = 4093  # small odd reads so escapes and runs straddle read boundaries
+        t0 = time.perf_counter()
+        for p in files:
+            nc.process_file(p, tmp / "stream" / p.name, args.keep_diacritics, stream_mb=0)
+        timings["streamed"] = time.perf_counter() - t0
+
+        for name, s in timings.items():
+            print(f"{name:<12} {s:>8.2f}s {mb / s:>8.2f} MB/s")
+        bad = [f"{d}/{p.name}" for p in files for d in ("new", "stream")
+               if (tmp / d / p.name).read_bytes() != (tmp / "ref" / p.name).read_bytes()]
+        print("golden: " + ("OK, byte-identical" if not bad else f"MISMATCH in {', '.join(bad)}"))
+        sys.exit(1 if bad else 0)
+
+if __name__ == "__main__":
+    main()
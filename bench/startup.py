@@ -0,0 +1,125 @@
+# bench/startup.py
+# Cold-start cost: `import app.main` in a fresh interpreter (with the slowest modules from
+# -X importtime), then uvicorn start to /health, to /ready (warm-up done) and the first
+# /query, against the fake OpenAI server. --max-import-ms fails the run on a regression.
+#   python -m bench.startup --runs 5 --json startup.json
+#   python -m bench.startup --max-import-ms 1500
+import os, sys, json, time, shutil, asyncio, argparse, pathlib, statistics, subprocess, tempfile
+from bench.suite import ROOT, free_port, prepare_api_dir
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+def _env(args, **extra) -> dict:
+    return {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, (str(ROOT), os.getenv("PYTHONPATH")))),
+            "OPENAI_API_KEY": "fake", "VECTOR_DB": "faiss", "EMBED_DIMS": str(args.dims), **extra}
+
+def slowest_imports(stderr: str, n: int) -> list:
+    # -X importtime lines: "import time: self | cumulative | name", name indented 2 per level;
+    # top-level imports and what they import directly
+    rows = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            name = parts[2]
+            if len(name) - len(name.lstrip()) <= 3:
+                rows.append((int(parts[1]) / 1000, name.strip()))
+    return [{"module": name, "cumulative_ms": ms} for ms, name in sorted(rows, reverse=True)[:n]]
+
+def bench_import(args, workdir: pathlib.Path) -> dict:
+    times = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=workdir, env=_env(args),
+                             capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]) * 1000)
+    prof = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=workdir, env=_env(args),
+                          capture_output=True, text=True, check=True)
+    heavy = ("openai", "chromadb", "faiss", "qdrant_client", "tiktoken")
+    loaded = subprocess.run([sys.executable, "-c", f"import sys, json, app.main; print(json.dumps([m for m in {heavy!r} if m in sys.modules]))"],
+                            cwd=workdir, env=_env(args), capture_output=True, text=True, check=True)
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "runs_ms": times,
+            "heavy_modules_at_import": json.loads(loaded.stdout.strip().splitlines()[-1]),
+            "slowest": slowest_imports(prof.stderr, args.top)}
+
+async def _poll(client, url: str, proc, t0: float, timeout: float = 120.0) -> float:
+    import httpx
+    while time.perf_counter() - t0 < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {proc.returncode}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return (time.perf_counter() - t0) * 1000
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.01)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+async def _start_once(args, workdir: pathlib.Path, fake_url: str) -> dict:
+    import httpx
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=workdir, env=_env(args, OPENAI_BASE_URL=fake_url, ANSWER_CACHE_SIZE="0"))
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=120) as client:
+            health = await _poll(client, base + "/health", proc, t0)
+            ready = await _poll(client, base + "/ready", proc, t0)
+            steps = (await client.get("/ready")).json()
+            t = time.perf_counter()
+            (await client.post("/query", json={"question": "What is said about dharma and karma?"})).raise_for_status()
+            first_query = (time.perf_counter() - t) * 1000
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"health_ms": health, "ready_ms": ready, "first_query_ms": first_query, "warmup": steps}
+
+def bench_start(args, workdir: pathlib.Path) -> dict:
+    fake_port = free_port()
+    fake = subprocess.Popen([sys.executable, "-m", "bench.fake_openai", "--port", str(fake_port), "--dims", str(args.dims),
+                             "--latency-ms", str(args.latency_ms)], cwd=ROOT, env=_env(args), stdout=subprocess.DEVNULL)
+    try:
+        time.sleep(0.5)
+        runs = [asyncio.run(_start_once(args, workdir, f"http://127.0.0.1:{fake_port}/v1")) for _ in range(args.runs)]
+    finally:
+        fake.terminate()
+        fake.wait()
+    med = {k: statistics.median(r[k] for r in runs) for k in ("health_ms", "ready_ms", "first_query_ms")}
+    return {**{f"median_{k}": v for k, v in med.items()}, "runs": runs}
+
+def main():
+    ap = argparse.ArgumentParser(description="Import time and cold-start latency of the API.")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--dims", type=int, default=1536)
+    ap.add_argument("--api-chunks", type=int, default=5000, help="Index size behind the API")
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="Fake OpenAI latency per request")
+    ap.add_argument("--top", type=int, default=10, help="Slowest top-level imports to report")
+    ap.add_argument("--skip-server", action="store_true", help="Only measure the import")
+    ap.add_argument("--max-import-ms", type=float, default=None, help="Exit non-zero if the median import is slower")
+    ap.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = ap.parse_args()
+
+    os.environ["EMBED_DIMS"] = str(args.dims)
+    workdir = pathlib.Path(tempfile.mkdtemp(prefix="gurumitra-startup-"))
+    try:
+        prepare_api_dir(args, workdir)
+        results = {"import": bench_import(args, workdir)}
+        if not args.skip_server:
+            results["start"] = bench_start(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    imp = results["import"]
+    print(f"import app.main: median {imp['median_ms']:.0f}ms (min {imp['min_ms']:.0f}ms); "
+          f"heavy modules loaded at import: {imp['heavy_modules_at_import'] or 'none'}")
+    for s in imp["slowest"]:
+        print(f"  {s['cumulative_ms']:8.1f}ms  {s['module']}")
+    if "start" in results:
+        st = results["start"]
+        print(f"uvicorn start -> /health {st['median_health_ms']:.0f}ms, /ready {st['median_ready_ms']:.0f}ms, "
+              f"first /query {st['median_first_query_ms']:.0f}ms")
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.max_import_ms is not None and imp["median_ms"] > args.max_import_ms:
+        sys.exit(f"import regression: {imp['median_ms']:.0f}ms > {args.max_import_ms:.0f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# bench/suite.py
+# Offline end-to-end benchmarks against the fake OpenAI server (bench/fake_openai.py), written
+# as JSON so runs can be diffed for regressions:
+#   ingest  normalize -> chunk -> embed -> upsert throughput over a synthetic corpus
+#   search  FaissStore vs ChromaStore build time and search latency at each --sizes
+#   query   /query and /stream latency under concurrent clients (uvicorn in a subprocess)
+#   python -m bench.suite --json bench_results.json
+#   python -m bench.suite --scenarios search --sizes 10000,100000,1000000 --stores faiss --dims 384
+import os, sys, json, time, socket, asyncio, argparse, pathlib, platform, subprocess, tempfile
+import numpy as np
+from bench.fake_openai import FakeOpenAI, serve
+from bench.corpus import LANGUAGES, synthetic_documents, raw_documents, synthetic_chunks, write_documents
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+UPSERT_BATCH = 5000  # below Chroma's max batch size
+
+def percentiles(ms) -> dict:
+    ms = np.asarray(ms, dtype="float64")
+    if not len(ms):
+        return {}
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean())}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def questions(n: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    words = [w for ws in LANGUAGES.values() for w in ws if len(w) > 3]
+    return [f"What is said about {' and '.join(rng.choice(words, 2))}? ({i})" for i in range(n)]
+
+# ------- ingest -------
+def bench_ingest(args, tmp: pathlib.Path) -> dict:
+    from ingest.normalize_corpus import process_file
+    from ingest import pipeline
+    from app.vector_store import FaissStore
+    server, _, fake = serve(port=args.fake_port, dims=args.dims, latency_ms=args.embed_latency_ms, item_ms=args.item_ms)
+    try:
+        raw, clean = tmp / "processed", tmp / "processed_clean"
+        write_documents(raw_documents(synthetic_documents(args.chunks)), raw)
+        clean.mkdir()
+        files = sorted(raw.glob("*.json"))
+        mb = sum(p.stat().st_size for p in files) / 1e6
+        t0 = time.perf_counter()
+        for p in files:
+            process_file(p, clean / p.name, False)
+        normalize_s = time.perf_counter() - t0
+
+        store = FaissStore(tmp / "faiss_index")
+        stats = pipeline.run(clean, store, manifest=tmp / "manifest.sqlite", concurrency=args.embed_concurrency)
+        requests = fake.requests
+        t0 = time.perf_counter()
+        pipeline.run(clean, store, manifest=tmp / "manifest.sqlite", concurrency=args.embed_concurrency)  # nothing changed
+        rerun_s = time.perf_counter() - t0
+    finally:
+        server.shutdown()
+    return {"docs": len(files), "mb": mb, "normalize_s": normalize_s, "normalize_mb_s": mb / normalize_s if normalize_s else 0.0,
+            "chunks": stats["chunks_embedded"], "ingest_s": stats["seconds"], "chunks_per_s": stats["chunks_per_s"],
+            "tokens_per_s": stats["tokens_per_s"], "embed_requests": requests, "retries": stats["retries"],
+            "unchanged_rerun_s": rerun_s}
+
+# ------- search -------
+def make_store(kind: str, path: pathlib.Path):
+    from app.vector_store import FaissStore, ChromaStore
+    return FaissStore(path) if kind == "faiss" else ChromaStore(str(path))
+
+def bench_search(args, tmp: pathlib.Path) -> list:
+    from bench.ann_recall import synthetic_vectors, make_queries
+    results = []
+    for size in map(int, args.sizes.split(",")):
+        x = synthetic_vectors(size, args.dims)
+        qs = make_queries(x, min(args.queries, size))
+        words = questions(len(qs))
+        for kind in args.stores.split(","):
+            store = make_store(kind, tmp / f"{kind}-{size}")
+            t0, chunks = time.perf_counter(), synthetic_chunks(size)
+            for i in range(0, size, UPSERT_BATCH):
+                ids, texts, metas = zip(*(next(chunks) for _ in range(min(UPSERT_BATCH, size - i))))
+                store.upsert(list(ids), list(texts), list(metas), x[i:i + len(ids)])
+            store.commit()
+            build_s = time.perf_counter() - t0
+
+            def timed(fn, items):
+                lat = []
+                for item in items:
+                    t = time.perf_counter()
+                    fn(item)
+                    lat.append((time.perf_counter() - t) * 1000)
+                return percentiles(lat)
+
+            r = {"store": kind, "size": size, "dims": args.dims, "build_s": build_s, "inserts_per_s": size / build_s,
+                 "vector": timed(lambda q: store.search(q, args.k), qs),
+                 "filtered": timed(lambda q: store.search(q, args.k, filter={"language": ["hi"]}), qs),
+                 "lexical": timed(lambda w: store.lexical_search(w, args.k), words) if store.lexical is not None else {},
+                 "hybrid": timed(lambda i: store.hybrid_search(qs[i], words[i], args.k), range(len(qs))) if store.lexical is not None else {}}
+            batch = qs[:32]
+            t = time.perf_counter()
+            store.search(batch, args.k)
+            r["batch32_ms_per_query"] = (time.perf_counter() - t) * 1000 / len(batch)
+            results.append(r)
+            print(f"search {kind:<6} n={size:<8} build {build_s:7.1f}s  p50 {r['vector']['p50_ms']:8.2f}ms  "
+                  f"p99 {r['vector']['p99_ms']:8.2f}ms  filtered p50 {r['filtered']['p50_ms']:8.2f}ms", flush=True)
+            del store
+        del x
+    return results
+
+# ------- query / stream load -------
+def prepare_api_dir(args, workdir: pathlib.Path):
+    # index embedded with the fake's own vectors, so questions retrieve passages as in production
+    from app.vector_store import FaissStore
+    fake, store = FakeOpenAI(dims=args.dims), FaissStore(workdir / "faiss_index")
+    chunks = list(synthetic_chunks(args.api_chunks))
+    for i in range(0, len(chunks), UPSERT_BATCH):
+        ids, texts, metas = zip(*chunks[i:i + UPSERT_BATCH])
+        store.upsert(list(ids), list(texts), list(metas), np.stack([fake.embed(t) for t in texts]))
+    store.commit()
+
+async def wait_ready(url: str, procs, timeout: float = 120.0):
+    import httpx
+    end = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < end:
+            for p in procs:
+                if p.poll() is not None:
+                    raise RuntimeError(f"{p.args[2]} exited with {p.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+async def load(base: str, path: str, concurrency: int, n: int, qs: list, mode: str = None) -> dict:
+    import httpx
+    lat, ttfb, errors, todo = [], [], 0, iter(range(n))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client):
+        nonlocal errors
+        for i in todo:
+            body = {"question": qs[i % len(qs)], **({"mode": mode} if mode else {})}
+            t0 = time.perf_counter()
+            try:
+                if path == "/stream":
+                    first = None
+                    async with client.stream("POST", path, json=body) as r:
+                        r.raise_for_status()
+                        async for line in r.aiter_lines():
+                            if first is None and '"delta"' in line:
+                                first = (time.perf_counter() - t0) * 1000
+                    if first is not None:
+                        ttfb.append(first)
+                else:
+                    (await client.post(path, json=body)).raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    async with httpx.AsyncClient(base_url=base, timeout=300, limits=limits) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    r = {"endpoint": path, "concurrency": concurrency, "requests": n, "errors": errors, "rps": len(lat) / wall, **percentiles(lat)}
+    if path == "/stream":
+        r["first_token"] = percentiles(ttfb)
+    return r
+
+def bench_query(args, tmp: pathlib.Path) -> list:
+    workdir = tmp / "api"
+    workdir.mkdir()
+    prepare_api_dir(args, workdir)
+    fake_port, api_port = free_port(), free_port()
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, (str(ROOT), os.getenv("PYTHONPATH")))), "VECTOR_DB": "faiss", "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+           "OPENAI_API_KEY": "fake", "EMBED_DIMS": str(args.dims), "ANSWER_CACHE_SIZE": os.getenv("ANSWER_CACHE_SIZE", "0")}
+    procs = [
+        subprocess.Popen([sys.executable, "-m", "bench.fake_openai", "--port", str(fake_port), "--dims", str(args.dims),
+                          "--latency-ms", str(args.llm_latency_ms), "--token-ms", str(args.token_ms),
+                          "--completion-tokens", str(args.completion_tokens)], cwd=ROOT, env=env, stdout=subprocess.DEVNULL),
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port), "--workers", str(args.workers),
+                          "--log-level", "warning"], cwd=workdir, env=env),
+    ]
+    base, qs, results = f"http://127.0.0.1:{api_port}", questions(max(args.requests, 1)), []
+    try:
+        asyncio.run(wait_ready(base + "/health", procs))
+        asyncio.run(load(base, "/query", 1, 2, qs))  # warm-up: index load, connection pools
+        for path in ("/query", "/stream"):
+            for c in map(int, args.concurrency.split(",")):
+                r = asyncio.run(load(base, path, c, args.requests, qs, args.mode))
+                results.append(r)
+                print(f"{path:<8} c={c:<4} {r['rps']:7.1f} req/s  p50 {r.get('p50_ms', 0):8.1f}ms  "
+                      f"p99 {r.get('p99_ms', 0):8.1f}ms  errors {r['errors']}", flush=True)
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+    return results
+
+SCENARIOS = {"ingest": bench_ingest, "search": bench_search, "query": bench_query}
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline ingest / search / API benchmarks (fake OpenAI, synthetic corpus).")
+    ap.add_argument("--scenarios", type=str, default="ingest,search,query")
+    ap.add_argument("--dims", type=int, default=1536)
+    ap.add_argument("--json", type=str, default=None, help="Write results to this file")
+    ap.add_argument("--keep", action="store_true", help="Keep the working directory (stores, corpus)")
+    # ingest
+    ap.add_argument("--chunks", type=int, default=10_000, help="Ingest corpus size in ~400-token chunks")
+    ap.add_argument("--embed-latency-ms", type=float, default=50.0, help="Fake embeddings latency per request")
+    ap.add_argument("--item-ms", type=float, default=0.2, help="Fake embeddings latency per input")
+    ap.add_argument("--embed-concurrency", type=int, default=8)
+    ap.add_argument("--fake-port", type=int, default=0)
+    # search
+    ap.add_argument("--sizes", type=str, default="10000,100000", help="Comma list of store sizes (1000000 needs ~6 GB at 1536 dims)")
+    ap.add_argument("--stores", type=str, default="faiss,chroma")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=6)
+    # query
+    ap.add_argument("--api-chunks", type=int, default=5000, help="Index size behind the API")
+    ap.add_argument("--concurrency", type=str, default="1,8,32")
+    ap.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--mode", type=str, default=None, help="Retrieval mode sent with each request")
+    ap.add_argument("--llm-latency-ms", type=float, default=300.0, help="Fake chat time to first token")
+    ap.add_argument("--token-ms", type=float, default=10.0)
+    ap.add_argument("--completion-tokens", type=int, default=64)
+    args = ap.parse_args()
+
+    # app modules read these at import, so set them before any scenario imports one
+    os.environ["EMBED_DIMS"] = str(args.dims)
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    if "ingest" in args.scenarios:
+        args.fake_port = args.fake_port or free_port()
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.fake_port}/v1"
+
+    tmp = pathlib.Path(tempfile.mkdtemp(prefix="gurumitra-bench-"))
+    out = {"git": git_rev(), "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+           "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args), "results": {}}
+    try:
+        for name in args.scenarios.split(","):
+            if name not in SCENARIOS:
+                raise SystemExit(f"unknown scenario {name!r} (expected {', '.join(SCENARIOS)})")
+            d = tmp / name
+            d.mkdir()
+            t0 = time.perf_counter()
+            out["results"][name] = SCENARIOS[name](args, d)
+            print(f"{name} done in {time.perf_counter() - t0:.1f}s", flush=True)
+    finally:
+        if args.keep:
+            print(f"kept {tmp}")
+        else:
+            import shutil
+            shutil.rmtree(tmp, ignore_errors=True)
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps(out, indent=2))
+    else:
+        print(json.dumps(out["results"], indent=2))
+
+if __name__ == "__main__":
+    main()
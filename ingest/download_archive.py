@@ -1,8 +1,20 @@
 # ingest/download_archive.py
-import os, json, pathlib
+# Downloads archive.org items for QUERIES into data/<identifier>/.
+# Item metadata and files are fetched by a bounded thread pool; only the first rendition in
+# --formats that an item has is downloaded. Every verified file (md5) is recorded in a SQLite
+# manifest, and interrupted downloads resume from their .part file, so reruns pick up where
+# the last one stopped.
+import os, json, time, random, sqlite3, hashlib, argparse, pathlib, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
 from internetarchive import search_items, get_item
 
 DATA_DIR = pathlib.Path("data"); DATA_DIR.mkdir(exist_ok=True)
+DOWNLOAD_URL = os.getenv("ARCHIVE_DOWNLOAD_URL", "https://archive.org/download")
+FORMATS = ".txt,.xml,.pdf,.djvu"  # cheapest usable rendition first
+MAX_RETRIES = 4
 
 # Example query terms/collections — adjust to your sources:
 QUERIES = [
@@ -11,20 +23,165 @@ QUERIES = [
     'subject:"Hinduism" AND mediatype:text'
 ]
 
-def main():
-    seen = set()
-    for q in QUERIES:
-        for res in search_items(q):
-            identifier = res.get('identifier')
-            if not identifier or identifier in seen: continue
-            seen.add(identifier)
-            item = get_item(identifier)
-            # Prefer text-friendly formats: .txt, .pdf, .djvu, .xml
-            files = [f for f in item.files if f["name"].lower().endswith((".pdf", ".txt", ".djvu", ".xml"))]
-            out_dir = DATA_DIR / identifier; out_dir.mkdir(exist_ok=True)
+class DownloadManifest:
+    """Files downloaded and verified so far, and items whose chosen files are all done."""
+
+    def __init__(self, path: pathlib.Path):
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (identifier TEXT, name TEXT, size INTEGER, md5 TEXT, PRIMARY KEY (identifier, name));
+            CREATE TABLE IF NOT EXISTS items (identifier TEXT PRIMARY KEY, files TEXT);
+        """)
+        self._db.commit()
+
+    def item_done(self, identifier: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM items WHERE identifier=?", (identifier,)).fetchone() is not None
+
+    def file_done(self, identifier: str, name: str, path: pathlib.Path) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT size FROM files WHERE identifier=? AND name=?", (identifier, name)).fetchone()
+        return row is not None and path.exists() and path.stat().st_size == row[0]
+
+    def add_file(self, identifier: str, name: str, size: int, md5: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (identifier, name, size, md5))
+            self._db.commit()
+
+    def finish_item(self, identifier: str, names: List[str]):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO items VALUES (?, ?)", (identifier, json.dumps(names)))
+            self._db.commit()
+
+def choose_files(files: List[dict], formats: List[str]) -> List[dict]:
+    # all files of the first preferred suffix the item has; archive.org's own metadata
+    # files (_meta.xml, _files.xml, ...) are never content
+    content = [f for f in files if f.get("source") != "metadata"]
+    for suffix in formats:
+        picked = [f for f in content if f["name"].lower().endswith(suffix)]
+        if picked:
+            return picked
+    return []
+
+def _session(workers: int) -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    s.mount("http://", adapter); s.mount("https://", adapter)
+    return s
+
+def download_file(session: requests.Session, identifier: str, f: dict, out_dir: pathlib.Path,
+                  base_url: str = DOWNLOAD_URL) -> dict:
+    """Stream one file to out_dir, resuming a .part file; -> {"name", "size", "md5"}."""
+    path = out_dir / f["name"]
+    part = path.with_name(path.name + ".part")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    url = f"{base_url.rstrip('/')}/{identifier}/{requests.utils.quote(f['name'])}"
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            have = part.stat().st_size if part.exists() else 0
+            headers = {"Range": f"bytes={have}-"} if have else {}
+            with session.get(url, headers=headers, stream=True, timeout=60) as r:
+                if r.status_code != 416:  # 416: the .part is already complete
+                    r.raise_for_status()
+                    if have and r.status_code != 206:
+                        have = 0  # server ignored the range: start over
+                    with part.open("ab" if have else "wb") as out:
+                        for block in r.iter_content(1 << 16):
+                            out.write(block)
+            md5 = hashlib.md5()
+            with part.open("rb") as fh:
+                while block := fh.read(1 << 20):
+                    md5.update(block)
+            digest = md5.hexdigest()
+            if f.get("md5") and digest != f["md5"]:
+                part.unlink()
+                raise IOError(f"md5 mismatch for {identifier}/{f['name']}")
+            os.replace(part, path)
+            return {"name": f["name"], "size": path.stat().st_size, "md5": digest}
+        except (requests.RequestException, IOError):
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random() / 2))
+
+def run(queries: List[str], data_dir: pathlib.Path = DATA_DIR, *, manifest: pathlib.Path, formats: List[str],
+        workers: int = 8, base_url: str = DOWNLOAD_URL, refresh: bool = False) -> Dict[str, int]:
+    m = DownloadManifest(manifest)
+    session = _session(workers)
+    stats = {"items": 0, "items_skipped": 0, "files": 0, "files_skipped": 0, "bytes": 0, "failed": 0}
+    left: Dict[str, int] = {}
+    chosen: Dict[str, List[str]] = {}
+    failed = set()
+
+    def plan(identifier: str) -> List[dict]:
+        return choose_files(get_item(identifier).files, formats)
+
+    def fetch(identifier: str, f: dict) -> Optional[dict]:
+        path = data_dir / identifier / f["name"]
+        if m.file_done(identifier, f["name"], path):
+            return None
+        info = download_file(session, identifier, f, data_dir / identifier, base_url)
+        m.add_file(identifier, info["name"], info["size"], info["md5"])
+        return info
+
+    with ThreadPoolExecutor(workers) as pool:
+        plans, seen = {}, set()
+        for q in queries:
+            for res in search_items(q):
+                identifier = res.get('identifier')
+                if not identifier or identifier in seen: continue
+                seen.add(identifier)
+                if not refresh and m.item_done(identifier):
+                    stats["items_skipped"] += 1; continue
+                plans[pool.submit(plan, identifier)] = identifier
+
+        downloads = {}
+        for fut in as_completed(plans):
+            identifier = plans[fut]
+            try:
+                files = fut.result()
+            except Exception as e:
+                print(f"{identifier}: metadata failed: {e}"); stats["failed"] += 1; continue
+            stats["items"] += 1
+            chosen[identifier] = [f["name"] for f in files]
+            left[identifier] = len(files)
+            if not files:
+                m.finish_item(identifier, [])
             for f in files:
-                print("Downloading", f["name"])
-                item.download(files=[f["name"]], destdir=str(out_dir), ignore_existing=True)
+                downloads[pool.submit(fetch, identifier, f)] = (identifier, f["name"])
+
+        for fut in as_completed(downloads):
+            identifier, name = downloads[fut]
+            try:
+                info = fut.result()
+            except Exception as e:
+                print(f"{identifier}/{name}: failed: {e}")
+                failed.add(identifier); stats["failed"] += 1
+            else:
+                if info is None:
+                    stats["files_skipped"] += 1
+                else:
+                    stats["files"] += 1; stats["bytes"] += info["size"]
+                    print(f"Downloaded {identifier}/{name} ({info['size']} bytes)")
+            left[identifier] -= 1
+            if not left[identifier] and identifier not in failed:
+                m.finish_item(identifier, chosen[identifier])
+    return stats
+
+def main():
+    ap = argparse.ArgumentParser(description="Download archive.org items for the configured queries into data/.")
+    ap.add_argument("--workers", type=int, default=8, help="Concurrent metadata/file requests")
+    ap.add_argument("--formats", type=str, default=FORMATS,
+                    help="Comma list of file suffixes in order of preference; only the first one an item has is fetched")
+    ap.add_argument("--manifest", type=str, default="download_manifest.sqlite", help="Record of verified downloads, for resuming")
+    ap.add_argument("--refresh", action="store_true", help="Re-check items the manifest marks as complete")
+    args = ap.parse_args()
+    formats = [s.strip().lower() for s in args.formats.split(",") if s.strip()]
+    stats = run(QUERIES, DATA_DIR, manifest=pathlib.Path(args.manifest), formats=formats,
+                workers=args.workers, refresh=args.refresh)
+    print(f"Done: {stats['items']} items checked ({stats['items_skipped']} already complete), {stats['files']} files "
+          f"downloaded ({stats['bytes']} bytes), {stats['files_skipped']} already present, {stats['failed']} failures")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,71 @@
+# ingest/manifest.py
+import json, sqlite3, hashlib, threading, pathlib
+from typing import Dict, List, Tuple
+
+def sha256(data) -> str:
+    return hashlib.sha256(data.encode("utf-8") if isinstance(data, str) else data).hexdigest()
+
+class Manifest:
+    """What is in the store, per document and per chunk, as of the last store commit.
+
+    docs(name, hash, complete) and chunks(id, doc, hash) live in one SQLite file, committed
+    right after each store commit. A document whose file hash matches a complete entry is
+    skipped. Changing the chunking settings or the embedding model (the `signature`) marks
+    every document for re-chunking.
+    """
+
+    def __init__(self, path: pathlib.Path, signature: dict, reset: bool = False):
+        self.path = path
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS docs (name TEXT PRIMARY KEY, hash TEXT, complete INTEGER);
+            CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, doc TEXT, hash TEXT);
+            CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc);
+        """)
+        sig = json.dumps(signature, sort_keys=True)
+        row = self._db.execute("SELECT value FROM meta WHERE key='signature'").fetchone()
+        if reset or (row and row[0] != sig):
+            self._db.execute("UPDATE docs SET complete=0")
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (sig,))
+        self._db.commit()
+
+    def is_current(self, name: str, doc_hash: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT hash, complete FROM docs WHERE name=?", (name,)).fetchone()
+        return row is not None and row[0] == doc_hash and bool(row[1])
+
+    def chunk_hashes(self, name: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._db.execute("SELECT id, hash FROM chunks WHERE doc=?", (name,)))
+
+    def doc_names(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT name FROM docs")]
+
+    def add_chunks(self, name: str, chunks: List[Tuple[str, str]]):
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO docs VALUES (?, '', 0)", (name,))
+            self._db.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)", [(i, name, h) for i, h in chunks])
+
+    def finish_doc(self, name: str, doc_hash: str, ids: List[str]) -> List[str]:
+        """Mark the document current; returns its chunk ids that are no longer produced."""
+        keep = set(ids)
+        with self._lock:
+            stale = [r[0] for r in self._db.execute("SELECT id FROM chunks WHERE doc=?", (name,)) if r[0] not in keep]
+            self._db.executemany("DELETE FROM chunks WHERE id=?", [(i,) for i in stale])
+            self._db.execute("INSERT OR REPLACE INTO docs VALUES (?, ?, 1)", (name, doc_hash))
+        return stale
+
+    def remove_doc(self, name: str) -> List[str]:
+        with self._lock:
+            ids = [r[0] for r in self._db.execute("SELECT id FROM chunks WHERE doc=?", (name,))]
+            self._db.execute("DELETE FROM chunks WHERE doc=?", (name,))
+            self._db.execute("DELETE FROM docs WHERE name=?", (name,))
+        return ids
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
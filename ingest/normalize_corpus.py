@@ -2,9 +2,13 @@
 import os
 import re
 import json
+import shutil
 import argparse
 import pathlib
+import tempfile
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from typing import Dict
 
 # --- Windows-safe console ---
@@ -30,54 +34,222 @@ JUNK_RANGES = [
 DIACRITIC_HINTS = set("āīūṛṝḷṅñṭḍṇśṣḥ ṃṁ")
 DEVANAGARI_RANGE = (0x0900, 0x097F)
 
-def in_ranges(ch: str, ranges) -> bool:
-    cp = ord(ch)
-    return any(a <= cp <= b for a, b in ranges)
-
-def strip_non_text(s: str) -> str:
-    # Remove control chars
-    s = re.sub(r"[\x00-\x1F\x7F]", " ", s)
-    # Remove Private Use / junk glyphs
-    s = "".join("" if in_ranges(c, JUNK_RANGES) else c for c in s)
-    # Collapse repeated symbols often seen in bad extracts
-    s = re.sub(r"[•·◊◦■□▪▫◆◇◻◼◾◽∑§¥]+", " ", s)
-    return s
-
-def normalize_ligatures(s: str) -> str:
-    for k, v in LIGATURES.items():
-        s = s.replace(k, v)
-    return s
-
-def normalize_spaces(s: str) -> str:
-    # Keep paragraph boundaries if present, then collapse inner whitespace
-    s = re.sub(r"[ \t\r\f\v]+", " ", s)   # collapse spaces/tabs
-    s = re.sub(r"\n{3,}", "\n\n", s)      # clamp giant newlines
-    s = re.sub(r"[ ]?\n[ ]?", "\n", s)    # trim spaces around newlines
-    return s.strip()
+SYMBOLS = "•·◊◦■□▪▫◆◇◻◼◾◽∑§¥"  # repeated symbols often seen in bad extracts
+STREAM_MB = 64        # inputs larger than this are streamed instead of loaded whole
+STREAM_CHARS = 1 << 20
+
+# One translate pass: control chars -> space, BMP private use -> dropped, ligatures expanded.
+# The astral private-use planes are too large for a table and go through a regex instead.
+_TABLE = str.maketrans({
+    **{chr(c): " " for c in [*range(0x20), 0x7F]},
+    **{chr(c): None for a, b in JUNK_RANGES if b <= 0xFFFF for c in range(a, b + 1)},
+    **LIGATURES,
+})
+_ASTRAL_JUNK = re.compile("[%s]+" % "".join(f"{chr(a)}-{chr(b)}" for a, b in JUNK_RANGES if b > 0xFFFF))
+# A run of spaces and symbols becomes one space unless it already is one (the old code replaced
+# symbol runs by a space and then collapsed spaces).
+_RUNS = re.compile("(?=[ {0}]{{2}}|[{0}])[ {0}]+".format(re.escape(SYMBOLS)))
+_DEVANAGARI = re.compile("[%s-%s]" % tuple(map(chr, DEVANAGARI_RANGE)))
+
+def _clean(s: str) -> str:
+    # clean_text() without the final strip. Newlines are control chars, so after the
+    # translate only space runs are left to collapse.
+    return _RUNS.sub(" ", _ASTRAL_JUNK.sub("", s.translate(_TABLE)))
+
+def clean_text(raw: str) -> str:
+    return _clean(raw).strip()
+
+@lru_cache(maxsize=None)
+def _combining() -> dict:
+    # translate table dropping every combining mark
+    return {cp: None for cp in range(sys.maxunicode + 1) if unicodedata.combining(chr(cp))}
 
 def strip_accents(s: str) -> str:
     # Convert to NFKD and drop combining marks
-    return "".join(
-        c for c in unicodedata.normalize("NFKD", s)
-        if not unicodedata.combining(c)
-    )
+    return unicodedata.normalize("NFKD", s).translate(_combining())
+
+class _LangGuess:
+    # guess_lang() fed piece by piece
+    def __init__(self):
+        self.devanagari = self.hint = False
+
+    def feed(self, text: str):
+        self.devanagari = self.devanagari or _DEVANAGARI.search(text) is not None
+        if not self.hint:
+            low = text.lower()
+            self.hint = any(ch in low for ch in DIACRITIC_HINTS)
+
+    def result(self) -> str:
+        return "hi" if self.devanagari else "sa-Latn" if self.hint else "en"
 
 def guess_lang(text: str) -> str:
     # Heuristic: if Devanagari present → "hi"; if Latin with Sanskrit diacritics → "sa-Latn"; else "en"
-    if any(DEVANAGARI_RANGE[0] <= ord(c) <= DEVANAGARI_RANGE[1] for c in text):
-        return "hi"
-    low = text.lower()
-    if any(ch in low for ch in DIACRITIC_HINTS):
-        return "sa-Latn"
-    return "en"
+    g = _LangGuess()
+    g.feed(text)
+    return g.result()
 
-def clean_text(raw: str) -> str:
-    t = strip_non_text(raw)
-    t = normalize_ligatures(t)
-    t = normalize_spaces(t)
-    return t
+def _is_run_char(c: str) -> bool:
+    cp = ord(c)
+    return c == " " or cp < 0x20 or cp == 0x7F or c in SYMBOLS or any(a <= cp <= b for a, b in JUNK_RANGES)
+
+class StreamCleaner:
+    """clean_text() over text that arrives in pieces; the joined output is identical.
+
+    Each piece is cut before its trailing run of space/control/junk/symbol chars, which is
+    carried into the next piece, and leading/trailing whitespace is held back for the strip.
+    """
+
+    def __init__(self):
+        self.carry = self.ws = ""
+        self.started = False
+
+    def _emit(self, t: str) -> str:
+        if not self.started:
+            t = t.lstrip()
+            if not t:
+                return ""
+            self.started = True
+        t = self.ws + t
+        body = t.rstrip()
+        self.ws = t[len(body):]
+        return body
+
+    def feed(self, piece: str) -> str:
+        s = self.carry + piece
+        cut = len(s)
+        while cut and _is_run_char(s[cut - 1]):
+            cut -= 1
+        self.carry = s[cut:]
+        return self._emit(_clean(s[:cut]))
+
+    def close(self) -> str:
+        out, self.carry = self._emit(_clean(self.carry)), ""
+        return out
+
+# --- streaming reader for {"meta": ..., "content": "<huge string>"} ---
+_WS = re.compile(r"[ \t\n\r]*")
+# whole string tokens only, so a piece never ends inside an escape or a surrogate pair
+_STR_PIECE = re.compile(r'(?:[^"\\]+|\\u[dD][89abAB][0-9a-fA-F]{2}\\u[dD][c-fC-F][0-9a-fA-F]{2}'
+                        r'|\\u(?![dD][89abAB])[0-9a-fA-F]{4}|\\[^u])*')
+_DECODER = json.JSONDecoder()
+
+class _JsonReader:
+    def __init__(self, f, size: int = 0):
+        self.f, self.size, self.buf, self.pos = f, size or STREAM_CHARS, "", 0
+
+    def fill(self) -> bool:
+        more = self.f.read(max(self.size, len(self.buf) - self.pos))
+        self.buf, self.pos = self.buf[self.pos:] + more, 0
+        return bool(more)
+
+    def peek(self) -> str:
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, ch: str):
+        if self.peek() != ch:
+            raise ValueError(f"expected {ch!r} at {self.buf[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                v, end = _DECODER.raw_decode(self.buf, self.pos)
+                if end < len(self.buf):  # a number at the very end of the buffer may continue
+                    self.pos = end
+                    return v
+            except json.JSONDecodeError:
+                pass
+            if not self.fill():
+                v, self.pos = _DECODER.raw_decode(self.buf, self.pos)
+                return v
+
+    def string_pieces(self):
+        self.expect('"')
+        while True:
+            end = _STR_PIECE.match(self.buf, self.pos).end()
+            if end < len(self.buf) and self.buf[end] == '"':
+                yield json.loads('"' + self.buf[self.pos:end] + '"')
+                self.pos = end + 1
+                return
+            if end < len(self.buf) - 12:  # not a split token: a lone surrogate or an invalid escape
+                end = min(len(self.buf), end + 6)
+            if end > self.pos:
+                yield json.loads('"' + self.buf[self.pos:end] + '"')
+                self.pos = end
+            elif not self.fill():
+                raise ValueError("unterminated string")
+
+def iter_document(f, on_content) -> dict:
+    """Parse a top-level JSON object, passing the "content" string to on_content in pieces.
+
+    Returns the other keys; the whole document is never held in memory.
+    """
+    doc = {}
+    r = _JsonReader(f)
+    r.expect("{")
+    while r.peek() != "}":
+        key = r.value()
+        r.expect(":")
+        if key == "content" and r.peek() == '"':
+            for piece in r.string_pieces():
+                on_content(piece)
+        else:
+            doc[key] = r.value()
+        if r.peek() == ",":
+            r.pos += 1
+    return doc
+
+def _process_stream(path_in: pathlib.Path, path_out: pathlib.Path, keep_diacritics: bool) -> Dict:
+    # Same output as the in-memory path. The cleaned text is written JSON-escaped to two temp
+    # files (raw and ascii) and spliced into the output once meta["language"] is known.
+    cleaner, lang = StreamCleaner(), _LangGuess()
+    chars = {"in": 0, "raw": 0, "ascii": 0}
+    path_out.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryFile("w+", encoding="utf-8", dir=path_out.parent) as raw_f, \
+         tempfile.TemporaryFile("w+", encoding="utf-8", dir=path_out.parent) as ascii_f:
+        def write(t: str):
+            if t:
+                lang.feed(t)
+                a = strip_accents(t)
+                chars["raw"] += len(t); chars["ascii"] += len(a)
+                raw_f.write(json.dumps(t, ensure_ascii=False)[1:-1])
+                ascii_f.write(json.dumps(a, ensure_ascii=False)[1:-1])
+
+        def on_content(piece: str):
+            chars["in"] += len(piece)
+            write(cleaner.feed(piece))
+
+        with path_in.open("r", encoding="utf-8") as f:
+            doc = iter_document(f, on_content)
+        write(cleaner.close())
+
+        meta = dict(doc.get("meta", {}))
+        meta["language"] = lang.result()
+        with path_out.open("w", encoding="utf-8") as out:
+            out.write('{"meta": ' + json.dumps(meta, ensure_ascii=False))
+            for key, src in (("content", raw_f if keep_diacritics else ascii_f), ("text_raw", raw_f), ("text_ascii", ascii_f)):
+                out.write(f', "{key}": "')
+                src.seek(0)
+                shutil.copyfileobj(src, out)
+                out.write('"')
+            out.write("}")
+
+    return {
+        "in": str(path_in),
+        "out": str(path_out),
+        "chars_in": chars["in"],
+        "chars_out": chars["raw" if keep_diacritics else "ascii"],
+        "lang": meta["language"]
+    }
+
+def process_file(path_in: pathlib.Path, path_out: pathlib.Path, keep_diacritics: bool, stream_mb: float = STREAM_MB) -> Dict:
+    if path_in.stat().st_size > stream_mb * 1e6:
+        return _process_stream(path_in, path_out, keep_diacritics)
 
-def process_file(path_in: pathlib.Path, path_out: pathlib.Path, keep_diacritics: bool) -> Dict:
     with path_in.open("r", encoding="utf-8") as f:
         doc = json.load(f)
 
@@ -111,11 +283,16 @@ def process_file(path_in: pathlib.Path, path_out: pathlib.Path, keep_diacritics:
         "lang": meta["language"]
     }
 
+def _process_into(p: pathlib.Path, out_dir: pathlib.Path, keep_diacritics: bool, stream_mb: float) -> Dict:
+    return process_file(p, out_dir / p.name, keep_diacritics=keep_diacritics, stream_mb=stream_mb)
+
 def main():
     ap = argparse.ArgumentParser(description="Normalize parsed PDF JSON into clean text for embeddings.")
     ap.add_argument("--in_dir", type=str, default="processed", help="Input directory containing *.json")
     ap.add_argument("--out_dir", type=str, default="processed_clean", help="Output directory")
     ap.add_argument("--keep-diacritics", action="store_true", help="Keep diacritics in main content field (also writes text_ascii)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Files normalized in parallel (1: no process pool)")
+    ap.add_argument("--stream-mb", type=float, default=STREAM_MB, help="Stream inputs larger than this instead of loading them whole")
     args = ap.parse_args()
 
     in_dir = pathlib.Path(args.in_dir)
@@ -131,13 +308,17 @@ def main():
     print(f"Normalizing {len(files)} files...")
     total_chars_in = total_chars_out = 0
 
-    for i, p in enumerate(files, 1):
-        p_out = out_dir / p.name
-        info = process_file(p, p_out, keep_diacritics=args.keep_diacritics)
+    work = partial(_process_into, out_dir=out_dir, keep_diacritics=args.keep_diacritics, stream_mb=args.stream_mb)
+    pool = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    results = pool.map(work, files) if pool else map(work, files)
+
+    for i, (p, info) in enumerate(zip(files, results), 1):
         total_chars_in += info["chars_in"]
         total_chars_out += info["chars_out"]
         print(f"[{i}/{len(files)}] {p.name} → lang={info['lang']} chars={info['chars_out']}")
 
+    if pool:
+        pool.shutdown()
     print("Done.")
     print(f"Chars in  : {total_chars_in}")
     print(f"Chars out : {total_chars_out}")
@@ -1,53 +1,168 @@
 # ingest/parse_pdf.py
-import os, pathlib, json, re
+# Extracts data/<item>/**/*.{pdf,txt,xml,djvu} into processed/<item>.json.
+# Files (and page ranges of PDFs) are extracted in a process pool with a time budget per task;
+# results are cached per source file, so a rerun only touches new or changed files.
+# Image-only PDFs can be OCR'd (--ocr) in a separate, smaller pool.
+import os, json, re, zlib, signal, sqlite3, hashlib, argparse, pathlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
 from pypdf import PdfReader
 from langdetect import detect
 from bs4 import BeautifulSoup
 
 DATA_DIR = pathlib.Path("data")
 OUT_DIR = pathlib.Path("processed"); OUT_DIR.mkdir(exist_ok=True)
+CACHE_PATH = pathlib.Path("parse_cache.sqlite")
+PAGES_PER_TASK = 16   # PDF pages per extraction task
+OCR_PAGES_PER_TASK = 4
+FILE_TIMEOUT = 300    # seconds per txt/xml file or PDF page range
 
-def extract_text_from_pdf(pdf_path: pathlib.Path) -> str:
-    text_parts = []
+class ExtractTimeout(Exception):
+    pass
+
+@contextmanager
+def time_budget(seconds: float):
+    # SIGALRM interrupts pure-Python extraction (pypdf, bs4) in the worker itself; without
+    # SIGALRM (Windows) tasks run unbounded
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield; return
+    def fire(*_):
+        raise ExtractTimeout()
+    old = signal.signal(signal.SIGALRM, fire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
     try:
-        reader = PdfReader(str(pdf_path))
-        for page in reader.pages:
-            text_parts.append(page.extract_text() or "")
-        text = "\n".join(text_parts).strip()
-        if text:
-            return text
-    except Exception:
-        pass
-    # OCR fallback for image-only PDFs (optional; omitted for brevity)
-    # You can add pdf2image + pytesseract here if needed.
-    return ""
-
-def extract_text_from_txt(txt_path: pathlib.Path) -> str:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old)
+
+def source_kind(p: pathlib.Path) -> Optional[str]:
+    low = p.name.lower()
+    if low.endswith(".pdf"):
+        return "pdf"
+    if low.endswith(".txt"):
+        return "txt"
+    if low.endswith(".xml") or low.endswith(".djvu"):
+        return "xml"
+    return None
+
+def pdf_page_count(pdf_path: pathlib.Path, timeout: float = 0) -> int:
+    with time_budget(timeout):
+        try:
+            return len(PdfReader(str(pdf_path)).pages)
+        except ExtractTimeout:
+            raise
+        except Exception:
+            return 0
+
+def pdf_pages_text(pdf_path: pathlib.Path, start: int, stop: int, timeout: float = 0) -> List[str]:
+    # a page that fails to extract contributes "" instead of failing the whole file
+    with time_budget(timeout):
+        try:
+            pages = PdfReader(str(pdf_path)).pages
+        except ExtractTimeout:
+            raise
+        except Exception:
+            return []
+        out = []
+        for i in range(start, min(stop, len(pages))):
+            try:
+                out.append(pages[i].extract_text() or "")
+            except ExtractTimeout:
+                raise
+            except Exception:
+                out.append("")
+        return out
+
+def ocr_pages_text(pdf_path: pathlib.Path, start: int, stop: int, lang: str = "eng", dpi: int = 200,
+                   timeout: float = 0) -> List[str]:
+    from pdf2image import convert_from_path
+    import pytesseract
+    with time_budget(timeout):
+        images = convert_from_path(str(pdf_path), dpi=dpi, first_page=start + 1, last_page=stop)
+        return [pytesseract.image_to_string(img, lang=lang) for img in images]
+
+def _ocr_worker_init():
+    # one tesseract thread per worker; the pool size is the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def extract_text_from_txt(txt_path: pathlib.Path, timeout: float = 0) -> str:
     return txt_path.read_text(encoding="utf-8", errors="ignore")
 
-def extract_text_from_xml(xml_path: pathlib.Path) -> str:
-    soup = BeautifulSoup(xml_path.read_text(encoding="utf-8", errors="ignore"), "lxml")
-    return soup.get_text(" ").strip()
+def extract_text_from_xml(xml_path: pathlib.Path, timeout: float = 0) -> str:
+    with time_budget(timeout):
+        soup = BeautifulSoup(xml_path.read_text(encoding="utf-8", errors="ignore"), "lxml")
+        return soup.get_text(" ").strip()
+
+EXTRACTORS = {"txt": extract_text_from_txt, "xml": extract_text_from_xml}
 
 def normalize_text(s: str) -> str:
     s = re.sub(r"\s+\n", "\n", s)
     s = re.sub(r"\n{3,}", "\n\n", s)
     return s.strip()
 
-def process_item(item_dir: pathlib.Path):
-    texts = []
-    for p in item_dir.rglob("*"):
-        low = p.name.lower()
-        if low.endswith(".pdf"):
-            t = extract_text_from_pdf(p)
-        elif low.endswith(".txt"):
-            t = extract_text_from_txt(p)
-        elif low.endswith(".xml") or low.endswith(".djvu"):
-            t = extract_text_from_xml(p)
-        else:
-            continue
-        if t:
-            texts.append(t)
+def file_hash(p: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with p.open("rb") as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.hexdigest()
+
+class ParseCache:
+    """Extracted text per source file.
+
+    A file whose size and mtime match its row is a hit without being read; otherwise the
+    content hash decides (a touched but unchanged file is still a hit).
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self._db = sqlite3.connect(str(path))
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,
+                            hash TEXT, status TEXT, ocr INTEGER, text BLOB)""")
+        self._db.execute("CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY, sources TEXT)")
+        self._db.commit()
+
+    def lookup(self, p: pathlib.Path) -> Tuple[Optional[dict], str]:
+        # -> (cached entry or None, content hash or "" when the stat matched)
+        st = p.stat()
+        row = self._db.execute("SELECT size, mtime_ns, hash, status, ocr, text FROM files WHERE path=?", (str(p),)).fetchone()
+        if row and (row[0], row[1]) == (st.st_size, st.st_mtime_ns):
+            return self._entry(row), ""
+        h = file_hash(p)
+        if row and row[2] == h:
+            self._db.execute("UPDATE files SET size=?, mtime_ns=? WHERE path=?", (st.st_size, st.st_mtime_ns, str(p)))
+            self._db.commit()
+            return self._entry(row), h
+        return None, h
+
+    @staticmethod
+    def _entry(row) -> dict:
+        return {"status": row[3], "ocr": bool(row[4]), "text": zlib.decompress(row[5]).decode("utf-8")}
+
+    def put(self, p: pathlib.Path, h: str, status: str, ocr: bool, text: str):
+        st = p.stat()
+        self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (str(p), st.st_size, st.st_mtime_ns, h or file_hash(p), status, int(ocr),
+                          zlib.compress(text.encode("utf-8"), 1)))
+        self._db.commit()
+
+    def item_current(self, item: pathlib.Path, paths: List[pathlib.Path]) -> bool:
+        # the item's output was written from exactly these cached files
+        row = self._db.execute("SELECT sources FROM items WHERE name=?", (item.name,)).fetchone()
+        return row is not None and row[0] == self._sources(paths)
+
+    def mark_item(self, item: pathlib.Path, paths: List[pathlib.Path]):
+        self._db.execute("INSERT OR REPLACE INTO items VALUES (?, ?)", (item.name, self._sources(paths)))
+        self._db.commit()
+
+    def _sources(self, paths: List[pathlib.Path]) -> str:
+        q = "SELECT hash FROM files WHERE path=?"
+        return json.dumps([(str(p), (self._db.execute(q, (str(p),)).fetchone() or [""])[0]) for p in paths])
+
+def write_item(item_dir: pathlib.Path, texts: List[str]):
+    texts = [t for t in texts if t]
     if not texts: return
     content = "\n\n".join(texts)
     lang = detect(content)
@@ -55,10 +170,129 @@ def process_item(item_dir: pathlib.Path):
     out = {"meta": meta, "content": normalize_text(content)}
     (OUT_DIR / f"{item_dir.name}.json").write_text(json.dumps(out, ensure_ascii=False), encoding="utf-8")
 
+class Extraction:
+    """Schedules file, page-range and OCR tasks and reports each file once it is final."""
+
+    def __init__(self, workers: int, timeout: float, ocr_workers: int = 0, ocr_lang: str = "eng", ocr_dpi: int = 200):
+        self.pool = ProcessPoolExecutor(workers)
+        self.ocr_pool = ProcessPoolExecutor(ocr_workers, initializer=_ocr_worker_init) if ocr_workers else None
+        self.timeout, self.ocr_lang, self.ocr_dpi = timeout, ocr_lang, ocr_dpi
+        self.pending = {}   # future -> (path, task kind, first page)
+        self.files = {}     # path -> {"kind", "pages", "parts", "left", "status", "ocr"}
+
+    def submit(self, p: pathlib.Path, kind: str):
+        self.files[p] = {"kind": kind, "pages": 0, "parts": {}, "left": 1, "status": "ok", "ocr": False}
+        if kind == "pdf":
+            self._task(self.pool, p, "count", 0, pdf_page_count, p, self.timeout)
+        else:
+            self._task(self.pool, p, "text", 0, EXTRACTORS[kind], p, self.timeout)
+
+    def _task(self, pool, p, task, start, fn, *args):
+        self.pending[pool.submit(fn, *args)] = (p, task, start)
+
+    def _ranges(self, p, pool, per_task, fn, *args):
+        f = self.files[p]
+        f["parts"], f["left"] = {}, 0
+        for start in range(0, f["pages"], per_task):
+            self._task(pool, p, "pages", start, fn, p, start, min(start + per_task, f["pages"]), *args)
+            f["left"] += 1
+
+    def results(self):
+        # yields (path, status, ocr, text) as files finish
+        while self.pending:
+            done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                p, task, start = self.pending.pop(fut)
+                f = self.files[p]
+                if fut.cancelled() or f["status"] == "timeout":
+                    continue
+                try:
+                    res = fut.result()
+                except ExtractTimeout:
+                    f["status"] = "timeout"
+                    for other, (q, _, _) in list(self.pending.items()):
+                        if q == p and other.cancel():
+                            self.pending.pop(other)
+                    yield p, "timeout", f["ocr"], ""
+                    continue
+                except Exception:
+                    res = {"count": 0, "pages": []}.get(task, "")
+                if task == "count":
+                    f["pages"] = res
+                    self._ranges(p, self.pool, PAGES_PER_TASK, pdf_pages_text, self.timeout)
+                    if f["left"]:
+                        continue
+                else:
+                    f["parts"][start] = res if task == "pages" else [res]
+                    f["left"] -= 1
+                    if f["left"]:
+                        continue
+                text = "\n".join(t for s in sorted(f["parts"]) for t in f["parts"][s]).strip()
+                if not text and f["kind"] == "pdf" and f["pages"] and self.ocr_pool and not f["ocr"]:
+                    f["ocr"] = True
+                    self._ranges(p, self.ocr_pool, OCR_PAGES_PER_TASK, ocr_pages_text, self.ocr_lang, self.ocr_dpi, self.timeout)
+                    continue
+                yield p, "ok", f["ocr"], text
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        if self.ocr_pool:
+            self.ocr_pool.shutdown(cancel_futures=True)
+
 def main():
-    for item_dir in DATA_DIR.iterdir():
-        if item_dir.is_dir():
-            process_item(item_dir)
+    ap = argparse.ArgumentParser(description="Extract text from data/<item>/ into processed/<item>.json.")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes")
+    ap.add_argument("--timeout", type=float, default=FILE_TIMEOUT, help="Seconds per txt/xml file or PDF page range (0: none)")
+    ap.add_argument("--cache", type=str, default=str(CACHE_PATH), help="Per-file extraction cache")
+    ap.add_argument("--ocr", action="store_true", help="OCR PDFs without a text layer (needs poppler + tesseract)")
+    ap.add_argument("--ocr-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Concurrent OCR processes")
+    ap.add_argument("--ocr-lang", type=str, default="eng", help="tesseract languages, e.g. eng+hin+san")
+    ap.add_argument("--ocr-dpi", type=int, default=200)
+    ap.add_argument("--retry-timeouts", action="store_true", help="Retry files that timed out on an earlier run")
+    args = ap.parse_args()
+
+    cache = ParseCache(pathlib.Path(args.cache))
+    items = sorted(d for d in DATA_DIR.iterdir() if d.is_dir())
+    texts: Dict[pathlib.Path, str] = {}
+    hashes: Dict[pathlib.Path, str] = {}
+    sources = {item: [p for p in item.rglob("*") if p.is_file() and source_kind(p)] for item in items}
+    todo = {}
+    for item, paths in sources.items():
+        for p in paths:
+            hit, hashes[p] = cache.lookup(p)
+            stale = hit is None or (hit["status"] == "timeout" and args.retry_timeouts) \
+                or (args.ocr and not hit["text"] and not hit["ocr"] and source_kind(p) == "pdf")
+            if stale:
+                todo[p] = item
+            else:
+                texts[p] = hit["text"]
+
+    def finish(item):
+        write_item(item, [texts[p] for p in sources[item]])
+        cache.mark_item(item, sources[item])
+
+    left = {item: sum(todo.get(p) is item for p in paths) for item, paths in sources.items()}
+    written = 0
+    for item, paths in sources.items():
+        if not left[item] and not ((OUT_DIR / f"{item.name}.json").exists() and cache.item_current(item, paths)):
+            finish(item); written += 1
+    print(f"{len(items)} items, {sum(map(len, sources.values()))} files, {len(todo)} to extract")
+
+    ex = Extraction(args.workers, args.timeout, args.ocr_workers if args.ocr else 0, args.ocr_lang, args.ocr_dpi)
+    try:
+        for p in todo:
+            ex.submit(p, source_kind(p))
+        for n, (p, status, ocr, text) in enumerate(ex.results(), 1):
+            cache.put(p, hashes[p], status, ocr, text)
+            texts[p] = text
+            item = todo[p]
+            print(f"[{n}/{len(todo)}] {p} {status}{' (ocr)' if ocr else ''} chars={len(text)}")
+            left[item] -= 1
+            if not left[item]:
+                finish(item); written += 1
+    finally:
+        ex.close()
+    print(f"Done: {written} items written to {OUT_DIR}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,258 @@
+# ingest/pipeline.py
+# Staged ingest shared by upsert_local.py and upsert_qdrant.py:
+#   chunking (worker threads or processes) -> batched embedding (N concurrent requests) -> ordered store writes
+# Embedding concurrency shrinks on 429s / low remaining quota and grows back on success,
+# failed requests are retried with exponential backoff, and a manifest (ingest/manifest.py),
+# committed together with the store, lets a rerun skip everything already ingested.
+import os, re, json, time, random, asyncio, pathlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from app.chunking import build_payloads
+from app.cache import EmbeddingCache
+from ingest.manifest import Manifest, sha256
+
+load_dotenv()
+EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))          # texts per embeddings request
+EMBED_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))     # max in-flight embeddings requests
+MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "8"))
+CHECKPOINT_EVERY = int(os.getenv("INGEST_CHECKPOINT_EVERY", "50"))  # batches between store + manifest commits
+CHUNK_PROCESSES = int(os.getenv("INGEST_CHUNK_PROCESSES", "0"))   # 0: chunk in worker threads
+CHUNK_BOUNDARY = os.getenv("INGEST_CHUNK_BOUNDARY", "") or None   # "verse", "paragraph" or a regex
+
+def parse_duration(s: str) -> float:
+    # OpenAI reset headers look like "1s", "20ms", "6m0s", "1h2m3.5s"
+    if not s:
+        return 0.0
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(v) * units[u] for v, u in re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", s))
+
+def backoff(attempt: int) -> float:
+    return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+def chunk_doc(raw: bytes, max_tokens: int, boundary=None) -> list:
+    # module level so it can run in a process pool
+    chunks = list(build_payloads(json.loads(raw), max_tokens=max_tokens, boundary=boundary))
+    for pl in chunks:
+        pl["text_hash"] = sha256(pl["text"])
+        pl["hash"] = sha256(json.dumps(pl["metadata"], sort_keys=True, ensure_ascii=False) + pl["text_hash"])
+    return chunks
+
+class RateGate:
+    """Concurrency gate for upstream requests that adapts to rate-limit feedback."""
+
+    def __init__(self, max_concurrency: int):
+        self.max = self.limit = max_concurrency
+        self.active = 0
+        self.resume_at = 0.0   # monotonic time before which nobody may send
+        self._ok = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def throttle(self, delay: float):
+        # a 429: halve concurrency and pause everyone
+        self.limit = max(1, self.limit // 2)
+        self._ok = 0
+        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+
+    def observe(self, headers):
+        rem_req = headers.get("x-ratelimit-remaining-requests")
+        rem_tok = headers.get("x-ratelimit-remaining-tokens")
+        low = (rem_req is not None and int(rem_req) <= self.limit) or (rem_tok is not None and int(rem_tok) < 50_000)
+        if low:
+            wait = max(parse_duration(headers.get("x-ratelimit-reset-requests", "")),
+                       parse_duration(headers.get("x-ratelimit-reset-tokens", "")))
+            self.resume_at = max(self.resume_at, time.monotonic() + wait)
+            return
+        self._ok += 1
+        if self._ok >= self.limit and self.limit < self.max:
+            self.limit += 1
+            self._ok = 0
+
+async def _run(files, store, manifest: Manifest, reuse: EmbeddingCache, concurrency: int, batch_size: int, max_tokens: int,
+               boundary=None, processes: int = 0):
+    aclient = AsyncOpenAI(max_retries=0)  # retries are handled here, with the rate gate
+    gate = RateGate(concurrency)
+    todo: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    done: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {"docs_skipped": 0, "docs_changed": 0, "docs_removed": 0, "chunks_kept": 0, "chunks_reused": 0,
+             "chunks_embedded": 0, "chunks_deleted": 0, "tokens": 0, "retries": 0}
+    t0 = time.perf_counter()
+
+    async def embed(texts):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with gate:
+                    raw = await aclient.embeddings.with_raw_response.create(model=EMBED_MODEL, input=texts)
+                    gate.observe(raw.headers)
+                resp = raw.parse()
+                return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)], resp.usage.total_tokens
+            except openai.RateLimitError as e:
+                if attempt == MAX_RETRIES: raise
+                gate.throttle(float(e.response.headers.get("retry-after", 0)) or backoff(attempt))
+            except (openai.APIConnectionError, openai.InternalServerError):
+                if attempt == MAX_RETRIES: raise
+                await asyncio.sleep(backoff(attempt))
+            stats["retries"] += 1
+
+    def check(p: pathlib.Path):
+        # -> (raw, doc hash) or None when the manifest says the document is current
+        raw = p.read_bytes()
+        doc_hash = sha256(raw)
+        return None if manifest.is_current(p.name, doc_hash) else (raw, doc_hash)
+
+    def resolve(name: str, chunks: list) -> list:
+        old = manifest.chunk_hashes(name)
+        for pl in chunks:
+            pl["vector"] = None if old.get(pl["id"]) != pl["hash"] else False  # False: already stored as is
+        fresh = [pl for pl in chunks if pl["vector"] is None]
+        for pl, vec in zip(fresh, reuse.get_many([pl["text_hash"] for pl in fresh])):
+            pl["vector"] = vec
+        return chunks
+
+    pool = ProcessPoolExecutor(processes) if processes > 0 else None
+
+    async def plan(p: pathlib.Path):
+        checked = await asyncio.to_thread(check, p)
+        if checked is None:
+            return None
+        raw, doc_hash = checked
+        chunks = await asyncio.get_running_loop().run_in_executor(pool, chunk_doc, raw, max_tokens, boundary)
+        return doc_hash, await asyncio.to_thread(resolve, p.name, chunks)
+
+    async def produce():
+        # chunking and hashing are CPU-bound: a few documents are planned ahead, in worker
+        # threads or a process pool, and consumed in file order
+        seq = 0
+        ahead = deque()
+        files_iter = iter(files)
+        while True:
+            while len(ahead) < max(2, processes * 2) and (p := next(files_iter, None)) is not None:
+                ahead.append((p, asyncio.ensure_future(plan(p))))
+            if not ahead:
+                break
+            p, fut = ahead.popleft()
+            planned = await fut
+            if planned is None:
+                stats["docs_skipped"] += 1; continue
+            doc_hash, chunks = planned
+            stats["docs_changed"] += 1
+            stats["chunks_kept"] += sum(pl["vector"] is False for pl in chunks)
+            reused = [pl for pl in chunks if pl["vector"] not in (None, False)]
+            missing = [pl for pl in chunks if pl["vector"] is None]
+            for i in range(0, len(reused), batch_size):
+                await done.put((seq, "write", (p.name, reused[i:i + batch_size], False))); seq += 1
+            for i in range(0, len(missing), batch_size):
+                await todo.put((seq, p.name, missing[i:i + batch_size])); seq += 1
+            await done.put((seq, "finish", (p.name, doc_hash, [pl["id"] for pl in chunks]))); seq += 1
+        names = {p.name for p in files}
+        for name in await asyncio.to_thread(manifest.doc_names):
+            if name not in names:
+                await done.put((seq, "remove", name)); seq += 1
+        for _ in range(concurrency):
+            await todo.put(None)
+        await done.put(None)
+
+    async def embedder():
+        while (job := await todo.get()) is not None:
+            seq, name, batch = job
+            vectors, tokens = await embed([pl["text"] for pl in batch])
+            for pl, v in zip(batch, vectors):
+                pl["vector"] = v
+            stats["tokens"] += tokens
+            await done.put((seq, "write", (name, batch, True)))
+        await done.put(None)
+
+    def apply(kind, item):
+        if kind == "write":
+            name, batch, embedded = item
+            store.upsert([pl["id"] for pl in batch], [pl["text"] for pl in batch],
+                         [pl["metadata"] for pl in batch], [pl["vector"] for pl in batch])
+            manifest.add_chunks(name, [(pl["id"], pl["hash"]) for pl in batch])
+            if embedded:
+                reuse.put_many([pl["text_hash"] for pl in batch], [pl["vector"] for pl in batch])
+            stats["chunks_embedded" if embedded else "chunks_reused"] += len(batch)
+        elif kind == "finish":
+            stale = manifest.finish_doc(*item)
+            store.delete(stale)
+            stats["chunks_deleted"] += len(stale)
+        else:
+            ids = manifest.remove_doc(item)
+            store.delete(ids)
+            stats["docs_removed"] += 1; stats["chunks_deleted"] += len(ids)
+
+    def checkpoint():
+        # the store first: a crash in between only makes the manifest lag behind the store
+        store.commit()
+        manifest.commit()
+
+    async def writer():
+        # results arrive out of order; apply them in sequence so a document's stale chunks
+        # are only deleted once all of its new chunks are written
+        pending, nxt, finished, writes = {}, 0, 0, 0
+        while finished < concurrency + 1:
+            res = await done.get()
+            if res is None:
+                finished += 1; continue
+            pending[res[0]] = res
+            while nxt in pending:
+                _, kind, item = pending.pop(nxt)
+                await asyncio.to_thread(apply, kind, item)
+                nxt += 1
+                if kind == "write":
+                    writes += 1
+                    if writes % CHECKPOINT_EVERY == 0:
+                        await asyncio.to_thread(checkpoint)
+                        el = time.perf_counter() - t0
+                        n = stats["chunks_embedded"] + stats["chunks_reused"]
+                        print(f"[{item[0]}] {n} chunks written, {n/el:.1f} chunks/s, "
+                              f"{stats['tokens']/el:.0f} tokens/s, concurrency={gate.limit}")
+        await asyncio.to_thread(checkpoint)
+
+    try:
+        await asyncio.gather(produce(), writer(), *(embedder() for _ in range(concurrency)))
+    finally:
+        await aclient.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    stats["seconds"] = time.perf_counter() - t0
+    n = stats["chunks_embedded"] + stats["chunks_reused"]
+    stats["chunks_per_s"] = n / stats["seconds"] if stats["seconds"] else 0.0
+    stats["tokens_per_s"] = stats["tokens"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+def run(data_dir: pathlib.Path, store, *, manifest: pathlib.Path, concurrency: int = EMBED_CONCURRENCY,
+        batch_size: int = EMBED_BATCH, max_tokens: int = 450, restart: bool = False,
+        boundary=CHUNK_BOUNDARY, processes: int = CHUNK_PROCESSES) -> dict:
+    """Bring `store` (upsert/delete/commit) in line with the *.json documents under data_dir.
+
+    Unchanged documents are skipped, chunks already stored unchanged are left alone,
+    chunks whose text was embedded before reuse that embedding, and chunks of changed
+    or removed documents that are no longer produced are deleted.
+    """
+    files = sorted(data_dir.glob("*.json"))
+    signature = {"model": EMBED_MODEL, "max_tokens": max_tokens, "boundary": boundary}
+    m = Manifest(manifest, signature, reset=restart)
+    # text hash -> embedding, in its own file so its writes never wait on the manifest transaction
+    reuse = EmbeddingCache(EMBED_MODEL, size=0, path=str(manifest.with_suffix(".embeddings.sqlite")), key=lambda h: h)
+    stats = asyncio.run(_run(files, store, m, reuse, concurrency, batch_size, max_tokens, boundary, processes))
+    print(f"Done in {stats['seconds']:.1f}s: {stats['docs_changed']} changed / {stats['docs_skipped']} unchanged / "
+          f"{stats['docs_removed']} removed docs; {stats['chunks_embedded']} chunks embedded, {stats['chunks_reused']} reused, "
+          f"{stats['chunks_kept']} kept, {stats['chunks_deleted']} deleted "
+          f"({stats['chunks_per_s']:.1f} chunks/s, {stats['tokens_per_s']:.0f} tokens/s, {stats['retries']} retries)")
+    return stats
@@ -1,38 +1,22 @@
 # ingest/upsert_local.py
-import os, json, pathlib
-from typing import List
+import argparse, pathlib
 from dotenv import load_dotenv
-from openai import OpenAI
-from app.chunking import build_payloads
 from app.vector_store import get_store
+from ingest import pipeline
 
 load_dotenv()
-EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
 DATA_DIR = pathlib.Path("processed_clean")  # use your cleaned corpus
 
-client = OpenAI()
-store = get_store()
-
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    resp = client.embeddings.create(model="text-embedding-3-small", input=texts)
-    return [d.embedding for d in resp.data]
-
 def main():
-    for p in DATA_DIR.glob("*.json"):
-        doc = json.loads(p.read_text(encoding="utf-8"))
-        batch_texts, ids, metas = [], [], []
-        for pl in build_payloads(doc, max_tokens=450):
-            batch_texts.append(pl["text"])
-            ids.append(pl["id"])
-            metas.append(pl["metadata"])
-            if len(batch_texts) >= 64:
-                vectors = embed_texts(batch_texts)
-                store.upsert(ids, batch_texts, metas, vectors)
-                batch_texts, ids, metas = [], [], []
-        if batch_texts:
-            vectors = embed_texts(batch_texts)
-            store.upsert(ids, batch_texts, metas, vectors)
-        print("Upserted", p.name)
+    ap = argparse.ArgumentParser(description="Chunk, embed and upsert processed_clean/*.json into the local vector store.")
+    ap.add_argument("--concurrency", type=int, default=pipeline.EMBED_CONCURRENCY, help="Max concurrent embeddings requests")
+    ap.add_argument("--manifest", type=str, default="ingest_manifest_local.sqlite", help="Manifest of what the store holds (also caches chunk embeddings)")
+    ap.add_argument("--restart", action="store_true", help="Re-chunk every document even if the manifest says it is current")
+    args = ap.parse_args()
+    store = get_store()  # FAISS: the staged generation, resumed if a previous run stopped before publishing
+    pipeline.run(DATA_DIR, store, manifest=pathlib.Path(args.manifest),
+                 concurrency=args.concurrency, max_tokens=450, restart=args.restart)
+    store.publish()  # FAISS: serving workers swap to the new generation
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,30 @@
+# tests/conftest.py
+# app modules read their settings at import: small stores, no network
+import os, sys, pathlib
+from functools import lru_cache
+import pytest
+
+os.environ.setdefault("EMBED_DIMS", "32")
+os.environ.setdefault("FAISS_PQ_M", "8")
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+os.environ.setdefault("WARMUP", "0")
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+@lru_cache(maxsize=None)
+def _byte_encoder():
+    # byte-level BPE with no merges: tiktoken downloads its real encodings on first use
+    import tiktoken
+    pat = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+    return tiktoken.Encoding("offline-bytes", pat_str=pat, mergeable_ranks={bytes([b]): b for b in range(256)},
+                             special_tokens={"<|endoftext|>": 256})
+
+@pytest.fixture(autouse=True)
+def offline_encoder(monkeypatch):
+    # chunking and context packing get their tokenizer through get_encoder()
+    from app import chunking, context
+    enc = _byte_encoder()
+    monkeypatch.setattr(chunking, "get_encoder", lambda model="gpt-4o-mini": enc)
+    monkeypatch.setattr(context, "get_encoder", lambda model="gpt-4o-mini": enc)
+    chunking._token_lengths.cache_clear()
+    yield enc
+    chunking._token_lengths.cache_clear()
@@ -0,0 +1,29 @@
+# tests/test_api.py
+# Request validation: malformed input is a 400, never a 500 from deep in the stack.
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app, MAX_TOP_K
+
+client = TestClient(app)
+
+@pytest.mark.parametrize("top_k", ["x", None, 0, -1, MAX_TOP_K + 1, 10**9])
+def test_batch_rejects_bad_top_k(top_k):
+    r = client.post("/query/batch", json={"questions": ["what is dharma?"], "top_k": top_k, "generate": False})
+    assert r.status_code == 400 and "top_k" in r.json()["error"]
+
+@pytest.mark.parametrize("questions", ["abc", [None, 3], {"what is dharma?": 1}, 5, None, [], [""], ["ok", "  "], ["ok", 3]])
+def test_batch_rejects_bad_questions(questions):
+    r = client.post("/query/batch", json={"questions": questions, "generate": False})
+    assert r.status_code == 400 and "questions" in r.json()["error"]
+
+@pytest.mark.parametrize("path", ["/query", "/stream"])
+@pytest.mark.parametrize("body", [{"question": 5}, {"question": ["what is dharma?"]}, {"question": None},
+                                  ["what is dharma?"], "what is dharma?", 5,
+                                  {"question": "what is dharma?", "mode": 5}])
+def test_rejects_malformed_body(path, body):
+    r = client.post(path, json=body)
+    assert r.status_code == 400 and r.json()["error"]
+
+def test_batch_rejects_non_object_body():
+    r = client.post("/query/batch", json=[["what is dharma?"]])
+    assert r.status_code == 400 and r.json()["error"]
@@ -0,0 +1,103 @@
+# tests/test_cache.py
+# EmbeddingCache: question normalization, LRU bound and the shared SQLite table.
+# AnswerCache: similarity threshold, source-set match, TTL, LRU and store-version invalidation.
+import numpy as np
+from app import cache
+from app.cache import AnswerCache, EmbeddingCache, normalize_question
+
+def test_normalize_question():
+    assert normalize_question("  What is   KARMA?! ") == normalize_question("what is karma") == "what is karma"
+    assert normalize_question("धर्म क्या है?") == "धर्म क्या है"  # vowel signs are not punctuation
+    assert normalize_question("ﬁre") == "fire"  # NFKC
+
+def test_embedding_cache_hits_on_normalized_question():
+    c = EmbeddingCache("m")
+    assert c.get("What is karma?") is None
+    c.put("What is karma?", [1.0, 2.0])
+    assert c.get("what is karma") == [1.0, 2.0]
+    assert c.stats() == {"hits": 1, "disk_hits": 0, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+def test_embedding_cache_evicts_least_recently_used():
+    c = EmbeddingCache("m", size=2)
+    c.put("a", [1.0]); c.put("b", [2.0])
+    c.get("a")  # b is now the least recently used
+    c.put("c", [3.0])
+    assert c.get("b") is None and c.get("a") == [1.0] and c.get("c") == [3.0]
+
+def test_embedding_cache_shares_sqlite_table(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    EmbeddingCache("m", path=path).put_many(["q one", "q two"], [[0.5, 0.25], [1.0, -1.0]])
+    c = EmbeddingCache("m", path=path)  # another worker, or after a restart
+    assert c.get("Q one?") == [0.5, 0.25] and c.disk_hits == 1
+    assert c.get("q one") == [0.5, 0.25] and c.hits == 1  # now in the LRU
+    assert EmbeddingCache("other-model", path=path).get("q one") is None
+
+def test_embedding_cache_custom_key():
+    c = EmbeddingCache("m", key=lambda h: h)  # ingest: chunk-text hashes, not questions
+    c.put("ABC", [1.0])
+    assert c.get("abc") is None and c.get("ABC") == [1.0]
+
+def unit(seed, d=32):
+    v = np.random.default_rng(seed).standard_normal(d)
+    return v / np.linalg.norm(v)
+
+def near(v, cos, seed=99):
+    # a unit vector at cosine `cos` from unit vector v
+    r = np.random.default_rng(seed).standard_normal(len(v))
+    r -= (r @ v) * v
+    return cos * v + (1 - cos**2) ** 0.5 * r / np.linalg.norm(r)
+
+SOURCES = AnswerCache.source_key([{"source": "gita", "chunk": 3}, {"source": "gita", "chunk": 1}])
+
+def test_answer_cache_needs_similar_question_and_same_sources():
+    c = AnswerCache(size=4, threshold=0.9)
+    c.put(unit(0), SOURCES, "answer")
+    assert c.get(near(unit(0), 0.95), SOURCES) == "answer"
+    assert c.get(near(unit(0), 0.85), SOURCES) is None
+    swapped = AnswerCache.source_key([{"source": "gita", "chunk": 1}, {"source": "gita", "chunk": 3}])
+    assert swapped == SOURCES and c.get(unit(0), swapped) == "answer"  # order does not matter
+    other = AnswerCache.source_key([{"source": "gita", "chunk": 1}, {"source": "gita", "chunk": 4}])
+    assert c.get(unit(0), other) is None
+    assert (c.hits, c.misses) == (2, 2)
+
+def test_answer_cache_skips_closer_question_with_other_sources():
+    c = AnswerCache(size=4, threshold=0.9)
+    other = AnswerCache.source_key([{"source": "rig", "chunk": 0}])
+    c.put(near(unit(0), 0.99), other, "other sources")
+    c.put(near(unit(0), 0.93, seed=5), SOURCES, "match")
+    assert c.get(unit(0), SOURCES) == "match"
+
+def test_answer_cache_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    c = AnswerCache(size=2, ttl=60)
+    c.put(unit(0), SOURCES, "answer")
+    now[0] += 59
+    assert c.get(unit(0), SOURCES) == "answer"
+    now[0] += 2
+    assert c.get(unit(0), SOURCES) is None
+
+def test_answer_cache_evicts_least_recently_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    c = AnswerCache(size=2)
+    for i in range(2):
+        now[0] += 1
+        c.put(unit(i), SOURCES, f"a{i}")
+    now[0] += 1
+    assert c.get(unit(0), SOURCES) == "a0"  # a1 is now the least recently used
+    now[0] += 1
+    c.put(unit(2), SOURCES, "a2")
+    assert [c.get(unit(i), SOURCES) for i in range(3)] == ["a0", None, "a2"]
+
+def test_answer_cache_dropped_on_store_version_change():
+    c = AnswerCache(size=4)
+    c.put(unit(0), SOURCES, "answer", version=(10, 1))
+    assert c.get(unit(0), SOURCES, version=(10, 1)) == "answer"
+    assert c.get(unit(0), SOURCES, version=(10, 2)) is None  # a chunk was replaced in place
+    assert c.get(unit(0), SOURCES, version=(10, 1)) is None and c.stats()["entries"] == 0
+
+def test_answer_cache_disabled():
+    c = AnswerCache(size=0)
+    c.put(unit(0), SOURCES, "answer")
+    assert c.get(unit(0), SOURCES) is None and c.stats()["entries"] == 0
@@ -0,0 +1,71 @@
+# tests/test_concurrency.py
+# SingleFlight: identical concurrent calls share one run, and a caller going away does not
+# cancel the work the others wait on.
+import asyncio
+import pytest
+from app.concurrency import SingleFlight
+
+def test_identical_calls_share_one_run():
+    async def main():
+        sf, calls = SingleFlight(), []
+
+        async def work(key):
+            calls.append(key)
+            await asyncio.sleep(0.05)
+            return f"result {key}"
+
+        results = await asyncio.gather(*(sf.do(k, lambda k=k: work(k)) for k in ["a", "a", "a", "b"]))
+        return sf, calls, results
+
+    sf, calls, results = asyncio.run(main())
+    assert results == ["result a"] * 3 + ["result b"]
+    assert sorted(calls) == ["a", "b"]
+    assert sf.stats() == {"started": 2, "coalesced": 2, "in_flight": 0}
+
+def test_later_call_runs_again():
+    async def main():
+        sf, calls = SingleFlight(), []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        return [await sf.do("k", work), await sf.do("k", work)]
+
+    assert asyncio.run(main()) == [1, 2]  # nothing is cached once the first run finished
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    async def main():
+        sf, started = SingleFlight(), asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(sf.do("k", work))
+        await started.wait()
+        second = asyncio.create_task(sf.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()  # e.g. its client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, sf.stats()
+
+    result, stats = asyncio.run(main())
+    assert result == "done" and stats["started"] == 1 and stats["coalesced"] == 1
+
+def test_error_reaches_every_caller():
+    async def main():
+        sf = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(sf.do("k", work), sf.do("k", work), return_exceptions=True)
+        return sf, results
+
+    sf, results = asyncio.run(main())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert sf.stats() == {"started": 1, "coalesced": 1, "in_flight": 0}
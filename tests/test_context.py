@@ -0,0 +1,59 @@
+# tests/test_context.py
+# Context packing: repeated, overlapping and adjacent chunks merged into excerpts, packed
+# best first into the token budget and written in source order.
+import pytest
+from app import context
+from app.context import merge, pack
+
+TEXT = "".join(f"verse {i:02d} on dharma. " for i in range(40))  # 20 chars a verse
+
+def hit(source, chunk, start, end, text=None, offsets=True):
+    meta = {"start": start, "end": end} if offsets else {}
+    return {"id": f"{source}:{chunk}", "source": source, "chunk": chunk, "text": TEXT[start:end] if text is None else text, "meta": meta}
+
+def test_merge_joins_overlapping_and_adjacent_chunks():
+    hits = [hit("gita", 2, 100, 200), hit("rig", 0, 0, 60), hit("gita", 1, 40, 120),   # overlaps chunk 2
+            hit("gita", 3, 200, 260), hit("gita", 2, 100, 200), hit("gita", 9, 400, 440)]  # adjacent, repeat, gap
+    out = merge(hits)
+    assert [(e["source"], e["chunks"], e["rank"]) for e in out] == [("gita", [1, 2, 3], 0), ("rig", [0], 1), ("gita", [9], 5)]
+    assert out[0]["text"] == TEXT[40:260] and (out[0]["start"], out[0]["end"]) == (40, 260)
+
+def test_merge_without_offsets_uses_chunk_numbers_and_text_overlap():
+    hits = [hit("gita", 4, 0, 0, text=TEXT[80:200], offsets=False), hit("gita", 3, 0, 0, text=TEXT[0:100], offsets=False),
+            hit("gita", 5, 0, 0, text="no overlap with the previous chunk", offsets=False),
+            hit("gita", 7, 0, 0, text="not consecutive", offsets=False)]
+    out = merge(hits)
+    assert [e["chunks"] for e in out] == [[3, 4, 5], [7]]
+    assert out[0]["text"] == TEXT[0:200] + "\nno overlap with the previous chunk"
+
+def tokens(offline_encoder, s):
+    return len(offline_encoder.encode_ordinary(s))
+
+def test_pack_fits_the_budget_and_cuts_the_last_excerpt(offline_encoder, monkeypatch):
+    monkeypatch.setattr(context, "CONTEXT_MIN_TOKENS", 16)
+    hits = [hit("rig", 0, 300, 600), hit("gita", 0, 0, 300)]
+    text, stats = pack(hits, budget=450)
+    first, second = text.split("\n")  # source order, not rank order
+    assert first.startswith("- (gita#0) ") and TEXT[0:300].startswith(first[len("- (gita#0) "):])  # cut
+    assert second == "- (rig#0) " + TEXT[300:600]
+    assert stats["tokens"] == tokens(offline_encoder, text) == 450 and stats["excerpts"] == 2
+
+def test_pack_skips_excerpt_that_would_be_cut_too_short(offline_encoder, monkeypatch):
+    monkeypatch.setattr(context, "CONTEXT_MIN_TOKENS", 64)
+    hits = [hit("gita", 0, 0, 300), hit("rig", 0, 300, 600), hit("veda", 0, 600, 620)]
+    text, stats = pack(hits, budget=360)
+    assert [l.split(")")[0] for l in text.split("\n")] == ["- (gita#0", "- (veda#0"]  # rig had 48 tokens of room
+    assert stats["tokens"] == tokens(offline_encoder, text) <= 360
+
+def test_pack_counts_tokens_saved_by_merging(offline_encoder):
+    hits = [hit("gita", 1, 80, 200), hit("gita", 0, 0, 120), hit("gita", 1, 80, 200)]
+    text, stats = pack(hits, budget=10_000)
+    assert text == "- (gita#0-1) " + TEXT[0:200]
+    full = sum(tokens(offline_encoder, f"- (gita#{h['chunk']}) {h['text']}") for h in hits) + 2
+    assert stats == {"hits": 3, "excerpts": 1, "tokens": tokens(offline_encoder, text), "saved": full - stats["tokens"]}
+    assert stats["saved"] > 0
+
+@pytest.mark.parametrize("budget", [0, 10])
+def test_pack_with_no_room(budget):
+    text, stats = pack([hit("gita", 0, 0, 300)], budget=budget)
+    assert text == "" and stats["excerpts"] == 0
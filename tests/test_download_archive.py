@@ -0,0 +1,135 @@
+# tests/test_download_archive.py
+# The archive.org downloader against a local HTTP stand-in for /download and stubbed
+# search_items/get_item: format preference, .part resume, md5 retries, manifest skips.
+import hashlib, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+BODY = bytes(range(256)) * 64
+
+class Archive:
+    """/<identifier>/<name> -> bytes; honours Range unless ignore_range, logs every request."""
+
+    def __init__(self):
+        self.files, self.requests = {}, []
+        self.ignore_range = False
+        self.corrupt = 0  # the next this many responses have their first byte flipped
+
+    def handler(self):
+        archive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                rng = self.headers.get("Range")
+                archive.requests.append((self.path, rng))
+                body = archive.files.get(self.path)
+                if body is None:
+                    self.send_response(404); self.end_headers(); return
+                if archive.corrupt:
+                    archive.corrupt -= 1
+                    body = bytes([body[0] ^ 1]) + body[1:]
+                start = int(rng[len("bytes="):-1]) if rng and not archive.ignore_range else 0
+                if start >= len(body) and rng:
+                    self.send_response(416); self.send_header("Content-Length", "0"); self.end_headers(); return
+                self.send_response(206 if start else 200)
+                self.send_header("Content-Length", str(len(body) - start))
+                self.end_headers()
+                self.wfile.write(body[start:])
+        return Handler
+
+@pytest.fixture
+def archive():
+    a = Archive()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), a.handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    a.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield a
+    server.shutdown()
+
+@pytest.fixture
+def da(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the module makes data/ in the working directory at import
+    from ingest import download_archive
+    monkeypatch.setattr(download_archive.time, "sleep", lambda s: None)
+    return download_archive
+
+def md5(b: bytes) -> str:
+    return hashlib.md5(b).hexdigest()
+
+def test_choose_files_takes_first_preferred_format(da):
+    files = [{"name": "x_meta.xml", "source": "metadata"}, {"name": "x.pdf", "source": "original"},
+             {"name": "x_djvu.TXT", "source": "derivative"}, {"name": "x_vol2.pdf", "source": "original"}]
+    assert [f["name"] for f in da.choose_files(files, [".txt", ".pdf"])] == ["x_djvu.TXT"]
+    assert [f["name"] for f in da.choose_files(files, [".epub", ".pdf"])] == ["x.pdf", "x_vol2.pdf"]
+    assert da.choose_files(files, [".xml"]) == []  # only archive.org's own metadata file
+
+@pytest.mark.parametrize("ignore_range", [False, True])
+def test_part_file_is_resumed(da, archive, tmp_path, ignore_range):
+    archive.files["/item/book.txt"] = BODY
+    archive.ignore_range = ignore_range  # a server that answers 200 with the whole file
+    out = tmp_path / "item"
+    out.mkdir()
+    (out / "book.txt.part").write_bytes(BODY[:1000])
+    info = da.download_file(da._session(1), "item", {"name": "book.txt", "md5": md5(BODY)}, out, archive.url)
+    assert info == {"name": "book.txt", "size": len(BODY), "md5": md5(BODY)}
+    assert (out / "book.txt").read_bytes() == BODY and not (out / "book.txt.part").exists()
+    assert archive.requests == [("/item/book.txt", "bytes=1000-")]
+
+def test_complete_part_file_answered_416(da, archive, tmp_path):
+    archive.files["/item/book.txt"] = BODY
+    out = tmp_path / "item"
+    out.mkdir()
+    (out / "book.txt.part").write_bytes(BODY)
+    info = da.download_file(da._session(1), "item", {"name": "book.txt", "md5": md5(BODY)}, out, archive.url)
+    assert info["md5"] == md5(BODY) and (out / "book.txt").read_bytes() == BODY
+    assert archive.requests == [("/item/book.txt", f"bytes={len(BODY)}-")]
+
+def test_md5_mismatch_is_retried_from_scratch(da, archive, tmp_path):
+    archive.files["/item/book.txt"] = BODY
+    archive.corrupt = 2
+    info = da.download_file(da._session(1), "item", {"name": "book.txt", "md5": md5(BODY)}, tmp_path / "item", archive.url)
+    assert info["md5"] == md5(BODY) and (tmp_path / "item" / "book.txt").read_bytes() == BODY
+    assert archive.requests == [("/item/book.txt", None)] * 3  # the bad .part is dropped, not resumed
+
+def test_md5_mismatch_gives_up_after_retries(da, archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(da, "MAX_RETRIES", 1)
+    archive.files["/item/book.txt"] = BODY
+    archive.corrupt = 10
+    with pytest.raises(IOError, match="md5 mismatch"):
+        da.download_file(da._session(1), "item", {"name": "book.txt", "md5": md5(BODY)}, tmp_path / "item", archive.url)
+    assert len(archive.requests) == 2 and not (tmp_path / "item" / "book.txt").exists()
+
+class Item:
+    def __init__(self, files):
+        self.files = files
+
+def test_manifest_skips_completed_files_and_items(da, archive, tmp_path, monkeypatch):
+    items = {"a": [{"name": "a.txt", "md5": md5(BODY)}, {"name": "a.pdf", "md5": md5(BODY)}],
+             "b": [{"name": "b.pdf", "md5": md5(BODY[:100])}]}
+    archive.files.update({"/a/a.txt": BODY, "/a/a.pdf": BODY, "/b/b.pdf": BODY[:100]})
+    monkeypatch.setattr(da, "search_items", lambda q: [{"identifier": "a"}, {"identifier": "b"}, {"identifier": "a"}])
+    monkeypatch.setattr(da, "get_item", lambda identifier: Item(items[identifier]))
+    data, manifest = tmp_path / "data", tmp_path / "manifest.sqlite"
+
+    def run(**kw):
+        return da.run(["q"], data, manifest=manifest, formats=[".txt", ".pdf"], workers=2, base_url=archive.url, **kw)
+
+    stats = run()
+    assert (stats["items"], stats["files"], stats["failed"]) == (2, 2, 0)
+    assert sorted(p for p, _ in archive.requests) == ["/a/a.txt", "/b/b.pdf"]
+    assert (data / "a" / "a.txt").read_bytes() == BODY and not (data / "a" / "a.pdf").exists()
+
+    archive.requests.clear()
+    stats = run()
+    assert (stats["items"], stats["items_skipped"], stats["files"]) == (0, 2, 0) and archive.requests == []
+
+    stats = run(refresh=True)  # items re-planned, but every file is verified already
+    assert (stats["items"], stats["files"], stats["files_skipped"]) == (2, 0, 2) and archive.requests == []
+
+    (data / "b" / "b.pdf").write_bytes(b"truncated")  # size no longer matches the manifest
+    stats = run(refresh=True)
+    assert (stats["files"], stats["files_skipped"]) == (1, 1) and archive.requests == [("/b/b.pdf", None)]
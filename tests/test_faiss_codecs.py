@@ -0,0 +1,35 @@
+# tests/test_faiss_codecs.py
+# Every index type / codec combination must search with tombstones and wide filters,
+# the paths that pass an ID selector to faiss (or post-filter, for IndexPQ).
+import numpy as np
+import pytest
+from app.vector_store import FaissStore
+
+N, D = 2000, 32
+COMBOS = [("flat", "flat"), ("flat", "fp16"), ("flat", "sq8"), ("flat", "pq"), ("ivf", "flat"), ("ivf", "sq8"),
+          ("ivfpq", "flat"), ("hnsw", "flat"), ("hnsw", "sq8"), ("hnsw", "pq")]
+
+def vectors(n=N, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, D)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+@pytest.mark.parametrize("kind,codec", COMBOS, ids=["+".join(c) for c in COMBOS])
+def test_search_with_tombstones_and_filters(tmp_path, kind, codec):
+    x = vectors()
+    s = FaissStore(tmp_path / "store", index_type=kind, codec=codec, nlist=16, train_size=N)
+    s.upsert([f"c{i}" for i in range(N)], [f"text {i}" for i in range(N)],
+             [{"language": "hi" if i % 2 else "en", "identifier": f"doc{i % 10}", "chunk": i} for i in range(N)], x)
+    s.commit()
+    assert s.index.is_trained
+    s.filter_exact = 0  # filters go through the index, not the exact path
+
+    s.delete(["c0", "c1"])
+    s.upsert(["c5"], ["new text"], [{"language": "hi", "identifier": "doc5", "chunk": 5}], x[5:6])
+    s.commit()
+    for q in (0, 1):
+        hits = s.search(x[q], 6)
+        assert len(hits) == 6 and not {"c0", "c1"} & {h["id"] for h in hits}
+    assert [h["text"] for h in s.search(x[5], 6) if h["id"] == "c5"] == ["new text"]
+
+    rows = s.search(x[:3], 6, filter={"language": "hi"})
+    assert all(len(r) == 6 and all(h["meta"]["language"] == "hi" and h["id"] != "c1" for h in r) for r in rows)
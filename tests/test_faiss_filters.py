@@ -0,0 +1,43 @@
+# tests/test_faiss_filters.py
+# Filters match rows through the meta columns written at commit; a serving view must not
+# decode every payload record on its first filtered query.
+import numpy as np
+from app.payload_store import PayloadStore
+from app.vector_store import FaissStore, stage_generation, SharedFaissStore
+
+def fill(store, n, start=0):
+    x = np.random.default_rng(start).standard_normal((n, 32)).astype("float32")
+    store.upsert([f"c{i}" for i in range(start, start + n)], [f"text {i}" for i in range(start, start + n)],
+                 [{"language": ["hi", "en", "sa"][i % 3], "identifier": f"doc{i % 7}", "chunk": i} for i in range(start, start + n)], x)
+    return x
+
+def test_filtered_search_reads_only_hits(tmp_path, monkeypatch):
+    root = tmp_path / "faiss_index"
+    writer = FaissStore(stage_generation(root))
+    x = fill(writer, 500)
+    writer.delete(["c1"])
+    writer.publish()
+    fill(writer, 10, start=500)  # a later commit the published generation must not see
+    writer.commit()
+
+    served = SharedFaissStore(root).store
+    decoded = []
+    get = PayloadStore.__getitem__
+    monkeypatch.setattr(PayloadStore, "__getitem__", lambda self, i: decoded.append(i) or get(self, i))
+    for exact in (10**9, 0):  # exact path and faiss selector path
+        served.filter_exact = exact
+        served._filters_version = None
+        hits = served.search(x[1], 6, filter={"language": "en", "identifier": ["doc1", "doc4"]})
+        assert hits and all(h["meta"]["language"] == "en" and h["meta"]["identifier"] in ("doc1", "doc4") for h in hits)
+        assert "c1" not in {h["id"] for h in hits} and all(int(h["id"][1:]) < 500 for h in hits)
+    assert len(decoded) <= 12
+
+def test_columns_added_to_older_store(tmp_path):
+    store = FaissStore(tmp_path / "s")
+    fill(store, 100)
+    store.commit()
+    for f in tmp_path.glob("s/meta-*"):
+        f.unlink()
+    reopened = FaissStore(tmp_path / "s")  # writable: rebuilds the columns
+    assert len(reopened.meta_columns["language"]) == 100
+    assert len(reopened.search(np.ones(32, dtype="float32"), 5, filter={"language": "sa"})) == 5
@@ -0,0 +1,122 @@
+# tests/test_faiss_generations.py
+# Published FAISS generations: an ingest that stops before publish() must not lose what its
+# manifest recorded, and a store from before generations must still be served.
+import pytest
+from app.vector_store import FaissStore, SharedFaissStore, stage_generation
+from bench.corpus import synthetic_documents, write_documents
+from bench.fake_openai import serve
+from ingest import pipeline
+
+@pytest.fixture(scope="module")
+def fake_openai():
+    server, url, _ = serve(dims=32)
+    yield url
+    server.shutdown()
+
+@pytest.fixture(autouse=True)
+def openai_env(monkeypatch, fake_openai):
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_openai)
+    monkeypatch.setattr(pipeline, "CHECKPOINT_EVERY", 1)
+
+class Crash(Exception):
+    pass
+
+def ingest(root, data, manifest, publish=True, crash_after=None):
+    store = FaissStore(stage_generation(root))
+    if crash_after is not None:
+        upsert, calls = store.upsert, []
+        def failing(*a):
+            if len(calls) == crash_after:
+                raise Crash()
+            calls.append(1)
+            upsert(*a)
+        store.upsert = failing
+    pipeline.run(data, store, manifest=manifest, concurrency=2, batch_size=2)
+    if publish:
+        store.publish()
+
+def served_sources(root):
+    s = SharedFaissStore(root).store
+    return s.size(), {s.payloads[r]["meta"]["identifier"] for r in range(len(s.payloads)) if r not in s.deleted}
+
+@pytest.mark.parametrize("crash", ["before_publish", "mid_run"])
+def test_interrupted_ingest_is_resumed(tmp_path, crash):
+    docs = synthetic_documents(16, chunks_per_doc=4)
+    data, root, manifest = tmp_path / "processed_clean", tmp_path / "faiss_index", tmp_path / "manifest.sqlite"
+    write_documents(docs[:2], data)
+    ingest(root, data, manifest)
+    write_documents(docs[2:], data)
+    if crash == "before_publish":
+        ingest(root, data, manifest, publish=False)
+    else:
+        with pytest.raises(Crash):
+            ingest(root, data, manifest, crash_after=3)
+    ingest(root, data, manifest)
+
+    write_documents(docs, tmp_path / "all")
+    ingest(tmp_path / "reference", tmp_path / "all", tmp_path / "reference.sqlite")
+    size, sources = served_sources(root)
+    assert sources == {d["meta"]["identifier"] for d in docs}
+    assert size == served_sources(tmp_path / "reference")[0]
+
+def test_legacy_store_is_served(tmp_path):
+    # the layout before checkpoints and generations: index.bin + payload.jsonl only
+    import json, faiss, numpy as np
+    x = np.random.default_rng(0).standard_normal((50, 32)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    root = tmp_path / "faiss_index"
+    root.mkdir()
+    index = faiss.IndexFlatIP(32)
+    index.add(x)
+    faiss.write_index(index, str(root / "index.bin"))
+    with (root / "payload.jsonl").open("w") as f:
+        for i in range(50):
+            f.write(json.dumps({"id": f"c{i}", "text": f"verse {i} on dharma", "meta": {"identifier": "gita", "chunk": i}}) + "\n")
+
+    served = SharedFaissStore(root)
+    assert served.size() == 50
+    assert served.search(x[7], 1)[0]["id"] == "c7"
+    assert served.lexical_search("dharma", 3)
+    assert SharedFaissStore(root).generation == served.generation  # migrated once
+    assert (root / "payload.jsonl").exists()
+
+def test_generation_without_lexical_index_serves_vector_search(tmp_path, monkeypatch):
+    import numpy as np
+    from app import rag, vector_store
+    x = np.random.default_rng(0).standard_normal((100, 32)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    root = tmp_path / "faiss_index"
+    monkeypatch.setattr(vector_store, "LEXICAL_INDEX", False)  # ingested with LEXICAL_INDEX=0
+    store = FaissStore(stage_generation(root))
+    store.upsert([f"c{i}" for i in range(100)], [f"verse {i} on dharma" for i in range(100)],
+                 [{"identifier": "gita", "chunk": i} for i in range(100)], x)
+    store.commit()
+    store.publish()
+
+    monkeypatch.setattr(vector_store, "LEXICAL_INDEX", True)  # served with the default
+    served = SharedFaissStore(root)
+    assert served.lexical is None
+    assert served.search(x[7], 1)[0]["id"] == "c7"
+    monkeypatch.setattr(vector_store, "VECTOR_DB", "faiss")
+    monkeypatch.setitem(rag._lazy, "store", served)
+    assert rag.resolve_mode("what is dharma", "hybrid") == "vector"
+    assert rag.resolve_mode("gita 2.47", "auto") == "vector"
+
+def test_failed_reload_is_logged_and_old_generation_kept(tmp_path, caplog):
+    import numpy as np
+    from app.vector_store import publish_generation
+    root = tmp_path / "faiss_index"
+    store = FaissStore(stage_generation(root))
+    store.upsert(["a"], ["verse on dharma"], [{"identifier": "gita", "chunk": 0}], np.ones((1, 32), dtype="float32"))
+    store.commit()
+    store.publish()
+    served = SharedFaissStore(root)
+    broken = root / "gen-000002"
+    broken.mkdir()
+    (broken / "index.bin").write_bytes(b"not an index")
+    publish_generation(broken)
+
+    served._lock.acquire()
+    served._reload()
+    assert served.generation.name == "gen-000001" and served.size() == 1
+    assert "FAISS generation reload failed" in caplog.text and "Traceback" in caplog.text
@@ -0,0 +1,40 @@
+# tests/test_lexical.py
+import multiprocessing
+import numpy as np
+import pytest
+from app import vector_store
+from app.rag import resolve_mode
+from app.vector_store import ChromaStore
+
+@pytest.mark.parametrize("mode,q,expected", [("lexical", "what is dharma", "lexical"), ("hybrid", "what is dharma", "hybrid"),
+                                             ("auto", "gita 2.47", "lexical"), ("auto", "what is dharma", "hybrid")])
+def test_modes_fall_back_to_vector_without_lexical_index(monkeypatch, mode, q, expected):
+    assert resolve_mode(q, mode) == expected
+    monkeypatch.setattr(vector_store, "VECTOR_DB", "qdrant")
+    assert resolve_mode(q, mode) == "vector"
+
+def _open_and_search(path, out):
+    store = ChromaStore(path, read_only=True)
+    out.put((store.lexical.live(), len(store.lexical_search("dharma", 5))))
+
+def test_serving_workers_build_missing_lexical_index_once(tmp_path, monkeypatch):
+    # a Chroma store written without the lexical index, then opened by several workers at once
+    monkeypatch.setattr(vector_store, "LEXICAL_INDEX", False)
+    store = ChromaStore(tmp_path)
+    n = 300
+    x = np.random.default_rng(0).standard_normal((n, 32)).astype("float32")
+    store.upsert([f"c{i}" for i in range(n)], [f"verse {i} on dharma and karma" for i in range(n)],
+                 [{"identifier": "gita", "chunk": i} for i in range(n)], x)
+    store.commit()
+    del store
+
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    workers = [ctx.Process(target=_open_and_search, args=(tmp_path, out)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    results = [out.get(timeout=120) for _ in workers]
+    for w in workers:
+        w.join()
+    assert results == [(n, 5)] * 4
+    assert len(list((tmp_path / "lexical").glob("seg-*"))) >= 1
@@ -0,0 +1,72 @@
+# tests/test_manifest.py
+# Incremental re-ingest: the manifest skips unchanged documents, keeps unchanged chunks,
+# reuses the embedding of a chunk whose text was embedded before, and deletes what is gone.
+import json
+import pytest
+from app.vector_store import FaissStore
+from bench.corpus import synthetic_documents, write_documents
+from bench.fake_openai import serve
+from ingest import pipeline
+from ingest.manifest import Manifest
+
+@pytest.fixture
+def fake(monkeypatch):
+    server, url, fake = serve(dims=32)
+    monkeypatch.setenv("OPENAI_BASE_URL", url)
+    yield fake
+    server.shutdown()
+
+def test_manifest_tracks_docs_and_chunks(tmp_path):
+    m = Manifest(tmp_path / "m.sqlite", {"model": "a"})
+    m.add_chunks("doc.json", [("doc:0", "h0"), ("doc:1", "h1"), ("doc:2", "h2")])
+    assert not m.is_current("doc.json", "d1")  # chunks written, document not finished
+    assert m.finish_doc("doc.json", "d1", ["doc:0", "doc:1"]) == ["doc:2"]
+    m.commit()
+    assert m.is_current("doc.json", "d1") and not m.is_current("doc.json", "d2")
+    assert m.chunk_hashes("doc.json") == {"doc:0": "h0", "doc:1": "h1"}
+
+    m = Manifest(tmp_path / "m.sqlite", {"model": "a"})
+    assert m.is_current("doc.json", "d1") and m.doc_names() == ["doc.json"]
+    m = Manifest(tmp_path / "m.sqlite", {"model": "b"})  # new signature: everything is re-chunked
+    assert not m.is_current("doc.json", "d1") and m.chunk_hashes("doc.json")
+    assert sorted(m.remove_doc("doc.json")) == ["doc:0", "doc:1"] and m.doc_names() == []
+
+def test_reingest_reuses_what_it_can(tmp_path, fake):
+    docs = synthetic_documents(12, chunks_per_doc=4)
+    data, store_dir, manifest = tmp_path / "data", tmp_path / "store", tmp_path / "manifest.sqlite"
+    write_documents(docs, data)
+
+    def ingest():
+        store = FaissStore(store_dir)
+        before = fake.requests
+        stats = pipeline.run(data, store, manifest=manifest, concurrency=2, batch_size=4)
+        return stats, fake.requests - before, store
+
+    stats, requests, store = ingest()
+    assert stats["docs_changed"] == 3 and stats["chunks_embedded"] == store.size() and requests > 0
+    per_doc = {}
+    for r in range(len(store.payloads)):
+        name = store.payloads[r]["meta"]["identifier"]
+        per_doc[name] = per_doc.get(name, 0) + 1
+
+    stats, requests, _ = ingest()
+    assert (stats["docs_skipped"], stats["docs_changed"], requests) == (3, 0, 0)
+
+    first, second, third = (data / f"{d['meta']['identifier']}.json" for d in docs)
+    doc = json.loads(first.read_text(encoding="utf-8"))
+    doc["content"] += "\nA verse added at the end."  # only the last chunk changes
+    first.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+    doc = json.loads(second.read_text(encoding="utf-8"))
+    doc["meta"]["title"] = "Retitled"  # every chunk changes, none of the texts does
+    second.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+    stats, requests, store = ingest()
+    assert stats["docs_changed"] == 2 and stats["docs_skipped"] == 1
+    assert stats["chunks_reused"] == per_doc[second.stem]                  # the retitled document
+    assert 1 <= stats["chunks_embedded"] <= 2 and requests == 1             # the tail of the first one
+    assert stats["chunks_kept"] + stats["chunks_embedded"] >= per_doc[first.stem]
+    assert stats["chunks_kept"] >= per_doc[first.stem] - 2
+
+    third.unlink()
+    stats, requests, store = ingest()
+    assert stats["docs_removed"] == 1 and stats["chunks_deleted"] == per_doc[third.stem] and requests == 0
+    assert third.stem not in {store.payloads[r]["meta"]["identifier"] for r in range(len(store.payloads)) if r not in store.deleted}
@@ -0,0 +1,81 @@
+# tests/test_metrics.py
+# Prometheus text rendering, per-request stage timings, token usage and the sampling profiler.
+import threading, time
+import pytest
+from fastapi.testclient import TestClient
+from app import metrics
+
+@pytest.fixture
+def registry(monkeypatch):
+    # metrics made by a test are dropped from the process-wide registry afterwards
+    monkeypatch.setattr(metrics, "_registry", [])
+    return metrics._registry
+
+def test_counter_renders_labels_escaped(registry):
+    c = metrics.Counter("t_total", "Things", ("kind",))
+    c.inc(2, 'a "quoted"\nvalue')
+    c.inc(1, "b"); c.inc(0.5, "b")
+    assert metrics.render() == ('# HELP t_total Things\n# TYPE t_total counter\n'
+                                't_total{kind="a \\"quoted\\"\\nvalue"} 2.0\nt_total{kind="b"} 1.5\n')
+
+def test_histogram_buckets_are_cumulative(registry):
+    h = metrics.Histogram("t_seconds", "Latency", ("route",), buckets=(0.1, 1))
+    for v in (0.05, 0.1, 0.5, 3):
+        h.observe(v, "/q")
+    assert h.samples() == ['t_seconds_bucket{route="/q",le="0.1"} 2', 't_seconds_bucket{route="/q",le="1"} 3',
+                           't_seconds_bucket{route="/q",le="+Inf"} 4', 't_seconds_sum{route="/q"} 3.65',
+                           't_seconds_count{route="/q"} 4']
+
+def test_callback_reads_at_scrape_time(registry):
+    value = {"n": 1}
+    g = metrics.Callback("t_gauge", "Gauge", lambda: value["n"])
+    labelled = metrics.Callback("t_hits_total", "Hits", lambda: {("embedding",): 3}, labels=("cache",), type="counter")
+    broken = metrics.Callback("t_broken", "Store unreachable", lambda: 1 / 0)
+    value["n"] = 7
+    assert g.samples() == ["t_gauge 7.0"] and labelled.samples() == ['t_hits_total{cache="embedding"} 3.0']
+    assert broken.samples() == [] and "# TYPE t_hits_total counter" in metrics.render()
+
+def test_stages_are_timed_per_request():
+    timings = metrics.start_request()
+    with metrics.stage("embed"):
+        time.sleep(0.01)
+    metrics.observe_stage("embed", 0.5)
+    metrics.observe_stage("llm", 0.25)
+    assert set(timings) == {"embed", "llm"} and timings["embed"] >= 0.51
+    assert metrics.server_timing({"llm": 0.25, "total": 1.0}) == "llm;dur=250.0, total;dur=1000.0"
+
+def test_record_usage():
+    before = dict(metrics.TOKENS._values)
+    metrics.record_usage({"prompt_tokens": 100, "completion_tokens": 20, "prompt_tokens_details": {"cached_tokens": 64}})
+    metrics.record_usage(None)
+    delta = {k[0]: v - before.get(k, 0.0) for k, v in metrics.TOKENS._values.items()}
+    assert (delta["prompt"], delta["completion"], delta["cached_prompt"]) == (100, 20, 64)
+
+def test_metrics_endpoint_and_timing_header(monkeypatch):
+    from app.main import app
+    monkeypatch.setattr(metrics, "TIMING_HEADERS", True)
+    client = TestClient(app)
+    assert "total;dur=" in client.get("/health").headers["Server-Timing"]
+    r = client.get("/metrics")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    assert 'gurumitra_request_seconds_count{route="/health",status="200"}' in r.text
+    assert "# TYPE gurumitra_cache_lookups_total counter" in r.text
+
+def test_profile_samples_other_threads():
+    stop = threading.Event()
+
+    def spin_for_profile():
+        while not stop.is_set():
+            sum(range(1000))
+
+    t = threading.Thread(target=spin_for_profile)
+    t.start()
+    try:
+        folded = metrics.profile(0.1, interval=0.001)
+        with metrics._profiling:  # one at a time
+            with pytest.raises(RuntimeError):
+                metrics.profile(0.01)
+    finally:
+        stop.set(); t.join()
+    line = next(l for l in folded.splitlines() if "spin_for_profile" in l)
+    assert int(line.rsplit(" ", 1)[1]) > 0
@@ -0,0 +1,64 @@
+# tests/test_normalize.py
+# Golden test: the single-pass and streamed normalizer must match the original per-character
+# implementation (kept in bench/normalize.py) byte for byte, wherever the input is split.
+import io, json, random
+import pytest
+from bench import normalize as ref
+from ingest import normalize_corpus as nc
+
+CASES = ["", "   ", "  plain  text  ", "a\n\n\n\nb", " \t\r\n ", "ﬁre ﬂow ﬃx “quoted” it’s",
+         "x•·◊ ■y", "x • y", "§ 12 ¥", "\x0c\x01junk\x7f", "pua\ue000\uf8ffgone", "astral\U000F0001\U0010FFFDgone",
+         "धर्मक्षेत्रे कुरुक्षेत्रे", "yogaḥ karmasu kauśalam", "😀 Σίσυφος é", "end with run  ■ \n"]
+
+def random_text(seed: int, n: int = 400) -> str:
+    rng = random.Random(seed)
+    return "".join(rng.choice(ref.PIECES) + rng.choice([" ", "", "\n", "  "]) for _ in range(n))
+
+@pytest.mark.parametrize("text", CASES + [random_text(s) for s in range(3)])
+def test_clean_text_matches_reference(text):
+    assert nc.clean_text(text) == ref.ref_clean_text(text)
+
+def stream_clean(pieces) -> str:
+    c = nc.StreamCleaner()
+    return "".join(c.feed(p) for p in pieces) + c.close()
+
+@pytest.mark.parametrize("text", CASES + ["  lead • and  trail ■  ", "a \t\n  ◊◊  b"])
+def test_stream_cleaner_matches_reference_at_every_split(text):
+    expected = ref.ref_clean_text(text)
+    for i in range(len(text) + 1):
+        for j in range(i, len(text) + 1):  # three pieces, so runs are split in two places too
+            assert stream_clean([text[:i], text[i:j], text[j:]]) == expected, (i, j)
+
+def test_stream_cleaner_matches_reference_in_small_pieces():
+    text = random_text(7, 2000)
+    for size in (1, 2, 3, 7, 64):
+        assert stream_clean(text[k:k + size] for k in range(0, len(text), size)) == ref.ref_clean_text(text)
+
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+def test_json_reader_pieces_at_every_read_size(monkeypatch, ensure_ascii):
+    # multi-byte UTF-8 characters and, with ensure_ascii, 😀 as the surrogate-pair escape
+    # \\ud83d\\ude00 land across read boundaries; neither may be cut
+    content = "a😀 b  é\"\\ \u0001धर्म  \n\n  ■■ " * 3
+    doc = {"meta": {"identifier": "x", "n": [1, 2.5]}, "content": content, "tail": 12345}
+    raw = json.dumps(doc, ensure_ascii=ensure_ascii)
+    for size in range(1, 40):
+        monkeypatch.setattr(nc, "STREAM_CHARS", size)
+        pieces = []
+        f = io.TextIOWrapper(io.BytesIO(raw.encode("utf-8")), encoding="utf-8")
+        rest = nc.iter_document(f, pieces.append)
+        assert "".join(pieces) == content and rest == {"meta": doc["meta"], "tail": 12345}, size
+        assert stream_clean(pieces) == ref.ref_clean_text(content)
+
+@pytest.mark.parametrize("keep_diacritics", [False, True])
+def test_process_file_is_byte_identical(tmp_path, monkeypatch, keep_diacritics):
+    src, out = tmp_path / "in", tmp_path / "out"
+    src.mkdir(); out.mkdir()
+    ref.synthetic_docs(src, 4, 0.02)
+    monkeypatch.setattr(nc, "STREAM_CHARS", 4093)  # small odd reads so escapes and runs straddle them
+    for p in sorted(src.glob("*.json")):
+        ref.ref_process_file(p, out / f"ref-{p.name}", keep_diacritics)
+        nc.process_file(p, out / f"new-{p.name}", keep_diacritics)
+        nc.process_file(p, out / f"stream-{p.name}", keep_diacritics, stream_mb=0)
+        expected = (out / f"ref-{p.name}").read_bytes()
+        assert (out / f"new-{p.name}").read_bytes() == expected
+        assert (out / f"stream-{p.name}").read_bytes() == expected
@@ -0,0 +1,39 @@
+# tests/test_store_version.py
+# version() keys the answer cache: it must change when a chunk is replaced in place, not
+# only when the number of chunks changes.
+import numpy as np
+import pytest
+from app import vector_store
+from app.vector_store import ChromaStore, FaissStore, QdrantStore
+
+def chroma(tmp_path):
+    return ChromaStore(tmp_path / "chromadb")
+
+def qdrant(tmp_path):
+    from qdrant_client import QdrantClient
+    return QdrantStore(client=QdrantClient(":memory:"), collection="test")
+
+def faiss(tmp_path):
+    return FaissStore(tmp_path / "faiss_index")
+
+@pytest.mark.parametrize("make", [chroma, qdrant, faiss])
+def test_replacement_changes_version(tmp_path, monkeypatch, make):
+    monkeypatch.setattr(vector_store, "STORE_VERSION_TTL", 3600.0)  # only our own writes refresh it
+    x = np.random.default_rng(0).standard_normal((2, 32)).astype("float32")
+    store = make(tmp_path)
+    store.upsert(["a", "b"], ["first", "second"], [{"identifier": "doc", "chunk": 0}, {"identifier": "doc", "chunk": 1}], x)
+    store.commit()
+    before = store.version()
+    assert store.size() == 2
+    store.upsert(["a"], ["first, revised"], [{"identifier": "doc", "chunk": 0}], x[:1])
+    store.commit()
+    assert store.size() == 2 and store.version() != before
+
+def test_qdrant_truncates_longer_embeddings():
+    # Matryoshka: the model returns more dims than EMBED_DIMS, the collection is sized to EMBED_DIMS
+    store = qdrant(None)
+    x = np.random.default_rng(0).standard_normal((20, vector_store.EMBED_DIMS + 16)).astype("float32")
+    store.upsert([f"c{i}" for i in range(20)], [f"verse {i}" for i in range(20)], [{"identifier": "doc", "chunk": i} for i in range(20)], x)
+    store.commit()
+    assert store.search(x[3], 1)[0]["id"] == "c3"
+    assert [h[0]["id"] for h in store.search(x[[5, 9]], 1)] == ["c5", "c9"]
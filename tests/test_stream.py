@@ -0,0 +1,62 @@
+# tests/test_stream.py
+# stream_answer holds an LLM slot while the upstream completion runs, not while the client reads.
+import asyncio
+import pytest
+from app import rag
+from bench.fake_openai import serve
+
+SNIPPETS = [{"text": "Perform your duty without attachment to its fruits.", "source": "gita", "chunk": 0}]
+
+@pytest.fixture
+def upstream(monkeypatch):
+    server, url, fake = serve(dims=32, completion_tokens=20)
+    monkeypatch.setattr(rag, "llm_limit", asyncio.Semaphore(1))
+    yield url, fake
+    server.shutdown()
+
+def _run(url, body):
+    async def main():
+        from openai import AsyncOpenAI
+        async with AsyncOpenAI(base_url=url, api_key="fake") as client:
+            rag._lazy["aclient"] = client
+            try:
+                return await body()
+            finally:
+                rag._lazy.pop("aclient", None)
+    return asyncio.run(main())
+
+async def _released(timeout=5.0) -> bool:
+    for _ in range(int(timeout / 0.01)):
+        if not rag.llm_limit.locked():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+def test_stalled_client_frees_the_llm_slot(upstream):
+    url, fake = upstream
+
+    async def body():
+        gen = rag.stream_answer("what is karma yoga?", SNIPPETS, use_cache=False)
+        first = await gen.__anext__()
+        assert first[0] == "delta" and rag.llm_limit.locked()
+        released = await _released()  # the client reads nothing more; the completion still ends upstream
+        rest = [item async for item in gen]
+        return released, [first, *rest]
+
+    released, items = _run(url, body)
+    assert released
+    deltas = [t for kind, t in items if kind == "delta"]
+    assert len(deltas) == fake.completion_tokens and items[-1][0] == "usage"
+    assert items[-1][1]["completion_tokens"] == fake.completion_tokens
+
+def test_closing_the_stream_frees_the_llm_slot(upstream):
+    url, fake = upstream
+    fake.token_ms = 200  # ~4s of completion left when the client goes away
+
+    async def body():
+        gen = rag.stream_answer("what is karma yoga?", SNIPPETS, use_cache=False)
+        await gen.__anext__()
+        await gen.aclose()
+        return await _released(timeout=1.0)
+
+    assert _run(url, body)